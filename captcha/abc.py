@@ -22,14 +22,31 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import asyncio
 from abc import ABC, ABCMeta, abstractmethod
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Literal, Optional
 
 import discord
 from redbot.core import Config, commands
 from redbot.core.bot import Red
 
+from .admission import AdmissionQueue
+from .cleanup import CleanupQueue
+from .executor import Backend, RenderExecutor
+from .massverify import MassVerifyJob
+from .metrics import CaptchaMetrics
+from .outbound import OutboundQueue
+from .pool import ChallengePool
+from .ratelimit import RateLimiter
+from .registry import ChallengeRegistry, ImageCache
+from .renderer import CaptchaRenderer, RenderProfile
+from .routing import AnswerRouter
+from .scheduler import DeadlineScheduler
+from .settings import GuildSettings, SettingsCache
+from .shedding import LoadShedder
+from .store import ChallengeStore, StoreBackend
+
 
 class MixinMeta(ABC):
     bot: Red
@@ -41,14 +58,30 @@ class MixinMeta(ABC):
         self.bot: Red
         self.config: Config
 
-        self._config: Dict[int, Dict[str, Any]]
+        self.guild_settings: SettingsCache
 
-        self._captchas: Dict[int, discord.Message]
-        self._verification_phase: Dict[int, int]
-        self._user_tries: Dict[int, List[discord.Message]]
+        self.challenges: ChallengeStore
+        self.registry: ChallengeRegistry
+        self.images: ImageCache
+        self._permitted: Dict[int, bool]
 
         self.data_path: Path
         self.font_data: str
+        self.captcha_renderer: CaptchaRenderer
+        self._pools: Dict[RenderProfile, ChallengePool]
+        self.executor: RenderExecutor
+        self.shedder: LoadShedder
+        self._surge_threshold: int
+        self.scheduler: DeadlineScheduler
+        self.router: AnswerRouter
+        self.metrics: CaptchaMetrics
+        self._mass_verify: Dict[int, MassVerifyJob]
+        self._join_flows: Dict[int, asyncio.Task]
+        self.user_limits: RateLimiter
+        self.guild_limits: RateLimiter
+        self.outbound: OutboundQueue
+        self.cleanup: CleanupQueue
+        self.admission: AdmissionQueue
 
     @abstractmethod
     def format_help_for_context(self, ctx: commands.Context) -> str:
@@ -62,6 +95,42 @@ class MixinMeta(ABC):
     async def _build_cache(self) -> None:
         raise NotImplementedError()
 
+    @abstractmethod
+    def set_render_backend(
+        self, backend: Backend, workers: Optional[int] = None, timeout: float = 2.5
+    ) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def set_challenge_store(self, backend: StoreBackend, url: Optional[str] = None) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def start_mass_verify(
+        self, guild: discord.Guild, rate: float = 2.0
+    ) -> Optional[MassVerifyJob]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def stop_mass_verify(self, guild_id: int) -> Optional[MassVerifyJob]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def metrics_path(self) -> Path:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def get_profile(self, guild: discord.Guild) -> RenderProfile:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def resize_pools(self, low: int, high: int) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def challenge_mode(self, settings: GuildSettings) -> Literal["image", "grid"]:
+        raise NotImplementedError()
+
 
 class CompositeMetaClass(commands.CogMeta, ABCMeta):
     pass
@@ -0,0 +1,147 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Set, Tuple, TypeAlias
+
+import discord
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.admission")
+
+Admission: TypeAlias = Tuple[discord.Member, discord.TextChannel, float]
+
+
+class AdmissionQueue:
+    """
+    Per-guild FIFO queues of joined members waiting for their captcha flow to start.
+
+    Every guild is drained by up to `guild_workers` workers, started when members are
+    queued and stopped once the queue is empty. At most `concurrency` flows run at once
+    across all guilds, and guilds with `max_depth` members waiting reject further joins.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[discord.Member, discord.TextChannel], Awaitable[None]],
+        guild_workers: int = 2,
+        concurrency: int = 8,
+        max_depth: int = 500,
+    ) -> None:
+        self._handler: Callable[[discord.Member, discord.TextChannel], Awaitable[None]] = handler
+        self._queues: Dict[int, Deque[Admission]] = {}
+        self._workers: Dict[int, Set[asyncio.Task]] = {}
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+        self.guild_workers: int = guild_workers
+        self.concurrency: int = concurrency
+        self.max_depth: int = max_depth
+        self.in_flight: int = 0
+        self.admitted: int = 0
+        self.rejected: int = 0
+        self.failed: int = 0
+        self.peak: int = 0
+        self.waited: float = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def depth(self, guild_id: int) -> int:
+        queue: Deque[Admission] = self._queues.get(guild_id, deque())
+        return len(queue)
+
+    def submit(self, member: discord.Member, channel: discord.TextChannel) -> bool:
+        queue: Deque[Admission] = self._queues.setdefault(member.guild.id, deque())
+        if len(queue) >= self.max_depth:
+            self.rejected += 1
+            return False
+        queue.append((member, channel, time.monotonic()))
+        self.peak = max(self.peak, len(queue))
+        self._spawn(member.guild.id)
+        return True
+
+    def _spawn(self, guild_id: int) -> None:
+        workers: Set[asyncio.Task] = self._workers.setdefault(guild_id, set())
+        if len(workers) < min(self.guild_workers, len(self._queues[guild_id])):
+            task: asyncio.Task = asyncio.create_task(self._work(guild_id))
+            workers.add(task)
+            task.add_done_callback(functools.partial(self._finished, guild_id))
+
+    def discard(self, guild_id: int, member_id: int) -> bool:
+        """Drop a member who left before their flow started."""
+        queue: Deque[Admission] = self._queues.get(guild_id, deque())
+        for entry in queue:
+            if entry[0].id == member_id:
+                queue.remove(entry)
+                return True
+        return False
+
+    def stop(self) -> None:
+        for workers in self._workers.values():
+            for task in list(workers):
+                task.cancel()
+        self._queues.clear()
+
+    async def _work(self, guild_id: int) -> None:
+        queue: Deque[Admission] = self._queues[guild_id]
+        while queue:
+            async with self._semaphore:
+                if not queue:
+                    break
+                member, channel, queued_at = queue.popleft()
+                self.waited += time.monotonic() - queued_at
+                self.admitted += 1
+                self.in_flight += 1
+                try:
+                    await self._handler(member, channel)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.failed += 1
+                    log.exception(f"Failed to start the captcha flow of {member.id}.")
+                finally:
+                    self.in_flight -= 1
+
+    def _finished(self, guild_id: int, task: asyncio.Task) -> None:
+        workers: Set[asyncio.Task] = self._workers.get(guild_id, set())
+        workers.discard(task)
+        if task.cancelled():
+            return
+        if self._queues.get(guild_id):
+            # Members queued while this worker was on its way out.
+            self._spawn(guild_id)
+        elif not workers:
+            self._queues.pop(guild_id, None)
+            self._workers.pop(guild_id, None)
+
+    def __str__(self) -> str:
+        average: float = self.waited / self.admitted if self.admitted else 0.0
+        return (
+            f"{len(self)} queued (peak {self.peak}), {self.in_flight}/{self.concurrency} "
+            f"starting, {self.admitted} admitted, {self.rejected} rejected, "
+            f"{self.failed} failed, {average:.1f}s average wait"
+        )
@@ -0,0 +1,179 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import random
+import string
+import threading
+from collections import OrderedDict
+from typing import Final, Iterable, Optional, Tuple, TypeAlias
+
+from PIL.Image import BILINEAR, QUAD, Image
+from PIL.Image import new as create
+from PIL.ImageDraw import Draw
+from PIL.ImageFont import FreeTypeFont
+
+from .objects import load_font
+
+DEFAULT_CHARSET: Final[str] = string.ascii_uppercase + " "
+DEFAULT_MAX_BYTES: Final[int] = 16 * 1024 * 1024
+
+TileKey: TypeAlias = Tuple[int, str, int, int]
+Warp: TypeAlias = Tuple[float, float, float, float, float, float]
+
+
+class GlyphAtlas:
+    """
+    Cache of pre-rendered glyph masks.
+
+    Every tile is the output of `CaptchaObj._draw_character` for one
+    (font size, character, rotation bucket, warp bucket) combination, stored as
+    an "L" coverage mask so it can be tinted with any colour when composited.
+    Tiles are kept in LRU order and evicted once `max_bytes` is exceeded.
+    """
+
+    def __init__(
+        self,
+        font: str,
+        font_sizes: Tuple[int, ...] = (42, 50, 56),
+        charset: str = DEFAULT_CHARSET,
+        rotations: int = 7,
+        warps: int = 4,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self._font: str = font
+        self._font_sizes: Tuple[int, ...] = font_sizes
+        self._charset: str = charset
+
+        self._rotations: Tuple[float, ...] = tuple(
+            -30 + 60 * index / max(rotations - 1, 1) for index in range(rotations)
+        )
+        # Warp buckets are sampled once from a fixed seed so every process builds the same set.
+        sampler: random.Random = random.Random(warps)
+        self._warps: Tuple[Warp, ...] = tuple(
+            (
+                sampler.uniform(0.1, 0.3),
+                sampler.uniform(0.2, 0.3),
+                sampler.uniform(-1, 1),
+                sampler.uniform(-1, 1),
+                sampler.uniform(-1, 1),
+                sampler.uniform(-1, 1),
+            )
+            for _ in range(warps)
+        )
+
+        self._tiles: "OrderedDict[TileKey, Image]" = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+        self.max_bytes: int = max_bytes
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def _render(self, key: TileKey) -> Image:
+        size, char, rotation, warp = key
+        font: FreeTypeFont = load_font(self._font, size)
+        _, _, w, h = Draw(create("L", (1, 1))).multiline_textbbox((1, 1), char, font=font)
+
+        image: Image = create("L", (w + 2, h + 3))
+        Draw(image).text((2, 3), char, font=font, fill=255)
+
+        image: Image = image.crop(image.getbbox())
+        image: Image = image.rotate(self._rotations[rotation], BILINEAR, expand=True)
+
+        fx, fy, a1, b1, a2, b2 = self._warps[warp]
+        x1: int = int(a1 * w * fx)
+        y1: int = int(b1 * h * fy)
+        x2: int = int(a2 * w * fx)
+        y2: int = int(b2 * h * fy)
+        w2: int = w + abs(x1) + abs(x2)
+        h2: int = h + abs(y1) + abs(y2)
+        data: Tuple[int, int, int, int, int, int, int, int] = (
+            x1,
+            y1,
+            -x1,
+            h2 - y2,
+            w2 + x2,
+            h2 + y2,
+            w2 - x2,
+            -y1,
+        )
+        image: Image = image.resize((w2, h2))
+        image: Image = image.transform((w, h), QUAD, data)
+        return image
+
+    def _insert(self, key: TileKey, tile: Image) -> None:
+        if key in self._tiles:
+            return
+        self._tiles[key] = tile
+        self.bytes += tile.width * tile.height
+        while self.bytes > self.max_bytes and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self.bytes -= evicted.width * evicted.height
+            self.evictions += 1
+
+    def tile(self, size: int, char: str, rotation: int, warp: int) -> Image:
+        key: TileKey = (size, char, rotation, warp)
+        with self._lock:
+            tile: Optional[Image] = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+        tile: Image = self._render(key)
+        with self._lock:
+            self._insert(key, tile)
+        return tile
+
+    def pick(
+        self, char: str, rng: random.Random, font_sizes: Optional[Tuple[int, ...]] = None
+    ) -> Image:
+        return self.tile(
+            rng.choice(font_sizes or self._font_sizes),
+            char,
+            rng.randrange(len(self._rotations)),
+            rng.randrange(len(self._warps)),
+        )
+
+    def warm(self, font_sizes: Optional[Iterable[int]] = None) -> int:
+        """Pre-render every variant, stopping early once the memory cap is reached."""
+        rendered: int = 0
+        for size in font_sizes or self._font_sizes:
+            for char in self._charset:
+                for rotation in range(len(self._rotations)):
+                    for warp in range(len(self._warps)):
+                        key: TileKey = (size, char, rotation, warp)
+                        if key in self._tiles:
+                            continue
+                        tile: Image = self._render(key)
+                        with self._lock:
+                            if self.bytes + tile.width * tile.height > self.max_bytes:
+                                return rendered
+                            self._insert(key, tile)
+                        rendered += 1
+        return rendered
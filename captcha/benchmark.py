@@ -0,0 +1,236 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Offline captcha rendering benchmark, run with `python -m captcha.benchmark --help`.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import PIL
+
+from .encoding import ENCODINGS
+from .executor import BACKENDS, RenderExecutor
+from .renderer import AVAILABLE_RENDERERS, RENDERERS, CaptchaRenderer, RenderProfile
+from .shedding import TIERS
+from .vectorized import np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FONT: Path = Path(__file__).parent / "data" / "DroidSansMono.ttf"
+
+DIMENSIONS: Tuple[Tuple[int, int], ...] = ((160, 60), (300, 100), (450, 150))
+FONT_SIZES: Tuple[Tuple[int, ...], ...] = ((42, 50, 56), (36,), (30, 40, 50, 60))
+CODE_LENGTHS: Tuple[int, ...] = (4, 6, 8)
+TRACED_RENDERS: int = 5
+
+
+def _peak_rss_kib(children: bool = False) -> Optional[int]:
+    """Peak RSS of this process, or of its largest reaped child, over its whole lifetime."""
+    if resource is None:
+        return None
+    who: int = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak: int = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB everywhere else.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _percentile(latencies: List[float], percent: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1]
+
+
+def cases(
+    args: argparse.Namespace,
+) -> Iterator[Tuple[str, int, RenderProfile]]:
+    """Yield (backend, code length, profile) for every benchmark case."""
+    renderers: List[str] = [name for name in args.renderers if name in AVAILABLE_RENDERERS]
+    encodings: List[str] = [name for name in args.encodings if ENCODINGS[name].available]
+    if args.full:
+        for backend, renderer, (width, height), sizes, length, encoding in itertools.product(
+            args.backends, renderers, DIMENSIONS, FONT_SIZES, CODE_LENGTHS, encodings
+        ):
+            yield backend, length, RenderProfile(
+                renderer, width, height, font_sizes=sizes, encoding=encoding  # type: ignore
+            )
+        return
+
+    # Vary one dimension at a time around the default profile.
+    base: RenderProfile = RenderProfile()
+    for backend in args.backends:
+        for renderer in renderers:
+            yield backend, 6, replace(base, renderer=renderer)  # type: ignore
+    for width, height in DIMENSIONS:
+        yield "inline", 6, replace(base, width=width, height=height)
+    for sizes in FONT_SIZES:
+        yield "inline", 6, replace(base, font_sizes=sizes)
+    for length in CODE_LENGTHS:
+        yield "inline", length, base
+    for encoding in encodings:
+        yield "inline", 6, replace(base, encoding=encoding)
+    for tier in TIERS[1:]:
+        yield "inline", 6, tier.apply(base)
+
+
+async def run_case(
+    renderer: CaptchaRenderer,
+    backend: str,
+    length: int,
+    profile: RenderProfile,
+    iterations: int,
+    workers: int,
+    codes: random.Random,
+) -> Dict[str, Any]:
+    executor: RenderExecutor = RenderExecutor(
+        renderer, backend, workers, timeout=600, profiles=[profile]  # type: ignore
+    )
+    concurrency: int = executor.workers
+    latencies: List[float] = []
+    sizes: List[int] = []
+    # ru_maxrss never goes down, so only how far a case pushes it up is its own.
+    peak_before: Optional[int] = _peak_rss_kib()
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            code: str = "".join(codes.choices(string.ascii_uppercase, k=length))
+            start: float = time.perf_counter()
+            image: bytes = await executor.render(code, profile)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(image))
+
+    try:
+        # Warm up every worker so process start-up and lazy font loads aren't measured.
+        await asyncio.gather(*(worker(1) for _ in range(concurrency)))
+        latencies.clear()
+        sizes.clear()
+
+        start: float = time.perf_counter()
+        share, extra = divmod(iterations, concurrency)
+        await asyncio.gather(*(worker(share + (index < extra)) for index in range(concurrency)))
+        elapsed: float = time.perf_counter() - start
+        timed: int = len(latencies)
+
+        # Tracing slows every allocation down, so memory is sampled in a separate pass.
+        tracemalloc.start()
+        await asyncio.gather(*(worker(TRACED_RENDERS) for _ in range(concurrency)))
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del latencies[timed:]
+    finally:
+        executor.shutdown(wait=True)
+
+    result: Dict[str, Any] = asdict(profile)
+    result.update(
+        backend=backend,
+        workers=concurrency,
+        code_length=length,
+        iterations=timed,
+        renders_per_second=len(latencies) / elapsed,
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        python_peak_kib=python_peak // 1024,
+        process_peak_rss_kib=_peak_rss_kib(),
+        peak_rss_growth_kib=(
+            None if peak_before is None else _peak_rss_kib() - peak_before  # type: ignore
+        ),
+        # Workers are reaped by the shutdown above, so their peaks are counted by now.
+        workers_peak_rss_kib=_peak_rss_kib(children=True) if backend == "process" else None,
+        mean_size_bytes=statistics.fmean(sizes[:timed]),
+    )
+    return result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    renderer: CaptchaRenderer = CaptchaRenderer([FONT], args.seed)
+    codes: random.Random = random.Random(args.seed)
+    results: List[Dict[str, Any]] = []
+    for backend, length, profile in cases(args):
+        result: Dict[str, Any] = await run_case(
+            renderer, backend, length, profile, args.iterations, args.workers, codes
+        )
+        results.append(result)
+        print(
+            f"{backend:<8}{profile!s:<60} {length} chars "
+            f"{result['renders_per_second']:8.1f}/s p50 {result['p50_ms']:6.2f} ms "
+            f"p99 {result['p99_ms']:6.2f} ms {result['mean_size_bytes'] / 1024:6.1f} KiB",
+            file=sys.stderr,
+        )
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pillow": PIL.__version__,
+            "numpy": getattr(np, "__version__", None),
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="python -m captcha.benchmark", description="Benchmark captcha rendering offline."
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="renders per case")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="pool size")
+    parser.add_argument(
+        "-s", "--seed", type=int, default=None, help="seed for reproducible images"
+    )
+    parser.add_argument("-o", "--output", type=Path, default=None, help="JSON file to write")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--renderers", nargs="+", choices=RENDERERS, default=list(RENDERERS))
+    parser.add_argument("--encodings", nargs="+", choices=list(ENCODINGS), default=list(ENCODINGS))
+    parser.add_argument(
+        "--full", action="store_true", help="run the full cross product instead of a sweep"
+    )
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    report: str = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, Final, Iterable, List, Set
+
+import discord
+
+from .outbound import OutboundQueue, Priority
+from .registry import MessageRef
+from .scheduler import DeadlineScheduler
+
+BULK_DELETE_LIMIT: Final[int] = 100
+# Discord's bulk delete endpoint rejects messages older than two weeks.
+BULK_DELETE_MAX_AGE: Final[datetime.timedelta] = datetime.timedelta(days=14)
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.cleanup")
+
+
+class CleanupQueue:
+    """
+    Coalesces message deletions and flushes them per channel.
+
+    Messages are queued by channel and message ID, collected for `interval` seconds
+    after the first one is queued. Cached guild channels then get one bulk delete per
+    `BULK_DELETE_LIMIT` messages, while DM messages can only be deleted one by one.
+    Every delete is sent at the lowest priority of the outbound queue, so cleanup
+    backs off while members are waiting.
+    """
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        scheduler: DeadlineScheduler,
+        outbound: OutboundQueue,
+        interval: float = 1.5,
+    ) -> None:
+        self._bot: discord.Client = bot
+        self._scheduler: DeadlineScheduler = scheduler
+        self._outbound: OutboundQueue = outbound
+        self._pending: Dict[int, Set[int]] = {}
+
+        self.interval: float = interval
+        self.requests: int = 0
+        self.deleted: int = 0
+
+    def __len__(self) -> int:
+        return sum(len(messages) for messages in self._pending.values())
+
+    def add(self, refs: Iterable[MessageRef]) -> None:
+        for channel_id, message_id in refs:
+            self._pending.setdefault(channel_id, set()).add(message_id)
+        if self._pending and ("flush",) not in self._scheduler:
+            self._scheduler.schedule(("flush",), self.interval, self.flush)
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(
+            *(
+                self._delete(channel_id, sorted(messages))
+                for channel_id, messages in pending.items()
+            )
+        )
+
+    async def _delete(self, channel_id: int, messages: List[int]) -> None:
+        channel: Any = self._bot.get_channel(channel_id)
+        if getattr(channel, "delete_messages", None) is not None:
+            cutoff: datetime.datetime = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+            recent: List[int] = [m for m in messages if discord.utils.snowflake_time(m) > cutoff]
+            messages = [m for m in messages if discord.utils.snowflake_time(m) <= cutoff]
+            for index in range(0, len(recent), BULK_DELETE_LIMIT):
+                chunk: List[int] = recent[index : index + BULK_DELETE_LIMIT]
+                self.requests += 1
+                try:
+                    await self._outbound.submit(
+                        Priority.CLEANUP,
+                        ("delete", channel_id),
+                        channel.delete_messages,
+                        [discord.Object(message_id) for message_id in chunk],
+                    )
+                except discord.NotFound:
+                    pass
+                except discord.Forbidden:
+                    # Without Manage Messages the bot can still delete its own messages.
+                    messages.extend(chunk)
+                    continue
+                except discord.HTTPException as e:
+                    log.warning(f"Could not bulk delete messages in {channel_id}: {e}")
+                    continue
+                self.deleted += len(chunk)
+        partial: discord.PartialMessageable = self._bot.get_partial_messageable(channel_id)
+        await asyncio.gather(
+            *(self._delete_one(partial.get_partial_message(message)) for message in messages)
+        )
+
+    async def _delete_one(self, message: discord.PartialMessage) -> None:
+        self.requests += 1
+        try:
+            await self._outbound.submit(
+                Priority.CLEANUP,
+                ("delete", message.channel.id),
+                message.delete,
+                key=("delete", message.id),
+            )
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            log.warning(f"Could not delete message {message.id}: {e}")
+            return
+        self.deleted += 1
@@ -1,4 +1,7 @@
-from typing import Any, Dict, Optional
+import asyncio
+import sqlite3
+import time
+from typing import Any, Dict, List, Literal, Optional
 
 import discord
 import discord.app_commands as app_commands
@@ -7,7 +10,11 @@ from redbot.core.utils.chat_formatting import box
 from redbot.core.utils.views import ConfirmView
 
 from .abc import CompositeMetaClass, MixinMeta
+from .encoding import ENCODINGS
 from .format import format_message
+from .renderer import AVAILABLE_RENDERERS
+from .settings import GuildSettings
+from .store import RespError
 from .views import CaptchaVerifyButton
 
 
@@ -22,7 +29,8 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     @app_commands.default_permissions(administrator=True)
     async def deploy(self, interaction: discord.Interaction):
         guild = interaction.guild
-        channel_id = await self.config.guild(guild).channel()
+        settings = await self.guild_settings.get(guild.id)
+        channel_id = settings.channel
         if not channel_id:
             return await interaction.response.send_message(
                 "Verification channel not configured.", ephemeral=True
@@ -34,7 +42,7 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
                 "Invalid verification channel.", ephemeral=True
             )
 
-        captcha_info = await self.config.guild(guild).get_raw("captcha_message", default=None)
+        captcha_info = settings.captcha_message
         if captcha_info:
             try:
                 old_channel = guild.get_channel(captcha_info["channel_id"])
@@ -44,18 +52,17 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
             except discord.HTTPException:
                 pass
 
-        embed_text = await self.config.guild(guild).embed_text()
         embed = discord.Embed(
-            description=format_message(embed_text, guild.me),
+            description=format_message(settings.embed_text, guild.me),
             color=discord.Color(0x34EB83),
         )
 
         view = CaptchaVerifyButton(self)
         msg = await channel.send(embed=embed, view=view)
 
-        await self.config.guild(guild).set_raw(
-            "captcha_message",
-            value={
+        await self.guild_settings.set(
+            guild.id,
+            captcha_message={
                 "channel_id": msg.channel.id,
                 "message_id": msg.id,
             },
@@ -69,7 +76,7 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     @app_commands.default_permissions(administrator=True)
     async def toggle(self, interaction: discord.Interaction, toggle: bool):
         guild = interaction.guild
-        await self.config.guild(guild).toggle.set(toggle)
+        await self.guild_settings.set(guild.id, toggle=toggle)
         await interaction.response.send_message(
             f"Captcha verification is now {'enabled' if toggle else 'disabled'}.", ephemeral=True
         )
@@ -81,10 +88,10 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     async def unverifiedrole(self, interaction: discord.Interaction, role: Optional[discord.Role]):
         guild = interaction.guild
         if role is None:
-            await self.config.guild(guild).role_before_captcha.clear()
+            await self.guild_settings.set(guild.id, role_before_captcha=None)
             await interaction.response.send_message("Cleared the unverified role.", ephemeral=True)
             return
-        await self.config.guild(guild).role_before_captcha.set(role.id)
+        await self.guild_settings.set(guild.id, role_before_captcha=role.id)
         await interaction.response.send_message(
             f"Configured the unverified role to {role.name} ({role.id}).", ephemeral=True
         )
@@ -96,12 +103,12 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     async def role(self, interaction: discord.Interaction, role: Optional[discord.Role]):
         guild = interaction.guild
         if role is None:
-            await self.config.guild(guild).role_after_captcha.clear()
+            await self.guild_settings.set(guild.id, role_after_captcha=None)
             await interaction.response.send_message(
                 "Cleared the captcha verification role.", ephemeral=True
             )
             return
-        await self.config.guild(guild).role_after_captcha.set(role.id)
+        await self.guild_settings.set(guild.id, role_after_captcha=role.id)
         await interaction.response.send_message(
             f"Configured the captcha verification role to {role.name} ({role.id}).", ephemeral=True
         )
@@ -114,7 +121,7 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
         self, interaction: discord.Interaction, amount: app_commands.Range[int, 50, 300]
     ):
         guild = interaction.guild
-        await self.config.guild(guild).timeout.set(amount)
+        await self.guild_settings.set(guild.id, timeout=amount)
         await interaction.response.send_message(
             f"Configured the timeout to {amount} seconds.", ephemeral=True
         )
@@ -127,16 +134,430 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
         self, interaction: discord.Interaction, amount: app_commands.Range[int, 2, 10]
     ):
         guild = interaction.guild
-        await self.config.guild(guild).tries.set(amount)
+        await self.guild_settings.set(guild.id, tries=amount)
         await interaction.response.send_message(
             f"Configured the number of attempts to {amount}.", ephemeral=True
         )
 
+    @captcha_group.command(name="renderer", description="Choose how captcha characters are drawn.")
+    @app_commands.describe(
+        renderer=(
+            "atlas composites pre-rendered glyphs, classic rasterizes every glyph, "
+            "numpy distorts the whole image at once."
+        )
+    )
+    @app_commands.choices(
+        renderer=[app_commands.Choice(name=name, value=name) for name in AVAILABLE_RENDERERS]
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def renderer(self, interaction: discord.Interaction, renderer: str):
+        guild = interaction.guild
+        if renderer not in AVAILABLE_RENDERERS:
+            return await interaction.response.send_message(
+                "The numpy renderer needs `numpy` to be installed.", ephemeral=True
+            )
+        await self.guild_settings.set(guild.id, renderer=renderer)
+        await interaction.response.send_message(
+            f"Configured the captcha renderer to {renderer}.", ephemeral=True
+        )
+
+    @captcha_group.command(
+        name="joinflow", description="Post a captcha in the channel when members join."
+    )
+    @app_commands.describe(
+        toggle="Joined members must answer in the verification channel or get kicked."
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def joinflow(self, interaction: discord.Interaction, toggle: bool):
+        guild = interaction.guild
+        await self.guild_settings.set(guild.id, join_flow=toggle)
+        await interaction.response.send_message(
+            f"Join captchas are now {'enabled' if toggle else 'disabled'}.", ephemeral=True
+        )
+
+    @captcha_group.command(name="profile", description="Set how this server's captchas look.")
+    @app_commands.describe(
+        width="Image width in pixels.",
+        height="Image height in pixels.",
+        font="Font file, extra fonts can be added to the cog's data folder.",
+        font_sizes="Comma separated font sizes picked at random for each character.",
+        noise="Number of noise dots drawn over the image.",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def profile(
+        self,
+        interaction: discord.Interaction,
+        width: Optional[app_commands.Range[int, 160, 600]] = None,
+        height: Optional[app_commands.Range[int, 60, 300]] = None,
+        font: Optional[str] = None,
+        font_sizes: Optional[str] = None,
+        noise: Optional[app_commands.Range[int, 0, 200]] = None,
+    ):
+        guild = interaction.guild
+        if font is not None and font not in self.captcha_renderer.fonts:
+            return await interaction.response.send_message(
+                f"Unknown font `{font}`.", ephemeral=True
+            )
+        sizes: Optional[List[int]] = None
+        if font_sizes is not None:
+            try:
+                sizes = [int(size) for size in font_sizes.replace(" ", "").split(",")]
+            except ValueError:
+                sizes = []
+            if not sizes or not all(12 <= size <= 120 for size in sizes):
+                return await interaction.response.send_message(
+                    "Font sizes must be comma separated numbers between 12 and 120.",
+                    ephemeral=True,
+                )
+
+        changes: Dict[str, Any] = {
+            key: value
+            for key, value in (
+                ("width", width),
+                ("height", height),
+                ("font", font),
+                ("font_sizes", sizes),
+                ("noise_dots", noise),
+            )
+            if value is not None
+        }
+        profile = (await self.guild_settings.set(guild.id, **changes)).profile
+
+        await interaction.response.send_message(
+            f"Configured the captcha profile to {profile}.", ephemeral=True
+        )
+
+    @profile.autocomplete("font")
+    async def profile_font_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        return [
+            app_commands.Choice(name=name, value=name)
+            for name in self.captcha_renderer.fonts
+            if current.lower() in name.lower()
+        ][:25]
+
+    @captcha_group.command(
+        name="encoding", description="Compare or choose how captcha images are encoded."
+    )
+    @app_commands.describe(
+        encoding="Encoding profile to use, leave empty to compare all of them.",
+        quality="Quality of the lossy webp profile (10-100).",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def encoding(
+        self,
+        interaction: discord.Interaction,
+        encoding: Optional[
+            Literal["png", "png-fast", "png-palette", "webp-lossless", "webp"]
+        ] = None,
+        quality: Optional[app_commands.Range[int, 10, 100]] = None,
+    ):
+        guild = interaction.guild
+        if encoding is not None and not ENCODINGS[encoding].available:
+            return await interaction.response.send_message(
+                f"This bot's Pillow build can't encode `{encoding}`.", ephemeral=True
+            )
+        changes: Dict[str, Any] = {}
+        if encoding is not None:
+            changes["encoding"] = encoding
+        if quality is not None:
+            changes["encoding_quality"] = quality
+        if changes:
+            await self.guild_settings.set(guild.id, **changes)
+
+        profile = await self.get_profile(guild)
+        encoded = await asyncio.to_thread(self.captcha_renderer.compare, "CAPTCHA", profile)
+        table = "\n".join(
+            f"{name + (' *' if name == profile.encoding else ''):<16}"
+            f"{image.seconds * 1000:>7.2f} ms{image.size / 1024:>8.1f} KiB"
+            for name, image in encoded.items()
+        )
+        await interaction.response.send_message(
+            f"Current encoding: `{profile.encoder.name}`. {profile.encoder.description}\n"
+            f"{box(table)}",
+            ephemeral=True,
+        )
+
+    @captcha_group.command(
+        name="mode", description="Choose between image captchas and button grid challenges."
+    )
+    @app_commands.describe(
+        mode="image sends a captcha picture, grid asks for buttons to be pressed in order.",
+        surge=(
+            "Bot owner only: use grid challenges everywhere while this many are pending, "
+            "0 to never switch."
+        ),
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def mode(
+        self,
+        interaction: discord.Interaction,
+        mode: Optional[Literal["image", "grid"]] = None,
+        surge: Optional[app_commands.Range[int, 0, 100_000]] = None,
+    ):
+        guild = interaction.guild
+        if surge is not None:
+            if not await self.bot.is_owner(interaction.user):
+                return await interaction.response.send_message(
+                    "Only the bot owner can change the surge threshold.", ephemeral=True
+                )
+            await self.config.surge_threshold.set(surge)
+            self._surge_threshold = surge
+        if mode is not None:
+            await self.guild_settings.set(guild.id, challenge=mode)
+
+        settings = await self.guild_settings.get(guild.id)
+        await interaction.response.send_message(
+            box(
+                f"mode: {settings.challenge}\n"
+                f"surge threshold: {self._surge_threshold or 'off'}\n"
+                f"pending: {len(self.challenges)}\n"
+                f"active now: {self.challenge_mode(settings)}",
+                lang="yaml",
+            ),
+            ephemeral=True,
+        )
+
+    @captcha_group.command(
+        name="massverify", description="Verify every member who holds the unverified role."
+    )
+    @app_commands.describe(
+        action="Start a run, stop the running one, or show its progress.",
+        rate="Role edits started per second.",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def massverify(
+        self,
+        interaction: discord.Interaction,
+        action: Literal["start", "stop", "status"] = "start",
+        rate: Optional[app_commands.Range[float, 0.2, 10.0]] = None,
+    ):
+        guild = interaction.guild
+        job = self._mass_verify.get(guild.id)
+        if action == "stop":
+            if job is None or not job.running:
+                return await interaction.response.send_message(
+                    "No mass verification is running.", ephemeral=True
+                )
+            self.stop_mass_verify(guild.id)
+            return await interaction.response.send_message(
+                f"⏹️ Stopped mass verification: {job}\n"
+                "Start it again to pick up where it left off.",
+                ephemeral=True,
+            )
+        if action == "status" or (job is not None and job.running):
+            return await interaction.response.send_message(
+                f"Mass verification: {job}" if job else "No mass verification has run yet.",
+                ephemeral=True,
+            )
+
+        job = await self.start_mass_verify(guild, rate or 2.0)
+        if job is None:
+            return await interaction.response.send_message(
+                "Set an unverified role with `/captcha unverifiedrole` first.", ephemeral=True
+            )
+        await interaction.response.send_message(f"⏳ Mass verification: {job}", ephemeral=True)
+        # Progress is edited in until the job ends or the interaction token expires.
+        while job.running:
+            await asyncio.wait({job.task}, timeout=5)
+            prefix = "⏳" if job.running else "✅"
+            try:
+                await interaction.edit_original_response(
+                    content=f"{prefix} Mass verification: {job}"
+                )
+            except discord.HTTPException:
+                break
+
+    @captcha_group.command(
+        name="stats", description="View captcha latency, image size and outcome statistics."
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        metrics = self.metrics
+        rows = [
+            ("render", metrics.render, 1000, "ms"),
+            ("image", metrics.image_bytes, 1 / 1024, "KiB"),
+            ("dm send", metrics.dm_send, 1000, "ms"),
+            ("response", metrics.response, 1000, "ms"),
+            ("role edit", metrics.role_edit, 1000, "ms"),
+            ("solve", metrics.solve, 1, "s"),
+        ]
+        lines = []
+        for label, histogram, scale, unit in rows:
+            p50, p95, p99 = (value * scale for value in histogram.percentiles(50, 95, 99))
+            lines.append(
+                f"{label}: {histogram.count} total, p50 {p50:.1f} {unit}, "
+                f"p95 {p95:.1f} {unit}, p99 {p99:.1f} {unit}"
+            )
+        here = metrics.outcomes.get(interaction.guild.id, [0, 0, 0])
+        total = metrics.totals()
+        lines.append(f"this server: {here[0]} passed, {here[1]} failed, {here[2]} expired")
+        lines.append(f"all servers: {total[0]} passed, {total[1]} failed, {total[2]} expired")
+        lines.append(
+            f"verify clicks: {metrics.rejected['user']} rejected per user, "
+            f"{metrics.rejected['guild']} per server, {metrics.resent} resent"
+        )
+        await interaction.response.send_message(
+            f"Since <t:{int(metrics.started)}:R>, percentiles cover the last "
+            f"{metrics.render.size} samples of each.\n"
+            + box("\n".join(lines), lang="yaml")
+            + f"\nPrometheus metrics are written to `{self.metrics_path()}` every minute.",
+            ephemeral=True,
+        )
+
+    @captcha_group.command(
+        name="pool", description="View or resize the pool of pre-generated challenges."
+    )
+    @app_commands.describe(
+        low="Refill the pool once it holds fewer challenges than this.",
+        high="Stop refilling once the pool holds this many challenges.",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def pool(
+        self,
+        interaction: discord.Interaction,
+        low: Optional[app_commands.Range[int, 0, 256]] = None,
+        high: Optional[app_commands.Range[int, 1, 512]] = None,
+    ):
+        if low is not None or high is not None:
+            if not await self.bot.is_owner(interaction.user):
+                return await interaction.response.send_message(
+                    "Only the bot owner can resize the challenge pool.", ephemeral=True
+                )
+            low = await self.config.pool_low_watermark() if low is None else low
+            high = await self.config.pool_high_watermark() if high is None else high
+            if low > high:
+                return await interaction.response.send_message(
+                    "The low watermark can't be above the high watermark.", ephemeral=True
+                )
+            await self.config.pool_low_watermark.set(low)
+            await self.config.pool_high_watermark.set(high)
+            self.resize_pools(low, high)
+
+        lines = [
+            f"{profile}: {len(pool)}/{pool.high} ready (low {pool.low}), "
+            f"{pool.hits} hits, {pool.misses} misses"
+            for profile, pool in self._pools.items()
+        ]
+        await interaction.response.send_message(
+            box("\n".join(lines) or "No challenge pools are running.", lang="yaml"),
+            ephemeral=True,
+        )
+
+    @captcha_group.command(
+        name="backend", description="View or change where captchas are rendered."
+    )
+    @app_commands.describe(
+        backend="inline renders on the event loop, thread and process use a worker pool.",
+        workers="How many captchas may render at once, defaults to the CPU count.",
+        timeout="Seconds a render may wait for a free worker before it is rejected.",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def backend(
+        self,
+        interaction: discord.Interaction,
+        backend: Optional[Literal["inline", "thread", "process"]] = None,
+        workers: Optional[app_commands.Range[int, 1, 64]] = None,
+        timeout: Optional[app_commands.Range[float, 0.5, 30.0]] = None,
+    ):
+        if backend is not None or workers is not None or timeout is not None:
+            if not await self.bot.is_owner(interaction.user):
+                return await interaction.response.send_message(
+                    "Only the bot owner can change the render backend.", ephemeral=True
+                )
+            backend = backend or self.executor.backend
+            workers = workers or await self.config.render_workers()
+            timeout = self.executor.timeout if timeout is None else timeout
+            await self.config.render_backend.set(backend)
+            await self.config.render_workers.set(workers)
+            await self.config.render_timeout.set(timeout)
+            self.set_render_backend(backend, workers, timeout)
+
+        executor = self.executor
+        await interaction.response.send_message(
+            box(
+                f"backend: {executor.backend}\n"
+                f"workers: {executor.workers}\n"
+                f"timeout: {executor.timeout}s\n"
+                f"queued: {executor.queued}\n"
+                f"rendered: {executor.rendered}\n"
+                f"timeouts: {executor.timeouts}",
+                lang="yaml",
+            ),
+            ephemeral=True,
+        )
+
+    @captcha_group.command(
+        name="store", description="View or change where active challenges are kept."
+    )
+    @app_commands.describe(
+        backend="memory keeps them in this process, sqlite and redis share them across processes.",
+        url="SQLite file path or redis:// URL, defaults to the cog's data folder or localhost.",
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def store(
+        self,
+        interaction: discord.Interaction,
+        backend: Optional[Literal["memory", "sqlite", "redis"]] = None,
+        url: Optional[str] = None,
+    ):
+        if backend is not None and not await self.bot.is_owner(interaction.user):
+            return await interaction.response.send_message(
+                "Only the bot owner can change the challenge store.", ephemeral=True
+            )
+        # Opening a store may connect to a server, which can take longer than Discord waits.
+        await interaction.response.defer(ephemeral=True)
+        if backend is not None:
+            try:
+                await self.set_challenge_store(backend, url)
+            except (OSError, sqlite3.Error, RespError) as error:
+                return await interaction.followup.send(
+                    f"❌ Could not open the {backend} store: {error}", ephemeral=True
+                )
+            await self.config.challenge_store.set(backend)
+            await self.config.challenge_store_url.set(url)
+
+        await interaction.followup.send(
+            box(
+                f"store: {self.challenges}\n" f"cached: {len(self.challenges)}",
+                lang="yaml",
+            ),
+            ephemeral=True,
+        )
+
+    @captcha_group.command(name="debug", description="Show what the cog tracks in memory.")
+    @app_commands.default_permissions(administrator=True)
+    async def debug(self, interaction: discord.Interaction):
+        if not await self.bot.is_owner(interaction.user):
+            return await interaction.response.send_message(
+                "Only the bot owner can view debug information.", ephemeral=True
+            )
+        records = list(self.registry)
+        now = time.monotonic()
+        await interaction.response.send_message(
+            box(
+                f"records: {len(records)}\n"
+                f"join flows: {sum(record.join_flow for record in records)}\n"
+                f"dm routes: {sum(record.dm_channel_id is not None for record in records)}\n"
+                f"tracked messages: {sum(len(record.refs()) for record in records)}\n"
+                f"cached images: {len(self.images)} ({self.images.nbytes() / 1024:.1f} KiB)\n"
+                f"registry footprint: {self.registry.footprint() / 1024:.1f} KiB\n"
+                f"overdue: {sum(record.deadline < now for record in records)}\n"
+                f"answer routes: {len(self.router)}\n"
+                f"store cache: {len(self.challenges)}\n"
+                f"pending cleanup: {len(self.cleanup)}\n"
+                f"outbound: {self.outbound}",
+                lang="yaml",
+            ),
+            ephemeral=True,
+        )
+
     @captcha_group.command(name="before", description="Set the message shown before captcha.")
     @app_commands.default_permissions(administrator=True)
     async def before(self, interaction: discord.Interaction, message: str):
         guild = interaction.guild
-        await self.config.guild(guild).message_before_captcha.set(message)
+        await self.guild_settings.set(guild.id, message_before_captcha=message)
         await interaction.response.send_message(
             f"✅ Updated before-captcha message:\n{box(message, lang='yaml')}", ephemeral=True
         )
@@ -145,7 +566,7 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     @app_commands.default_permissions(administrator=True)
     async def after(self, interaction: discord.Interaction, message: str):
         guild = interaction.guild
-        await self.config.guild(guild).message_after_captcha.set(message)
+        await self.guild_settings.set(guild.id, message_after_captcha=message)
         await interaction.response.send_message(
             f"✅ Updated after-captcha message:\n{box(message, lang='yaml')}", ephemeral=True
         )
@@ -156,16 +577,16 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
         guild = interaction.guild
 
         if message is None:
-            await self.config.guild(guild).embed_text.clear()
+            await self.guild_settings.set(guild.id, embed_text=GuildSettings().embed_text)
             await interaction.response.send_message("Cleared the embed message.", ephemeral=True)
             return
 
-        await self.config.guild(guild).embed_text.set(message)
+        settings = await self.guild_settings.set(guild.id, embed_text=message)
         await interaction.response.send_message(
             f"✅ Updated embed message:\n{box(message, lang='yaml')}", ephemeral=True
         )
 
-        captcha_info = await self.config.guild(guild).get_raw("captcha_message", default=None)
+        captcha_info = settings.captcha_message
         if not captcha_info:
             return  # No existing message to update
 
@@ -197,36 +618,46 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     @app_commands.default_permissions(administrator=True)
     async def settings(self, interaction: discord.Interaction):
         guild = interaction.guild
-        data: Dict[str, Any] = await self.config.guild(guild).all()
-        role = guild.get_role(data["role_after_captcha"])
+        settings = await self.guild_settings.get(guild.id)
+        role = guild.get_role(settings.role_after_captcha)  # type: ignore
         role = "None" if role is None else f"<@&{role.id}> ({role.id})"
-        channel = guild.get_channel(data["channel"])
+        channel = guild.get_channel(settings.channel)  # type: ignore
         channel = "None" if channel is None else f"<#{channel.id}> ({channel.id})"
         embed = discord.Embed(
             title="Captcha Settings",
             description=(
-                f"**Toggle**: {data['toggle']}\n"
+                f"**Toggle**: {settings.toggle}\n"
                 f"**Channel**: {channel}\n"
-                f"**Timeout**: {data['timeout']}\n"
-                f"**Tries**: {data['tries']}\n"
+                f"**Timeout**: {settings.timeout}\n"
+                f"**Tries**: {settings.tries}\n"
                 f"**Role**: {role}\n"
+                f"**Profile**: {settings.profile}\n"
+                f"**Challenge**: {settings.challenge} (now {self.challenge_mode(settings)})\n"
+                f"**Load tier**: {self.shedder}\n"
+                f"**Join flow**: {settings.join_flow}, {self.admission.depth(guild.id)} "
+                f"members queued here, {self.admission}\n"
+                f"**Pending**: {len(self.challenges)} challenges, "
+                f"{len(self.router)} awaited answers, "
+                f"{len(self.scheduler)} scheduled expiries and cleanups, "
+                f"{len(self.cleanup)} messages waiting to be deleted\n"
+                f"**Outbound**: {self.outbound}\n"
             ),
             color=discord.Color(0x34EB83),
         )
         embed.set_thumbnail(url=getattr(guild.icon, "url", None))
         embed.add_field(
             name="Before Captcha Message:",
-            value=box(str(data["message_before_captcha"]), lang="json"),
+            value=box(str(settings.message_before_captcha), lang="json"),
             inline=False,
         )
         embed.add_field(
             name="Embed Text:",
-            value=box(str(data["embed_text"]), lang="json"),
+            value=box(str(settings.embed_text), lang="json"),
             inline=False,
         )
         embed.add_field(
             name="After Captcha Message:",
-            value=box(str(data["message_after_captcha"]), lang="json"),
+            value=box(str(settings.message_after_captcha), lang="json"),
             inline=False,
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -238,12 +669,12 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     ):
         guild = interaction.guild
         if channel is None:
-            await self.config.guild(guild).channel.clear()
+            await self.guild_settings.set(guild.id, channel=None)
             await interaction.response.send_message(
                 "Cleared the captcha verification channel.", ephemeral=True
             )
             return
-        await self.config.guild(guild).channel.set(channel.id)
+        await self.guild_settings.set(guild.id, channel=channel.id)
         await interaction.response.send_message(
             f"Configured the captcha verification channel to {channel.name} ({channel.id}).",
             ephemeral=True,
@@ -253,7 +684,7 @@ class CaptchaCommands(MixinMeta, metaclass=CompositeMetaClass):
     @app_commands.default_permissions(administrator=True)
     async def reset(self, interaction: discord.Interaction):
         guild = interaction.guild
-        await self.config.guild(guild).clear()
+        await self.guild_settings.clear(guild.id)
         await interaction.response.send_message(
             "Successfully reset all captcha settings to default.", ephemeral=True
         )
@@ -23,25 +23,64 @@ SOFTWARE.
 """
 
 import asyncio
+import functools
 import logging
 import os
-import random
+import secrets
+import sqlite3
 import string
+import time
+from io import BytesIO
 from pathlib import Path
 from types import ModuleType
-from typing import Any, Dict, Final, List, Optional, Union
+from typing import Any, Awaitable, Dict, Final, List, Literal, Optional, Tuple, Union
 
 import discord
 from redbot.core import Config, commands
 from redbot.core.bot import Red
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 
 from .abc import CompositeMetaClass
+from .admission import AdmissionQueue
+from .cleanup import CleanupQueue
 from .commands import CaptchaCommands
+from .executor import Backend, RenderExecutor
 from .format import format_message
-from .objects import CaptchaObj
+from .massverify import MassVerifyJob
+from .metrics import CaptchaMetrics
+from .outbound import OutboundQueue, Priority
+from .pool import Challenge, ChallengePool
+from .ratelimit import RateLimiter
+from .registry import ChallengeRecord, ChallengeRegistry, ImageCache, IssuedImage, MessageRef
+from .renderer import CaptchaRenderer, RenderProfile
+from .routing import AnswerRouter
+from .scheduler import DeadlineScheduler
+from .settings import GuildSettings, SettingsCache
+from .shedding import LoadShedder
+from .store import ChallengeStore, MemoryStore, RespError, StoreBackend, create_store
 
 DELETE_AFTER: Final[int] = 10
+# Stores keep challenges a little past their timeout, so the expiry deadline claims them
+# and sends its notice instead of finding them already dropped.
+EXPIRY_GRACE: Final[int] = 5
+# How often the store is checked for due challenges this process has no deadline for.
+EXPIRY_SWEEP_INTERVAL: Final[int] = 5
+REQUIRED_PERMISSIONS: Final[discord.Permissions] = discord.Permissions(
+    kick_members=True, manage_roles=True, embed_links=True, attach_files=True
+)
+METRICS_INTERVAL: Final[int] = 60
+SWEEP_INTERVAL: Final[int] = 30
+
+# Button grid challenges: press GRID_SEQUENCE of GRID_SIZE shuffled symbols in the given order.
+GRID_SYMBOLS: Final[Tuple[str, ...]] = (
+    "🍎", "🍌", "🍇", "🍒", "🥕", "🌽", "🐶", "🐱", "🐟", "🐢",
+    "🚗", "🚲", "⚽", "🎲", "🎸", "🌙", "⭐", "🔥", "💧", "🌵",
+)  # fmt: skip
+GRID_SIZE: Final[int] = 12
+GRID_SEQUENCE: Final[int] = 3
+# Verify clicks allowed per user and per guild, as (tokens a second, burst).
+USER_VERIFY_RATE: Final[Tuple[float, int]] = (0.2, 3)
+GUILD_VERIFY_RATE: Final[Tuple[float, int]] = (10.0, 50)
 
 log: logging.Logger = logging.getLogger("red.seina.captcha")
 
@@ -64,52 +103,216 @@ class Captcha(
 
     def __init__(self, bot: Red) -> None:
         super().__init__(bot)
-        self._active_challenges: Dict[int, str] = {}
         self.bot: Red = bot
         self.config: Config = Config.get_conf(
             self,
             identifier=69_420_666,
             force_registration=True,
         )
-        default_guild: Dict[str, Union[Optional[int], bool, str]] = {
-            "toggle": False,
-            "channel": None,
-            "timeout": 120,
-            "tries": 3,
-            "role_before_captcha": None,
-            "role_after_captcha": None,
-            "message_before_captcha": "{mention}, please solve the captcha below.",
-            "message_after_captcha": "✅ {mention}, you passed the captcha!",
-            "embed_text": "Click the green button below to verify.",
+        self.config.register_guild(**GuildSettings.defaults())
+        default_global: Dict[str, Union[Optional[int], float, str]] = {
+            "pool_low_watermark": 8,
+            "pool_high_watermark": 32,
+            "render_backend": "thread",
+            "render_workers": None,
+            "render_timeout": 2.5,
+            "surge_threshold": 50,
+            "challenge_store": "memory",
+            "challenge_store_url": None,
         }
-        self.config.register_guild(**default_guild)
+        self.config.register_global(**default_global)
 
-        self._captchas: Dict[int, discord.Message] = {}
-        self._verification_phase: Dict[int, int] = {}
-        self._user_tries: Dict[int, List[discord.Message]] = {}
+        # Active challenges, in this process or shared through SQLite or Redis.
+        self.challenges: ChallengeStore = MemoryStore()
+        # What this process tracks per user: join flows, DM routes and messages to delete.
+        self.registry: ChallengeRegistry = ChallengeRegistry()
+        # Images of pending challenges for repeat clicks, kept apart from the compact records.
+        self.images: ImageCache = ImageCache()
+        # Permission verdicts per guild, dropped whenever the bot's roles may have changed.
+        self._permitted: Dict[int, bool] = {}
 
-        self._config: Dict[int, Dict[str, Any]] = {}
+        # Guild settings are loaded on first use and kept in sync by every setter.
+        self.guild_settings: SettingsCache = SettingsCache(self.config)
 
         self.data_path: Path = bundled_data_path(self)
         self.font_data: str = os.path.join(self.data_path, "DroidSansMono.ttf")
+        # Extra fonts for render profiles can be dropped into the cog's data folder.
+        fonts_path: Path = cog_data_path(self) / "fonts"
+        fonts_path.mkdir(parents=True, exist_ok=True)
+        self.captcha_renderer: CaptchaRenderer = CaptchaRenderer(
+            [Path(self.font_data), *sorted(fonts_path.iterdir())]
+        )
+        self.executor: RenderExecutor = RenderExecutor(self.captcha_renderer)
+        self._pools: Dict[RenderProfile, ChallengePool] = {}
+        self._pool_watermarks: Tuple[int, int] = (8, 32)
+        self._surge_threshold: int = 50
+        # Renders get cheaper while render or Verify latency is too high, see `LoadShedder`.
+        self.shedder: LoadShedder = LoadShedder()
+        # Challenge expiries and message cleanups are deadlines of this one scheduler task.
+        self.scheduler: DeadlineScheduler = DeadlineScheduler()
+        # Discord requests go out by priority, so cleanup can't delay what members wait on.
+        self.outbound: OutboundQueue = OutboundQueue()
+        # Deleted messages are batched per channel and flushed shortly after.
+        self.cleanup: CleanupQueue = CleanupQueue(self.bot, self.scheduler, self.outbound)
+        # Join captchas start through per-guild queues so raids can't start them all at once.
+        self.admission: AdmissionQueue = AdmissionQueue(self.begin_captcha_flow)
+        # Answers reach their challenge with one lookup by (channel id, author id).
+        self.router: AnswerRouter = AnswerRouter()
+        # Fixed-size histograms behind `/captcha stats` and the Prometheus file.
+        self.metrics: CaptchaMetrics = CaptchaMetrics()
+        self._mass_verify: Dict[int, MassVerifyJob] = {}
+        # Image challenges being issued, by user, with the guild they're for.
+        self._issuing: Dict[int, Tuple[int, asyncio.Task]] = {}
+        # Tasks waiting for join captcha answers, cancelled when their member leaves.
+        self._join_flows: Dict[int, asyncio.Task] = {}
+        self.user_limits: RateLimiter = RateLimiter(*USER_VERIFY_RATE)
+        self.guild_limits: RateLimiter = RateLimiter(*GUILD_VERIFY_RATE)
+        self._unloading: bool = False
 
         self.task: asyncio.Task = asyncio.create_task(self._initialize())
-        self._dm_messages: Dict[int, discord.Message] = {}
 
         # Register persistent view
         from .views import CaptchaVerifyButton
 
         self.bot.add_view(CaptchaVerifyButton(self))
 
-    def register_active_challenge(
-        self, user_id: int, code: str, guild_id: int, timeout: int
+    async def register_active_challenge(
+        self,
+        user_id: int,
+        code: str,
+        guild_id: int,
+        timeout: int,
+        mode: Literal["image", "grid"] = "image",
+        symbols: Optional[List[str]] = None,
     ) -> None:
-        self._active_challenges[user_id] = {
+        record: Dict[str, Any] = {
             "code": code.upper(),
             "guild_id": guild_id,
-            "expires_at": asyncio.get_event_loop().time() + timeout,
+            "mode": mode,
+            "issued_at": time.time(),
         }
-        asyncio.create_task(self._expire_challenge(user_id, timeout))
+        if symbols is not None:
+            # Lets a repeated click show the pending grid again instead of replacing it.
+            record["symbols"] = symbols
+        await self.challenges.put(user_id, record, timeout + EXPIRY_GRACE)
+        self.scheduler.schedule(("expire", user_id), timeout, self._expire_challenge, user_id)
+
+    async def pop_active_challenge(self, user_id: int) -> Optional[Dict[str, Any]]:
+        self.scheduler.cancel(("expire", user_id))
+        record: Optional[ChallengeRecord] = self.registry.get(user_id)
+        if record is not None:
+            if record.dm_channel_id is not None:
+                self.router.remove(record.dm_channel_id, user_id)
+            record.dm_channel_id = None
+            self.registry.release(user_id)
+        self.images.pop(user_id)
+        return await self.challenges.claim(user_id)
+
+    def allow_verify(self, user_id: int, guild_id: int) -> bool:
+        """Take a token from the user's and the guild's Verify buckets."""
+        if not self.user_limits.acquire(user_id):
+            self.metrics.rejected["user"] += 1
+        elif not self.guild_limits.acquire(guild_id):
+            self.metrics.rejected["guild"] += 1
+        else:
+            return True
+        return False
+
+    def pending_guild(self, user_id: int) -> Optional[int]:
+        """The guild of the user's pending challenge, or of the one being issued."""
+        issuing: Optional[Tuple[int, asyncio.Task]] = self._issuing.get(user_id)
+        if issuing is not None:
+            return issuing[0]
+        challenge: Optional[Dict[str, Any]] = self.challenges.peek(user_id)
+        return challenge and challenge["guild_id"]
+
+    def issued_image(self, user_id: int, guild_id: int) -> Optional[IssuedImage]:
+        """The code, image and filename of the user's pending image challenge in a guild."""
+        issued: Optional[IssuedImage] = self.images.get(user_id)
+        challenge: Optional[Dict[str, Any]] = self.challenges.peek(user_id)
+        if issued is None or challenge is None or challenge["code"] != issued[0]:
+            return None
+        if challenge["guild_id"] != guild_id:
+            return None
+        return issued
+
+    async def issue_image(
+        self, user_id: int, guild_id: int, settings: GuildSettings
+    ) -> IssuedImage:
+        """Render and register an image challenge, concurrent calls for a user share one."""
+        issuing: Optional[Tuple[int, asyncio.Task]] = self._issuing.get(user_id)
+        if issuing is not None and issuing[0] == guild_id:
+            self.metrics.resent += 1
+            task: asyncio.Task = issuing[1]
+        else:
+            task: asyncio.Task = asyncio.create_task(
+                self._issue_image(user_id, guild_id, settings)
+            )
+            self._issuing[user_id] = (guild_id, task)
+            task.add_done_callback(functools.partial(self._issue_done, user_id))
+        return await asyncio.shield(task)
+
+    def _issue_done(self, user_id: int, task: asyncio.Task) -> None:
+        issuing: Optional[Tuple[int, asyncio.Task]] = self._issuing.get(user_id)
+        if issuing is not None and issuing[1] is task:
+            del self._issuing[user_id]
+
+    async def _issue_image(
+        self, user_id: int, guild_id: int, settings: GuildSettings
+    ) -> IssuedImage:
+        profile: RenderProfile = settings.profile
+        pending: Optional[Dict[str, Any]] = self.challenges.peek(user_id)
+        if pending is not None and pending["mode"] == "image" and pending["guild_id"] == guild_id:
+            # The image left the cache, the code already sent stays the one to solve.
+            code, image = await self._render_challenge(profile, pending["code"])
+        else:
+            code, image = await self.get_challenge(profile)
+            await self.register_active_challenge(user_id, code, guild_id, settings.timeout)
+        issued: IssuedImage = (code, image, profile.filename)
+        self.images.put(user_id, issued, settings.timeout)
+        deadline: float = time.monotonic() + settings.timeout + DELETE_AFTER
+        self.registry.open(user_id, guild_id, deadline)
+        return issued
+
+    def route_dm_answers(self, user_id: int, channel_id: int) -> None:
+        """Send the user's replies in their DM channel to the active image challenge."""
+        record: Optional[ChallengeRecord] = self.registry.get(user_id)
+        if record is None or self.challenges.peek(user_id) is None:
+            return
+        record.dm_channel_id = channel_id
+        self.router.add(channel_id, user_id, self._on_dm_answer)
+
+    def track_message(self, user_id: int, message: Any) -> None:
+        """Remember a message for `cleanup_messages`, the oldest beyond the cap goes now."""
+        evicted: Optional[MessageRef] = self.registry.track(
+            user_id, message, time.monotonic() + DELETE_AFTER
+        )
+        if evicted is not None:
+            self.cleanup.add([evicted])
+
+    async def sweep_registry(self) -> None:
+        """Clean up after records long past their deadline, in case a path missed them."""
+        self.scheduler.schedule("sweep", SWEEP_INTERVAL, self.sweep_registry)
+        self.images.sweep(time.monotonic())
+        for record in self.registry.overdue(time.monotonic() - DELETE_AFTER):
+            if record.dm_channel_id is not None:
+                self.router.remove(record.dm_channel_id, record.user_id)
+            self.cleanup.add(record.refs())
+            self.registry.discard(record.user_id)
+
+    def send_to(self, destination: discord.abc.Messageable, **kwargs: Any) -> Awaitable[Any]:
+        """Send a message a member is waiting on, at the outbound queue's top priority."""
+        return self.outbound.submit(
+            Priority.RESPONSE,
+            ("send", getattr(destination, "id", None)),
+            functools.partial(destination.send, **kwargs),
+        )
+
+    def schedule_cleanup(self, member_id: int) -> None:
+        """Delete the member's captcha messages `DELETE_AFTER` seconds after the last call."""
+        self.scheduler.schedule(
+            ("cleanup", member_id), DELETE_AFTER, self.cleanup_messages, member_id
+        )
 
     def format_message(self, template: str, member: discord.Member) -> str:
         return template.format(
@@ -132,13 +335,53 @@ class Captcha(
 
     async def _initialize(self) -> None:
         await self.bot.wait_until_red_ready()
+        await self.guild_settings.load_enabled(guild.id for guild in self.bot.guilds)
         await self._build_cache()
+        # Fonts and atlas tiles of the default profile are loaded once here instead of on the
+        # first challenges, pools of guild profiles start when their guild first needs them.
+        profile: RenderProfile = RenderProfile()
+        await asyncio.to_thread(self.captcha_renderer.warm, [profile])
+        self.get_pool(profile)
+        self.set_render_backend(
+            await self.config.render_backend(),
+            await self.config.render_workers(),
+            await self.config.render_timeout(),
+        )
+        self.scheduler.schedule("metrics", METRICS_INTERVAL, self.write_metrics)
+        self.scheduler.schedule("sweep", SWEEP_INTERVAL, self.sweep_registry)
+        for guild in self.bot.guilds:
+            rate: Optional[float] = await self.config.guild(guild).mass_verify_rate()
+            if rate:
+                log.info(f"Resuming mass verification in {guild.id}.")
+                await self.start_mass_verify(guild, rate)
+        try:
+            await self.set_challenge_store(
+                await self.config.challenge_store(), await self.config.challenge_store_url()
+            )
+        except (OSError, sqlite3.Error, RespError) as error:
+            log.error(f"Could not open the challenge store, keeping them in memory: {error}")
+        self.scheduler.schedule("expiry", EXPIRY_SWEEP_INTERVAL, self.sweep_expired)
 
     async def _build_cache(self) -> None:
-        self._config: Dict[int, Dict[str, Any]] = await self.config.all_guilds()
+        self._pool_watermarks: Tuple[int, int] = (
+            await self.config.pool_low_watermark(),
+            await self.config.pool_high_watermark(),
+        )
+        self._surge_threshold: int = await self.config.surge_threshold()
 
     async def cog_unload(self) -> None:
+        self._unloading: bool = True
         self.task.cancel()
+        for job in self._mass_verify.values():
+            job.stop()
+        self.scheduler.stop()
+        self.admission.stop()
+        await self.cleanup.flush()
+        self.outbound.stop()
+        for pool in self._pools.values():
+            pool.stop()
+        self.executor.shutdown()
+        await self.challenges.close()
         await super().cog_unload()
 
     async def _get_or_fetch_guild(self, guild_id: int) -> Optional[discord.Guild]:
@@ -154,175 +397,315 @@ class Captcha(
                 return guild
 
     async def begin_captcha_flow(self, member: discord.Member, channel: discord.TextChannel):
-
-        self._verification_phase[member.id] = 0
-        self._user_tries[member.id] = []
-
-        message_string = "".join(random.choice(string.ascii_uppercase) for _ in range(6))
-        captcha = CaptchaObj(self, width=300, height=100)
-        captcha.generate(message_string)
-        captcha.write(message_string, f"{str(self.data_path)}/{member.id}.png")
-        captcha_file = discord.File(f"{str(self.data_path)}/{member.id}.png")
-
-        role_before_id: Optional[int] = await self.config.guild(member.guild).role_before_captcha()
+        """
+        Post a join captcha for `member` in `channel`.
+
+        Returns once the captcha is posted, waiting for the answer happens in the background
+        so admission workers are only held for the render and upload.
+        """
+        settings: GuildSettings = await self.guild_settings.get(member.guild.id)
+        deadline: float = time.monotonic() + settings.timeout + DELETE_AFTER
+        self.registry.open(member.id, member.guild.id, deadline).join_flow = True
+        profile: RenderProfile = settings.profile
+        message_string, image = await self._render_challenge(profile)
+        captcha_file = discord.File(BytesIO(image), filename=profile.filename)
+
+        role_before_id: Optional[int] = settings.role_before_captcha
         if role_before_id:
             role_before: Optional[discord.Role] = member.guild.get_role(role_before_id)
             if role_before:
                 try:
-                    await member.add_roles(role_before, reason="Assigned unverified role on join.")
+                    await self.outbound.submit(
+                        Priority.ROLES,
+                        ("roles", member.guild.id),
+                        functools.partial(
+                            member.add_roles,
+                            role_before,
+                            reason="Assigned unverified role on join.",
+                        ),
+                    )
                 except discord.Forbidden:
                     log.warning(f"Could not assign role_before_captcha to {member.id}")
 
-        message_before_captcha = await self.config.guild(member.guild).message_before_captcha()
+        message_before_captcha = settings.message_before_captcha
 
         color: discord.Color = await self.bot.get_embed_color(channel)
 
         text = format_message(message_before_captcha, member)
-        temp_captcha = await channel.send(content=text, file=captcha_file)
+        temp_captcha = await self.send_to(channel, content=text, file=captcha_file)
 
-        self._captchas[member.id] = temp_captcha
-        self._user_tries[member.id].append(temp_captcha)
-
-        timeout: int = await self.config.guild(member.guild).timeout()
+        record: ChallengeRecord = self.registry.open(member.id, member.guild.id, deadline)
+        record.captcha = (channel.id, temp_captcha.id)
+        if not record.join_flow:
+            # The member left while the captcha was being posted.
+            await self.cleanup_messages(member.id)
+            return
 
+        task: asyncio.Task = asyncio.create_task(
+            self._await_captcha_answer(member, channel, message_string, settings)
+        )
+        self._join_flows[member.id] = task
+        task.add_done_callback(functools.partial(self._join_flow_done, member.id))
+
+    def _join_flow_done(self, user_id: int, task: asyncio.Task) -> None:
+        # A rejoin may have started a new flow for the same member.
+        if self._join_flows.get(user_id) is task:
+            del self._join_flows[user_id]
+
+    async def _wait_for_answer(
+        self, channel: discord.TextChannel, member: discord.Member, code: str, timeout: float
+    ) -> discord.Message:
+        """The member's first message in `channel` matching `code`, within `timeout` seconds."""
+        # Routed for the whole wait, answers sent back to back are all read in order.
+        answers: "asyncio.Queue[discord.Message]" = self.router.listen(channel.id, member.id)
+        deadline: float = asyncio.get_running_loop().time() + timeout
         try:
-
-            def check(message: discord.Message) -> bool:
-                return (
-                    message.content.upper() == message_string
-                    and message.author.id == member.id
-                    and message.channel.id == channel.id
+            # Wrong answers are ignored until the deadline, like a `wait_for` check would.
+            while True:
+                message: discord.Message = await asyncio.wait_for(
+                    answers.get(), deadline - asyncio.get_running_loop().time()
                 )
+                if message.content.upper() == code:
+                    return message
+        finally:
+            self.router.remove(channel.id, member.id, answers)
+
+    async def _await_captcha_answer(
+        self,
+        member: discord.Member,
+        channel: discord.TextChannel,
+        message_string: str,
+        settings: GuildSettings,
+    ) -> None:
+        timeout: int = settings.timeout
+        issued_at: float = time.time()
 
-            response_message: discord.Message = await self.bot.wait_for(
-                "message",
-                check=check,
-                timeout=timeout,
+        try:
+            response_message: discord.Message = await self._wait_for_answer(
+                channel, member, message_string, timeout
             )
-
             try:
                 await response_message.delete()
             except discord.HTTPException:
                 pass
 
         except asyncio.TimeoutError:
-            await member.kick(
-                reason=f"{member.id} failed to solve captcha verification in time.",
-            )
-            del self._captchas[member.id]
-            del self._verification_phase[member.id]
-            del self._user_tries[member.id]
+            self.registry.end_join_flow(member.id)
+            self.metrics.outcome(member.guild.id, "expired")
+            try:
+                await self.outbound.submit(
+                    Priority.KICK,
+                    ("kick", member.guild.id),
+                    functools.partial(
+                        member.kick,
+                        reason=f"{member.id} failed to solve captcha verification in time.",
+                    ),
+                    key=("kick", member.guild.id, member.id),
+                )
+            except discord.HTTPException:
+                log.warning(f"Could not kick {member.id} after the captcha timed out.")
         else:
-            del self._verification_phase[member.id]
+            self.registry.end_join_flow(member.id)
+            self.metrics.outcome(member.guild.id, "passed")
+            self.metrics.solve.observe(time.time() - issued_at)
 
-            message_after_captcha = await self.config.guild(member.guild).message_after_captcha()
+            message_after_captcha = settings.message_after_captcha
 
             color: discord.Color = await self.bot.get_embed_color(channel)
 
             text = self.format_message(message_after_captcha, member)
-            temp_success_message = await channel.send(content=text)
-
-            self._user_tries[member.id].append(temp_success_message)
+            temp_success_message = await self.send_to(channel, content=text)
 
-            os.remove(f"{str(self.data_path)}/{member.id}.png")
+            self.track_message(member.id, temp_success_message)
 
-            role_before_id: Optional[int] = await self.config.guild(
-                member.guild
-            ).role_before_captcha()
-            if role_before_id:
-                role_before: Optional[discord.Role] = member.guild.get_role(role_before_id)
-                if role_before:
-                    try:
-                        await member.remove_roles(
-                            role_before, reason="Captcha passed, removing unverified role."
-                        )
-                    except discord.Forbidden:
-                        log.warning(f"Could not remove role_before_captcha from {member.id}")
-
-            role_id: int = await self.config.guild(member.guild).role_after_captcha()
-            role: Optional[discord.Role] = discord.utils.get(member.guild.roles, id=role_id)
-
-            try:
-                await member.add_roles(role, reason=f"Captcha solved by {member.display_name}!")  # type: ignore
-            except (discord.Forbidden, discord.HTTPException):
-                log.exception(f"Failed to add roles to {member.id}.", exc_info=True)
+            await self.apply_verified_roles(
+                member, settings, f"Captcha solved by {member.display_name}!"
+            )
 
+        self.schedule_cleanup(member.id)
+
+    async def apply_verified_roles(
+        self, member: discord.Member, settings: GuildSettings, reason: str
+    ) -> Optional[bool]:
+        """
+        Swap the unverified role for the verified one in a single member edit.
+
+        Returns None when there was nothing to change and False when the edit failed.
+        """
+        before: Optional[int] = settings.role_before_captcha
+        after: Optional[discord.Role] = (
+            member.guild.get_role(settings.role_after_captcha)
+            if settings.role_after_captcha
+            else None
+        )
+        # The first role is always @everyone, which can't be part of an edit.
+        roles: List[discord.Role] = [role for role in member.roles[1:] if role.id != before]
+        if after is not None and after not in roles:
+            roles.append(after)
+        elif len(roles) == len(member.roles) - 1:
+            return None
+
+        start: float = time.perf_counter()
         try:
-            asyncio.create_task(self.cleanup_messages(member.id))
-        except Exception as e:
-            log.exception(f"Failed to schedule cleanup for {member.id}: {e}")
+            await self.outbound.submit(
+                Priority.ROLES,
+                ("roles", member.guild.id),
+                functools.partial(member.edit, roles=roles, reason=reason),
+                key=("roles", member.guild.id, member.id),
+            )
+        except discord.HTTPException as error:
+            log.warning(f"Could not update the roles of {member.id}: {error}")
+            return False
+        finally:
+            self.metrics.role_edit.observe(time.perf_counter() - start)
+        return True
+
+    async def start_mass_verify(
+        self, guild: discord.Guild, rate: float = 2.0
+    ) -> Optional[MassVerifyJob]:
+        """Verify every holder of the unverified role, None if the guild has no such role."""
+        settings: GuildSettings = await self.guild_settings.get(guild.id)
+        role: Optional[discord.Role] = (
+            guild.get_role(settings.role_before_captcha) if settings.role_before_captcha else None
+        )
+        if role is None:
+            return None
+        self.stop_mass_verify(guild.id)
+        job: MassVerifyJob = MassVerifyJob(
+            guild.id,
+            list(role.members),
+            lambda member: self.apply_verified_roles(member, settings, "Mass verification"),
+            rate,
+        )
+        self._mass_verify[guild.id] = job
+        # Remembered until the job finishes or is stopped, so a reload resumes it.
+        await self.guild_settings.set(guild.id, mass_verify_rate=rate)
+        job.task.add_done_callback(functools.partial(self._mass_verify_done, job))
+        return job
+
+    def stop_mass_verify(self, guild_id: int) -> Optional[MassVerifyJob]:
+        job: Optional[MassVerifyJob] = self._mass_verify.get(guild_id)
+        if job is not None:
+            job.stop()
+        return job
+
+    def _mass_verify_done(self, job: MassVerifyJob, task: asyncio.Task) -> None:
+        # Jobs cancelled by an unload keep their rate so they resume on the next load, and
+        # a job replaced by a new one leaves the rate to its successor.
+        replaced: bool = self._mass_verify.get(job.guild_id) is not job
+        if (task.cancelled() and self._unloading) or replaced:
+            return
+        asyncio.create_task(self.guild_settings.set(job.guild_id, mass_verify_rate=None))
 
     async def cleanup_messages(self, member_id: int):
-        await asyncio.sleep(DELETE_AFTER)
-
-        for user_try in self._user_tries.get(member_id, []):
-            try:
-                await user_try.delete()
-            except discord.NotFound:
-                pass
-            except discord.HTTPException as e:
-                log.warning(f"Could not delete message {user_try.id}: {e}")
+        self.cleanup.add(self.registry.take_messages(member_id))
 
-        try:
-            await self._captchas[member_id].delete()
-        except (KeyError, discord.HTTPException):
-            pass
-
-        self._captchas.pop(member_id, None)
-        self._user_tries.pop(member_id, None)
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        if member.bot:
+            return
+        settings: GuildSettings = await self.guild_settings.get(member.guild.id)
+        if not settings.toggle or not settings.join_flow:
+            return
+        if await self.bot.cog_disabled_in_guild(self, member.guild):
+            return
+        channel = member.guild.get_channel(settings.channel)  # type: ignore
+        if not isinstance(channel, discord.TextChannel):
+            return
+        if not self.admission.submit(member, channel):
+            log.warning(
+                f"Join captcha queue of {member.guild.id} is full, {member.id} was not queued."
+            )
+            return
+        # Opened at once so a leave while queued is seen by `on_raw_member_remove`.
+        deadline: float = time.monotonic() + settings.timeout + DELETE_AFTER
+        self.registry.open(member.id, member.guild.id, deadline).join_flow = True
 
     @commands.Cog.listener()
     async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent) -> None:
+        # Runs for every leave the bot sees, most return on these two lookups.
+        if payload.guild_id not in self.guild_settings.enabled:
+            return
         member: Union[discord.Member, discord.User] = payload.user
+        record: Optional[ChallengeRecord] = self.registry.get(member.id)
+        if record is None or not record.join_flow or record.guild_id != payload.guild_id:
+            return
+
         guild: Optional[discord.Guild] = await self._get_or_fetch_guild(payload.guild_id)
         if guild is None:
             return
         if await self.bot.cog_disabled_in_guild_raw(self.__class__.__name__, payload.guild_id):
             return
-        if not await self.config.guild(guild).toggle():
-            return
-
-        if (
-            not guild.me.guild_permissions.kick_members
-            or not guild.me.guild_permissions.manage_roles
-            or not guild.me.guild_permissions.embed_links
-            or not guild.me.guild_permissions.attach_files
-        ):
-            await self.config.guild(guild).toggle.set(False)
+        if not self.has_permissions(guild):
+            await self.guild_settings.set(guild.id, toggle=False)
             log.info("Disabled captcha verification due to missing permissions.")
             return
 
-        if member.id in self._verification_phase:
-            for user_try in self._user_tries[member.id]:
-                await user_try.delete()
-            await self._captchas[member.id].delete()
-            del self._captchas[member.id]
-            try:
-                del self._verification_phase[member.id]
-            except KeyError:
-                pass
-            os.remove(f"{str(self.data_path)}/{member.id}.png")
-            del self._user_tries[member.id]
+        self.admission.discard(guild.id, member.id)
+        # Stops the wait before its timeout kicks a member who is already gone.
+        task: Optional[asyncio.Task] = self._join_flows.pop(member.id, None)
+        if task is not None:
+            task.cancel()
+        if record.captcha is not None:
+            self.router.remove(record.captcha[0], member.id)
+        await self.pop_active_challenge(member.id)
+        if self.registry.end_join_flow(member.id):
+            self.scheduler.cancel(("cleanup", member.id))
+            await self.cleanup_messages(member.id)
+
+    def has_permissions(self, guild: discord.Guild) -> bool:
+        """Whether the bot has `REQUIRED_PERMISSIONS`, cached until its roles change."""
+        permitted: Optional[bool] = self._permitted.get(guild.id)
+        if permitted is None:
+            permitted: bool = guild.me.guild_permissions >= REQUIRED_PERMISSIONS
+            self._permitted[guild.id] = permitted
+        return permitted
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        if before.permissions != after.permissions:
+            self._permitted.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        self._permitted.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        if after.id == self.bot.user.id and before.roles != after.roles:
+            self._permitted.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild) -> None:
+        self._permitted.pop(after.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self._permitted.pop(guild.id, None)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message) -> None:
-        if message.guild is not None or message.author.bot:
+        if message.author.bot:
             return
-
-        challenge = self._active_challenges.get(message.author.id)
+        if await self.router.dispatch(message) or message.guild is not None:
+            return
+        # DM answers to challenges issued by another process or before a reload have no route.
+        challenge: Optional[Dict[str, Any]] = await self.challenges.get(message.author.id)
+        if challenge is not None and challenge["mode"] == "image":
+            await self._on_dm_answer(message)
+
+    async def _on_dm_answer(self, message: discord.Message) -> None:
+        # Claimed up front so another process can't consume the same code.
+        challenge = await self.pop_active_challenge(message.author.id)
         if not challenge:
+            await self.send_to(
+                message.channel,
+                content="❌ This captcha session has expired. Please start a new verification.",
+            )
             return
 
         code = challenge["code"]
         guild_id = challenge["guild_id"]
-        expires_at = challenge["expires_at"]
-
-        if asyncio.get_event_loop().time() > expires_at:
-            await message.channel.send(
-                "❌ This captcha session has expired. Please start a new verification."
-            )
-            self._active_challenges.pop(message.author.id, None)
-            return
 
         if message.content.strip().upper() == code:
             guild = self.bot.get_guild(guild_id)
@@ -334,84 +717,186 @@ class Captcha(
                     member = await guild.fetch_member(message.author.id)
                 except discord.HTTPException:
                     return
-            await self._on_captcha_success(member, message)
+            await self._on_captcha_success(member, message, challenge)
         else:
-            await self._on_captcha_failure(message.author, message)
-
-        self.cleanup_captcha_image(message.author.id)
-        self._active_challenges.pop(message.author.id, None)
+            await self._on_captcha_failure(message.author, message, guild_id)
 
     def generate_captcha_code(self) -> str:
-        return "".join(random.choice(string.ascii_uppercase) for _ in range(6))
-
-    def save_captcha_image(self, code: str, user_id: int) -> str:
-        path = os.path.join(str(self.data_path), f"{user_id}.png")
-        captcha = CaptchaObj(self, width=300, height=100)
-        captcha.write(code, path)
-        return path
-
-    async def _expire_challenge(self, user_id: int, timeout: int):
-        await asyncio.sleep(timeout)
-        challenge = self._active_challenges.pop(user_id, None)
+        return "".join(secrets.choice(string.ascii_uppercase) for _ in range(6))
+
+    def generate_grid_challenge(self) -> Tuple[List[str], List[str]]:
+        """Shuffled grid symbols and the order they have to be pressed in."""
+        rng: secrets.SystemRandom = secrets.SystemRandom()
+        symbols: List[str] = rng.sample(GRID_SYMBOLS, GRID_SIZE)
+        return symbols, rng.sample(symbols, GRID_SEQUENCE)
+
+    def challenge_mode(self, settings: GuildSettings) -> Literal["image", "grid"]:
+        """Grid when the guild asks for it, or while too many challenges are pending."""
+        if settings.challenge == "grid":
+            return "grid"
+        if 0 < self._surge_threshold <= len(self.challenges):
+            return "grid"
+        return "image"
+
+    def set_render_backend(
+        self, backend: Backend, workers: Optional[int] = None, timeout: float = 2.5
+    ) -> None:
+        old: RenderExecutor = self.executor
+        if (old.backend, old.timeout) == (backend, timeout) and workers in (None, old.workers):
+            return
+        self.executor: RenderExecutor = RenderExecutor(
+            self.captcha_renderer, backend, workers, timeout, profiles=list(self._pools)
+        )
+        old.shutdown()
+
+    async def set_challenge_store(self, backend: StoreBackend, url: Optional[str] = None) -> None:
+        """Open the new store before closing the old one, pending challenges are not moved."""
+        store: ChallengeStore = create_store(backend, url, cog_data_path(self))
+        await store.open()
+        old: ChallengeStore = self.challenges
+        self.challenges: ChallengeStore = store
+        await old.close()
+
+    def metrics_path(self) -> Path:
+        return cog_data_path(self) / "metrics.prom"
+
+    async def sweep_expired(self) -> None:
+        """
+        Expire due challenges found in the store, and rearm.
+
+        Deadlines of this process's challenges are in the scheduler, this finds the ones
+        issued by another process or before a reload. Claims are atomic, so only one
+        process sends each expiry notice.
+        """
+        self.scheduler.schedule("expiry", EXPIRY_SWEEP_INTERVAL, self.sweep_expired)
+        try:
+            # Stores keep challenges `EXPIRY_GRACE` seconds past their deadline.
+            due: List[int] = await self.challenges.due(time.time() + EXPIRY_GRACE)
+        except (OSError, sqlite3.Error, RespError) as error:
+            log.warning(f"Could not check the challenge store for expired challenges: {error}")
+            return
+        for user_id in due:
+            if ("expire", user_id) not in self.scheduler:
+                await self._expire_challenge(user_id)
+
+    async def write_metrics(self) -> None:
+        """Write the Prometheus file, for a node exporter's textfile collector, and rearm."""
+        self.scheduler.schedule("metrics", METRICS_INTERVAL, self.write_metrics)
+        text: str = self.metrics.exposition(
+            [
+                ("captcha_pending_challenges", "Pending challenges.", len(self.challenges)),
+                ("captcha_load_tier", "Complexity tier, 0 is full.", self.shedder.level),
+                (
+                    "captcha_admission_in_flight",
+                    "Join captchas starting.",
+                    self.admission.in_flight,
+                ),
+            ]
+        )
+        path: Path = self.metrics_path()
+        # Written next to the target and renamed over it, so readers never see half a file.
+        partial: Path = path.with_suffix(".prom.tmp")
+        try:
+            await asyncio.to_thread(partial.write_text, text)
+            await asyncio.to_thread(os.replace, partial, path)
+        except OSError as error:
+            log.warning(f"Could not write captcha metrics: {error}")
+
+    async def get_profile(self, guild: discord.Guild) -> RenderProfile:
+        return (await self.guild_settings.get(guild.id)).profile
+
+    async def _render_challenge(
+        self, profile: RenderProfile, code: Optional[str] = None
+    ) -> Challenge:
+        code: str = code or self.generate_captcha_code()
+        start: float = time.perf_counter()
+        image: bytes = await self.executor.render(code, self.shedder.apply(profile))
+        elapsed: float = time.perf_counter() - start
+        self.shedder.render.record(elapsed)
+        self.metrics.render.observe(elapsed)
+        self.metrics.image_bytes.observe(len(image))
+        return code, image
+
+    async def _render_challenges(self, profile: RenderProfile, count: int) -> List[Challenge]:
+        codes: List[str] = [self.generate_captcha_code() for _ in range(count)]
+        start: float = time.perf_counter()
+        images: List[bytes] = await self.executor.render_many(codes, self.shedder.apply(profile))
+        elapsed: float = time.perf_counter() - start
+        self.shedder.render.record(elapsed)
+        for image in images:
+            self.metrics.render.observe(elapsed / count)
+            self.metrics.image_bytes.observe(len(image))
+        return list(zip(codes, images))
+
+    def get_pool(self, profile: RenderProfile) -> ChallengePool:
+        pool: Optional[ChallengePool] = self._pools.get(profile)
+        if pool is None:
+            low, high = self._pool_watermarks
+            pool: ChallengePool = ChallengePool(
+                functools.partial(self._render_challenges, profile), low=low, high=high
+            )
+            pool.start()
+            self._pools[profile] = pool
+        return pool
+
+    def resize_pools(self, low: int, high: int) -> None:
+        self._pool_watermarks: Tuple[int, int] = (low, high)
+        for pool in self._pools.values():
+            pool.resize(low, high)
+
+    async def get_challenge(self, profile: RenderProfile) -> Challenge:
+        challenge: Optional[Challenge] = self.get_pool(profile).pop()
+        if challenge is None:
+            challenge: Challenge = await self._render_challenge(profile)
+        return challenge
+
+    async def _expire_challenge(self, user_id: int):
+        challenge = await self.pop_active_challenge(user_id)
         if challenge:
+            self.metrics.outcome(challenge["guild_id"], "expired")
             user = self.bot.get_user(user_id)
             if user:
                 try:
-                    msg = await user.send(
-                        "❌ Time expired for captcha verification. Please try again later."
+                    msg = await self.send_to(
+                        user,
+                        content="❌ Time expired for captcha verification. Please try again later.",
                     )
-                    self._user_tries.setdefault(user_id, []).append(msg)
+                    self.track_message(user_id, msg)
                 except discord.Forbidden:
                     pass
-            try:
-                asyncio.create_task(self.cleanup_messages(user_id))
-            except Exception as e:
-                log.exception(f"Failed to schedule cleanup for expired challenge {user_id}: {e}")
-
-    def cleanup_captcha_image(self, user_id: int):
-        path = os.path.join(str(self.data_path), f"{user_id}.png")
-        if os.path.exists(path):
-            os.remove(path)
+        self.schedule_cleanup(user_id)
 
     async def _on_captcha_failure(
-        self, member: discord.abc.User, source: discord.Interaction | discord.Message
+        self,
+        member: discord.abc.User,
+        source: discord.Interaction | discord.Message,
+        guild_id: Optional[int] = None,
     ):
+        if guild_id is not None:
+            self.metrics.outcome(guild_id, "failed")
         text = "❌ Incorrect captcha. Please try again or contact an admin."
         if isinstance(source, discord.Interaction):
             if source.response.is_done():
-                msg = await source.followup.send(text, ephemeral=True)
-                self._user_tries.setdefault(member.id, []).append(msg)
+                await source.followup.send(text, ephemeral=True)
             else:
-                msg = await source.response.send_message(text, ephemeral=True)
-                self._user_tries.setdefault(member.id, []).append(msg)
+                await source.response.send_message(text, ephemeral=True)
         else:
-            await source.channel.send(text)
-        asyncio.create_task(self.cleanup_messages(member.id))
+            self.track_message(member.id, await self.send_to(source.channel, content=text))
+        self.schedule_cleanup(member.id)
 
     async def _on_captcha_success(
-        self, member: discord.Member, source: discord.Interaction | discord.Message
+        self,
+        member: discord.Member,
+        source: discord.Interaction | discord.Message,
+        challenge: Optional[Dict[str, Any]] = None,
     ):
-        # Remove unverified role
-        unverified_id = await self.config.guild(member.guild).role_before_captcha()
-        unverified = member.guild.get_role(unverified_id) if unverified_id else None
-        if unverified:
-            try:
-                await member.remove_roles(
-                    unverified, reason="Captcha passed - removing unverified role"
-                )
-            except discord.Forbidden:
-                pass
-
-        # Add verified role
-        role_id = await self.config.guild(member.guild).role_after_captcha()
-        role = member.guild.get_role(role_id) if role_id else None
-        if role:
-            try:
-                await member.add_roles(role, reason="Captcha passed")
-            except discord.Forbidden:
-                pass
+        self.metrics.outcome(member.guild.id, "passed")
+        if challenge is not None and "issued_at" in challenge:
+            self.metrics.solve.observe(time.time() - challenge["issued_at"])
+        settings: GuildSettings = await self.guild_settings.get(member.guild.id)
+        await self.apply_verified_roles(member, settings, "Captcha passed")
 
-        message_after = await self.config.guild(member.guild).message_after_captcha()
+        message_after = settings.message_after_captcha
         text = self.format_message(message_after, member)
 
         if isinstance(source, discord.Interaction):
@@ -420,10 +905,5 @@ class Captcha(
             else:
                 await source.response.send_message(text, ephemeral=True)
         else:
-            msg = await source.channel.send(text)
-            self._user_tries.setdefault(member.id, []).append(msg)
-        try:
-            asyncio.create_task(self.cleanup_messages(member.id))
-        except Exception as e:
-            log.exception(f"Failed to schedule cleanup for {member.id}: {e}")
-        asyncio.create_task(self.cleanup_messages(member.id))
+            self.track_message(member.id, await self.send_to(source.channel, content=text))
+        self.schedule_cleanup(member.id)
@@ -0,0 +1,112 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, Final, NamedTuple, Optional, Tuple
+
+from PIL import features
+from PIL.Image import Image, Quantize
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    seconds: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """A named way of turning a rendered captcha into the bytes uploaded to Discord."""
+
+    name: str
+    format: str
+    extension: str
+    description: str
+    params: Tuple[Tuple[str, Any], ...] = ()
+    colors: Optional[int] = None
+    lossy: bool = False
+
+    @property
+    def available(self) -> bool:
+        return self.format != "WEBP" or bool(features.check("webp"))
+
+    def encode(
+        self, image: Image, quality: int = 80, buffer: Optional[BytesIO] = None
+    ) -> EncodedImage:
+        """Encode `image`, writing into `buffer` when given so batches reuse one allocation."""
+        start: float = time.perf_counter()
+        if self.colors is not None:
+            image: Image = image.quantize(self.colors, method=Quantize.FASTOCTREE)
+        params: Dict[str, Any] = dict(self.params)
+        if self.lossy:
+            params["quality"] = quality
+        if buffer is None:
+            buffer: BytesIO = BytesIO()
+        else:
+            buffer.seek(0)
+            buffer.truncate()
+        image.save(buffer, format=self.format, **params)
+        return EncodedImage(buffer.getvalue(), time.perf_counter() - start)
+
+
+ENCODINGS: Final[Dict[str, EncodingProfile]] = {
+    profile.name: profile
+    for profile in (
+        EncodingProfile("png", "PNG", "png", "RGB PNG at the default compress level."),
+        EncodingProfile(
+            "png-fast",
+            "PNG",
+            "png",
+            "RGB PNG at compress level 1, fastest to encode but the largest upload.",
+            params=(("compress_level", 1),),
+        ),
+        EncodingProfile(
+            "png-palette",
+            "PNG",
+            "png",
+            "16 colour palette PNG, a fraction of the RGB size.",
+            colors=16,
+        ),
+        EncodingProfile(
+            "webp-lossless",
+            "WEBP",
+            "webp",
+            "Lossless WebP at the fastest method.",
+            params=(("lossless", True), ("method", 0), ("quality", 50)),
+        ),
+        EncodingProfile(
+            "webp",
+            "WEBP",
+            "webp",
+            "Lossy WebP at the configured quality, the smallest upload.",
+            params=(("method", 0),),
+            lossy=True,
+        ),
+    )
+}
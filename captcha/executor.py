@@ -0,0 +1,167 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import astuple
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Final,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeAlias,
+    TypeVar,
+)
+
+from .objects import Seed
+from .renderer import CaptchaRenderer, RenderProfile
+
+Backend: TypeAlias = Literal["inline", "thread", "process"]
+
+BACKENDS: Final[Tuple[str, ...]] = ("inline", "thread", "process")
+
+T = TypeVar("T")
+
+_renderer: Optional[CaptchaRenderer] = None
+
+
+def initialize_worker(
+    fonts: List[str],
+    profiles: Iterable[RenderProfile] = (),
+    renderer: Optional[CaptchaRenderer] = None,
+    seed: Seed = None,
+) -> None:
+    """Set up the renderer used by `render_captcha` in this process and warm its fonts."""
+    global _renderer
+    if renderer is None:
+        # Give every worker process its own stream so seeded workers don't repeat each other.
+        if seed is not None:
+            seed = f"{seed}:{multiprocessing.current_process().name}"
+        renderer = CaptchaRenderer(map(Path, fonts), seed)
+        renderer.warm(profiles)
+    _renderer = renderer
+
+
+def render_captcha(chars: str, profile: RenderProfile) -> bytes:
+    return _renderer.render(chars, profile)  # type: ignore
+
+
+def render_captchas(codes: List[str], profile: RenderProfile) -> List[bytes]:
+    return _renderer.render_many(codes, profile)  # type: ignore
+
+
+def _bootstrap(fonts: List[str], profiles: List[RenderProfile], seed: Seed) -> str:
+    # Red imports cogs from their spec, so the cog folder isn't on sys.path of a spawned worker.
+    path: str = str(Path(__file__).parents[1])
+    values: List[Tuple[Any, ...]] = [astuple(profile) for profile in profiles]
+    return (
+        "import importlib, sys\n"
+        f"sys.path.insert(0, {path!r})\n"
+        f"module = importlib.import_module({__name__!r})\n"
+        f"profiles = [module.RenderProfile(*value) for value in {values!r}]\n"
+        f"module.initialize_worker({fonts!r}, profiles, seed={seed!r})\n"
+        f"sys.path.remove({path!r})\n"
+    )
+
+
+class RenderExecutor:
+    """
+    Runs captcha renders on the configured backend.
+
+    `inline` renders on the event loop, `thread` in a thread pool sharing the cog's
+    renderer and `process` in a spawned process pool where every worker builds its
+    own renderer and warms the fonts of the known profiles up front. At most `workers`
+    renders run at once, renders waiting longer than `timeout` seconds for a slot
+    raise `asyncio.TimeoutError`.
+    """
+
+    def __init__(
+        self,
+        renderer: CaptchaRenderer,
+        backend: Backend = "thread",
+        workers: Optional[int] = None,
+        timeout: float = 10.0,
+        profiles: Iterable[RenderProfile] = (),
+    ) -> None:
+        self.backend: Backend = backend
+        self.workers: int = (1 if backend == "inline" else workers) or os.cpu_count() or 1
+        self.timeout: float = timeout
+
+        self.queued: int = 0
+        self.rendered: int = 0
+        self.timeouts: int = 0
+
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(self.workers)
+        self._executor: Optional[Executor] = None
+        if backend == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="captcha")
+        elif backend == "process":
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=exec,
+                initargs=(
+                    _bootstrap(list(renderer.fonts.values()), list(profiles), renderer.seed),
+                    {},
+                ),
+            )
+        initialize_worker([], renderer=renderer)
+
+    async def render(self, chars: str, profile: RenderProfile) -> bytes:
+        image: bytes = await self._run(render_captcha, chars, profile)
+        self.rendered += 1
+        return image
+
+    async def render_many(self, codes: List[str], profile: RenderProfile) -> List[bytes]:
+        """Render a batch of challenges in a single slot and worker hand-off."""
+        images: List[bytes] = await self._run(render_captchas, codes, profile)
+        self.rendered += len(images)
+        return images
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.queued -= 1
+        try:
+            if self._executor is None:
+                return func(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._semaphore.release()
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
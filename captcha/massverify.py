@@ -0,0 +1,122 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+import discord
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.massverify")
+
+
+class MassVerifyJob:
+    """
+    Verifies a guild's members one role edit at a time, started at most `rate` times a second.
+
+    Edits start on a fixed cadence with up to `concurrency` in flight, so a slow response
+    doesn't stall the pace and discord.py's own rate limit handling rarely has to step in.
+    Members that no longer need verifying are skipped without a request, so running a job
+    again over the same members picks up where a stopped one left off.
+    """
+
+    def __init__(
+        self,
+        guild_id: int,
+        members: List[discord.Member],
+        verify: Callable[[discord.Member], Awaitable[Optional[bool]]],
+        rate: float = 2.0,
+        concurrency: int = 2,
+    ) -> None:
+        self.guild_id: int = guild_id
+        self.rate: float = rate
+        self.total: int = len(members)
+        self.verified: int = 0
+        self.skipped: int = 0
+        self.failed: int = 0
+        self.started: float = time.monotonic()
+        self.finished: Optional[float] = None
+
+        self._members: List[discord.Member] = members
+        self._verify: Callable[[discord.Member], Awaitable[Optional[bool]]] = verify
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self._edits: Set[asyncio.Task] = set()
+        self.task: asyncio.Task = asyncio.create_task(self._run())
+
+    @property
+    def processed(self) -> int:
+        return self.verified + self.skipped + self.failed
+
+    @property
+    def running(self) -> bool:
+        return not self.task.done()
+
+    def __str__(self) -> str:
+        elapsed: float = (self.finished or time.monotonic()) - self.started
+        text: str = (
+            f"{self.processed}/{self.total} members, {self.verified} verified, "
+            f"{self.skipped} skipped, {self.failed} failed in {elapsed:.0f}s"
+        )
+        if self.running:
+            remaining: float = (self.total - self.processed) / self.rate
+            text += f", about {remaining:.0f}s left at {self.rate:g}/s"
+        return text
+
+    def stop(self) -> None:
+        self.task.cancel()
+
+    async def _edit(self, member: discord.Member) -> None:
+        try:
+            result: Optional[bool] = await self._verify(member)
+        except Exception:
+            log.exception(f"Could not verify {member.id} in {self.guild_id}.")
+            result: Optional[bool] = False
+        finally:
+            self._semaphore.release()
+        if result is None:
+            self.skipped += 1
+        elif result:
+            self.verified += 1
+        else:
+            self.failed += 1
+
+    async def _run(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        interval: float = 1 / self.rate
+        due: float = loop.time()
+        try:
+            for member in self._members:
+                await self._semaphore.acquire()
+                delay: float = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                due: float = max(due, loop.time()) + interval
+                task: asyncio.Task = asyncio.create_task(self._edit(member))
+                self._edits.add(task)
+                task.add_done_callback(self._edits.discard)
+            if self._edits:
+                await asyncio.wait(self._edits)
+        finally:
+            self.finished = time.monotonic()
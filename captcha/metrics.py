@@ -0,0 +1,178 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Final, Iterable, Iterator, List, Literal, Tuple, TypeAlias
+
+Outcome: TypeAlias = Literal["passed", "failed", "expired"]
+
+OUTCOMES: Final[Tuple[str, ...]] = ("passed", "failed", "expired")
+LATENCY_BUCKETS: Final[Tuple[float, ...]] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS: Final[Tuple[float, ...]] = (2048, 4096, 8192, 16384, 32768, 65536, 131072)
+SOLVE_BUCKETS: Final[Tuple[float, ...]] = (2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """Bucket counts since load, plus a ring buffer of the latest samples for percentiles."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...], size: int = 1024):
+        self.name: str = name
+        self.help: str = help
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+        self._recent: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    @property
+    def size(self) -> int:
+        return self._recent.maxlen  # type: ignore
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self._recent.append(value)
+
+    def percentiles(self, *percents: float) -> Tuple[float, ...]:
+        """Percentiles of the recent samples, zeros while there are none."""
+        values: List[float] = sorted(self._recent)
+        if not values:
+            return tuple(0.0 for _ in percents)
+        return tuple(values[min(len(values) - 1, int(len(values) * p / 100))] for p in percents)
+
+    def exposition(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        total: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{bound:g}"}} {total}'
+        yield f'{self.name}_bucket{{le="+Inf"}} {self.count}'
+        yield f"{self.name}_sum {self.sum:.6f}"
+        yield f"{self.name}_count {self.count}"
+
+
+class CaptchaMetrics:
+    """Latency and size histograms, and challenge outcomes per guild."""
+
+    def __init__(self, size: int = 1024) -> None:
+        self.render: Histogram = Histogram(
+            "captcha_render_seconds",
+            "Time to render and encode one captcha.",
+            LATENCY_BUCKETS,
+            size,
+        )
+        self.image_bytes: Histogram = Histogram(
+            "captcha_image_bytes", "Size of the encoded captcha image.", SIZE_BUCKETS, size
+        )
+        self.dm_send: Histogram = Histogram(
+            "captcha_dm_send_seconds", "Time to DM a captcha to a member.", LATENCY_BUCKETS, size
+        )
+        self.response: Histogram = Histogram(
+            "captcha_response_seconds",
+            "Time from pressing Verify to the interaction response.",
+            LATENCY_BUCKETS,
+            size,
+        )
+        self.role_edit: Histogram = Histogram(
+            "captcha_role_edit_seconds",
+            "Time to swap the roles of a verified member.",
+            LATENCY_BUCKETS,
+            size,
+        )
+        self.solve: Histogram = Histogram(
+            "captcha_solve_seconds",
+            "Time from issuing a captcha to a correct answer.",
+            SOLVE_BUCKETS,
+            size,
+        )
+        self.outcomes: Dict[int, List[int]] = {}
+        self.rejected: Dict[str, int] = {"user": 0, "guild": 0}
+        self.resent: int = 0
+        self.started: float = time.time()
+
+    @property
+    def histograms(self) -> Tuple[Histogram, ...]:
+        return (
+            self.render,
+            self.image_bytes,
+            self.dm_send,
+            self.response,
+            self.role_edit,
+            self.solve,
+        )
+
+    def outcome(self, guild_id: int, outcome: Outcome) -> None:
+        counts: List[int] = self.outcomes.setdefault(guild_id, [0] * len(OUTCOMES))
+        counts[OUTCOMES.index(outcome)] += 1
+
+    def totals(self) -> List[int]:
+        return [sum(counts) for counts in zip(*self.outcomes.values())] or [0] * len(OUTCOMES)
+
+    def exposition(self, gauges: Iterable[Tuple[str, str, float]] = ()) -> str:
+        """Everything in the Prometheus text format, `gauges` are (name, help, value)."""
+        lines: List[str] = []
+        for histogram in self.histograms:
+            lines.extend(histogram.exposition())
+        lines.append("# HELP captcha_challenges_total Finished challenges by guild and outcome.")
+        lines.append("# TYPE captcha_challenges_total counter")
+        for guild_id, counts in self.outcomes.items():
+            for outcome, count in zip(OUTCOMES, counts):
+                lines.append(
+                    f'captcha_challenges_total{{guild="{guild_id}",outcome="{outcome}"}} {count}'
+                )
+        lines.append(
+            "# HELP captcha_verify_rejections_total Verify clicks rejected by rate limits."
+        )
+        lines.append("# TYPE captcha_verify_rejections_total counter")
+        for scope, count in self.rejected.items():
+            lines.append(f'captcha_verify_rejections_total{{scope="{scope}"}} {count}')
+        lines.append(
+            "# HELP captcha_verify_resends_total Verify clicks answered with a pending captcha."
+        )
+        lines.append("# TYPE captcha_verify_resends_total counter")
+        lines.append(f"captcha_verify_resends_total {self.resent}")
+        for name, help, value in gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
@@ -24,9 +24,12 @@ SOFTWARE.
 
 # https://github.com/lepture/captcha/blob/master/src/captcha/image.py
 
+import functools
+import itertools
 import random
+import threading
 from io import BytesIO
-from typing import TYPE_CHECKING, List, Optional, Tuple, TypeAlias, Union
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, TypeAlias, Union
 
 from PIL.Image import BILINEAR, QUAD, Image
 from PIL.Image import new as create
@@ -35,9 +38,23 @@ from PIL.ImageFilter import SMOOTH
 from PIL.ImageFont import FreeTypeFont, truetype
 
 if TYPE_CHECKING:
+    from .atlas import GlyphAtlas
     from .core import Captcha
 
 ColorTuple: TypeAlias = Union[Tuple[int, int, int], Tuple[int, int, int, int]]
+Seed: TypeAlias = Optional[Union[int, str]]
+
+
+@functools.lru_cache(maxsize=32)
+def load_font(path: str, size: int) -> FreeTypeFont:
+    """Process-wide LRU cache of fonts keyed by (font path, size)."""
+    return truetype(path, size)
+
+
+@functools.lru_cache(maxsize=512)
+def tint_table(level: int) -> List[int]:
+    """Point table that boosts atlas tile coverage and scales it to `level`."""
+    return [min(255, min(255, index * 4) * level // 255) for index in range(256)]
 
 
 class CaptchaObj:
@@ -45,55 +62,102 @@ class CaptchaObj:
 
     def __init__(
         self,
-        cog: "Captcha",
+        cog: Optional["Captcha"],
         width: int = 160,
         height: int = 60,
         font_sizes: Optional[Tuple[int, ...]] = None,
+        atlas: Optional["GlyphAtlas"] = None,
+        font: Optional[str] = None,
+        noise_dots: int = 30,
+        seed: Seed = None,
+        smooth: bool = True,
     ) -> None:
         super().__init__()
-        self._cog: "Captcha" = cog
+        self._cog: Optional["Captcha"] = cog
 
         self._width: int = width
         self._height: int = height
 
-        self._font: str = cog.font_data
+        self._font: str = font or cog.font_data  # type: ignore
         self._truefonts: List[FreeTypeFont] = []
         self._font_sizes: Optional[Tuple[int, ...]] = font_sizes or (42, 50, 56)
+        self._noise_dots: int = noise_dots
+        self._smoothing: bool = smooth
+
+        # When an atlas is given, glyphs are composited from its cached tiles
+        # instead of being rasterized and warped for every challenge.
+        self._atlas: Optional["GlyphAtlas"] = atlas
+
+        # Every thread rendering with this object draws from its own generator. With a seed,
+        # the n-th thread to render gets the stream "seed:n", so output is reproducible.
+        self._seed: Seed = seed
+        self._streams: Iterator[int] = itertools.count()
+        self._local: threading.local = threading.local()
+
+    @property
+    def random(self) -> random.Random:
+        rng: Optional[random.Random] = getattr(self._local, "random", None)
+        if rng is None:
+            rng: random.Random = random.Random(
+                None if self._seed is None else f"{self._seed}:{next(self._streams)}"
+            )
+            self._local.random = rng
+        return rng
+
+    def _canvas(self, mode: str, size: Tuple[int, int], fill: Union[int, ColorTuple]) -> Image:
+        """
+        Blank image to draw a challenge on. Canvases of the configured size are kept per
+        thread and cleared for the next render instead of being allocated every time.
+        """
+        if size != (self._width, self._height):
+            return create(mode, size, fill)
+        canvases: Optional[Dict[str, Image]] = getattr(self._local, "canvases", None)
+        if canvases is None:
+            canvases: Dict[str, Image] = {}
+            self._local.canvases = canvases
+        canvas: Optional[Image] = canvases.get(mode)
+        if canvas is None:
+            canvas: Image = create(mode, size, fill)
+            canvases[mode] = canvas
+        else:
+            canvas.paste(fill, (0, 0, *size))
+        return canvas
 
     @property
     def truefonts(self) -> List[FreeTypeFont]:
         if self._truefonts:
             return self._truefonts
         self._truefonts: List[FreeTypeFont] = [
-            truetype(str(self._font), size) for size in self._font_sizes  # type: ignore
+            load_font(str(self._font), size) for size in self._font_sizes  # type: ignore
         ]
         return self._truefonts
 
-    @staticmethod
-    def _create_noise_curve(image: Image, color: ColorTuple) -> Image:
+    def _create_noise_curve(self, image: Image, color: ColorTuple) -> Image:
+        rng: random.Random = self.random
         w, h = image.size
-        x1: int = random.randint(0, int(w / 5))
-        x2: int = random.randint(w - int(w / 5), w)
-        y1: int = random.randint(int(h / 5), h - int(h / 5))
-        y2: int = random.randint(y1, h - int(h / 5))
+        x1: int = rng.randint(0, int(w / 5))
+        x2: int = rng.randint(w - int(w / 5), w)
+        y1: int = rng.randint(int(h / 5), h - int(h / 5))
+        y2: int = rng.randint(y1, h - int(h / 5))
         points: List[int] = [x1, y1, x2, y2]
-        end: int = random.randint(160, 200)
-        start: int = random.randint(0, 20)
+        end: int = rng.randint(160, 200)
+        start: int = rng.randint(0, 20)
         Draw(image).arc(points, start, end, fill=color)
         return image
 
-    @staticmethod
     def _create_noise_dots(
+        self,
         image: Image,
         color: ColorTuple,
         width: int = 3,
         number: int = 30,
     ) -> Image:
+        rng: random.Random = self.random
         draw: ImageDraw = Draw(image)
         w, h = image.size
         while number:
-            x1: int = random.randint(0, w)
-            y1: int = random.randint(0, h)
+            x1: int = rng.randint(0, w)
+            y1: int = rng.randint(0, h)
             draw.line(((x1, y1), (x1 - 1, y1 - 1)), fill=color, width=width)
             number -= 1
         return image
@@ -104,23 +168,24 @@ class CaptchaObj:
         draw: ImageDraw,
         color: ColorTuple,
     ) -> Image:
-        font = random.choice(self.truefonts)
+        rng: random.Random = self.random
+        font = rng.choice(self.truefonts)
         _, _, w, h = draw.multiline_textbbox((1, 1), string, font=font)
 
-        dx1: int = random.randint(0, 4)
-        dy1: int = random.randint(0, 6)
+        dx1: int = rng.randint(0, 4)
+        dy1: int = rng.randint(0, 6)
         image: Image = create("RGBA", (w + dx1, h + dy1))
         Draw(image).text((dx1, dy1), string, font=font, fill=color)
 
         image: Image = image.crop(image.getbbox())
-        image: Image = image.rotate(random.uniform(-30, 30), BILINEAR, expand=True)
-
-        dx2: float = w * random.uniform(0.1, 0.3)
-        dy2: float = h * random.uniform(0.2, 0.3)
-        x1: int = int(random.uniform(-dx2, dx2))
-        y1: int = int(random.uniform(-dy2, dy2))
-        x2: int = int(random.uniform(-dx2, dx2))
-        y2: int = int(random.uniform(-dy2, dy2))
+        image: Image = image.rotate(rng.uniform(-30, 30), BILINEAR, expand=True)
+
+        dx2: float = w * rng.uniform(0.1, 0.3)
+        dy2: float = h * rng.uniform(0.2, 0.3)
+        x1: int = int(rng.uniform(-dx2, dx2))
+        y1: int = int(rng.uniform(-dy2, dy2))
+        x2: int = int(rng.uniform(-dx2, dx2))
+        y2: int = int(rng.uniform(-dy2, dy2))
         w2: int = w + abs(x1) + abs(x2)
         h2: int = h + abs(y1) + abs(y2)
         data: Tuple[int, int, int, int, int, int, int, int] = (
@@ -143,19 +208,23 @@ class CaptchaObj:
         color: ColorTuple,
         background: ColorTuple,
     ) -> Image:
-        image: Image = create("RGB", (self._width, self._height), background)
-        draw: ImageDraw = Draw(image)
+        rng: random.Random = self.random
+        # Only used to measure glyphs, so one tiny image per thread is enough.
+        draw: Optional[ImageDraw] = getattr(self._local, "draw", None)
+        if draw is None:
+            draw: ImageDraw = Draw(create("RGB", (1, 1)))
+            self._local.draw = draw
 
         images: List[Image] = []
         for char in chars:
-            if random.random() > 0.5:
+            if rng.random() > 0.5:
                 images.append(self._draw_character(" ", draw, color))
             images.append(self._draw_character(char, draw, color))
 
         text_width: int = sum([im.size[0] for im in images])
 
         width: int = max(text_width, self._width)
-        image: Image = image.resize((width, self._height))
+        image: Image = self._canvas("RGB", (width, self._height), background)
 
         average: int = int(text_width / len(chars))
         rand: int = int(0.25 * average)
@@ -165,7 +234,48 @@ class CaptchaObj:
             w, h = img.size
             mask: Image = img.convert("L").point(self.lookup_table)
             image.paste(img, (offset, int((self._height - h) / 2)), mask)
-            offset: int = offset + w + random.randint(-rand, 0)
+            offset: int = offset + w + rng.randint(-rand, 0)
+
+        if width > self._width:
+            image: Image = image.resize((self._width, self._height))
+
+        return image
+
+    def _create_atlas_image(
+        self,
+        chars: str,
+        color: ColorTuple,
+        background: ColorTuple,
+    ) -> Image:
+        rng: random.Random = self.random
+        atlas: "GlyphAtlas" = self._atlas  # type: ignore
+
+        tiles: List[Image] = []
+        for char in chars:
+            if rng.random() > 0.5:
+                tiles.append(atlas.pick(" ", rng, self._font_sizes))
+            tiles.append(atlas.pick(char, rng, self._font_sizes))
+
+        text_width: int = sum([tile.size[0] for tile in tiles])
+
+        width: int = max(text_width, self._width)
+        image: Image = self._canvas("RGB", (width, self._height), background)
+
+        average: int = int(text_width / len(chars))
+        rand: int = int(0.25 * average)
+        offset: int = int(average * 0.1)
+        jitter: int = int(0.05 * self._height)
+
+        # Tiles are anti-aliased coverage masks. The classic path keeps the full colour on every
+        # touched pixel, so boost the coverage before scaling it like the lookup table does.
+        level: int = self.lookup_table[int(0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2])]
+        tint: List[int] = tint_table(level)
+
+        for tile in tiles:
+            w, h = tile.size
+            y: int = int((self._height - h) / 2) + rng.randint(-jitter, jitter)
+            image.paste(color[:3], (offset, y), tile.point(tint))
+            offset: int = offset + w + rng.randint(-rand, 0)
 
         if width > self._width:
             image: Image = image.resize((self._width, self._height))
@@ -173,14 +283,29 @@ class CaptchaObj:
         return image
 
     def _generate(self, chars: str) -> Image:
-        background: ColorTuple = random_color(238, 255)
-        color: ColorTuple = random_color(10, 200, random.randint(220, 255))
-        image: Image = self._create_captcha_image(chars, color, background)
-        self._create_noise_dots(image, color)
+        rng: random.Random = self.random
+        background: ColorTuple = random_color(238, 255, rng=rng)
+        color: ColorTuple = random_color(10, 200, rng.randint(220, 255), rng=rng)
+        if self._atlas is not None:
+            image: Image = self._create_atlas_image(chars, color, background)
+        else:
+            image: Image = self._create_captcha_image(chars, color, background)
+        self._create_noise_dots(image, color, number=self._noise_dots)
         self._create_noise_curve(image, color)
-        image: Image = image.filter(SMOOTH)
+        if self._smoothing:
+            image: Image = image.filter(SMOOTH)
+        else:
+            # The canvas is reused by the next render, so hand out a copy.
+            image: Image = image.copy()
         return image
 
+    def generate_image(self, chars: str) -> Image:
+        return self._generate(chars)
+
+    def generate_many(self, codes: Iterable[str]) -> List[Image]:
+        """Render one image per code, sharing this thread's fonts, tables and canvases."""
+        return [self._generate(chars) for chars in codes]
+
     def generate(self, chars: str, format: str = "png") -> BytesIO:
         image: Image = self._generate(chars)
         byte: BytesIO = BytesIO()
@@ -197,10 +322,12 @@ def random_color(
     start: int,
     end: int,
     opacity: Optional[int] = None,
+    rng: Optional[random.Random] = None,
 ) -> ColorTuple:
-    red: int = random.randint(start, end)
-    green: int = random.randint(start, end)
-    blue: int = random.randint(start, end)
+    randint = random.randint if rng is None else rng.randint
+    red: int = randint(start, end)
+    green: int = randint(start, end)
+    blue: int = randint(start, end)
     if opacity is None:
         return (red, green, blue)
     return (red, green, blue, opacity)
@@ -0,0 +1,253 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, Final, Hashable, Optional
+
+import discord
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.outbound")
+
+
+class Priority(IntEnum):
+    """Outbound request classes, lower values are sent first."""
+
+    RESPONSE = 0
+    ROLES = 1
+    KICK = 2
+    CLEANUP = 3
+
+
+# Minimum seconds between two requests of one bucket, before any backoff.
+PACING: Final[Dict[Priority, float]] = {
+    Priority.RESPONSE: 0.0,
+    Priority.ROLES: 0.1,
+    Priority.KICK: 0.5,
+    Priority.CLEANUP: 1.0,
+}
+
+
+class Action:
+    __slots__ = ("func", "args", "key", "future")
+
+    def __init__(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        args: tuple,
+        key: Optional[Hashable],
+        future: asyncio.Future,
+    ) -> None:
+        self.func: Callable[..., Awaitable[Any]] = func
+        self.args: tuple = args
+        self.key: Optional[Hashable] = key
+        self.future: asyncio.Future = future
+
+
+class Bucket:
+    __slots__ = ("priority", "actions", "ready_at", "interval", "busy")
+
+    def __init__(self, priority: Priority) -> None:
+        self.priority: Priority = priority
+        self.actions: Deque[Action] = deque()
+        self.ready_at: float = 0.0
+        self.interval: float = PACING[priority]
+        self.busy: bool = False
+
+
+class OutboundQueue:
+    """
+    Sends the cog's Discord requests in priority order, one bucket at a time.
+
+    A bucket groups requests that share a Discord rate limit, such as the role edits
+    of one guild, and runs one request at a time spaced by its class's `PACING`. A
+    bucket whose request was rate limited, or took over `slow` seconds because
+    discord.py waited one out, doubles its spacing up to `max_backoff` and halves it
+    again on each quick success. `RESPONSE` requests start at once, other classes
+    share `concurrency` slots, cleanup only gets half of them and waits while any
+    more important request is queued. Requests submitted with the key of a queued
+    one replace its arguments and share its result, so keys name everything the
+    request targets: a member's roles in one guild are not their roles in another.
+
+    Interaction responses don't go through here: each interaction has its own
+    webhook bucket and a three second deadline, so queueing could only delay them.
+    """
+
+    def __init__(self, concurrency: int = 8, slow: float = 1.0, max_backoff: float = 10.0) -> None:
+        self._buckets: Dict[Hashable, Bucket] = {}
+        # Buckets with queued actions per class, in round-robin order.
+        self._waiting: Dict[Priority, Dict[Hashable, Bucket]] = {p: {} for p in Priority}
+        self._pending: Dict[Hashable, Action] = {}
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.concurrency: int = concurrency
+        self.slow: float = slow
+        self.max_backoff: float = max_backoff
+        self.queued: int = 0
+        self.in_flight: int = 0
+        self.sent: int = 0
+        self.coalesced: int = 0
+        self.failed: int = 0
+        self.backoffs: int = 0
+
+    def __len__(self) -> int:
+        return self.queued
+
+    def __str__(self) -> str:
+        return (
+            f"{self.queued} queued, {self.in_flight} in flight, {self.sent} sent, "
+            f"{self.coalesced} coalesced, {self.failed} failed, {self.backoffs} backoffs"
+        )
+
+    def waiting(self, priority: Priority) -> int:
+        return sum(len(bucket.actions) for bucket in self._waiting[priority].values())
+
+    def submit(
+        self,
+        priority: Priority,
+        bucket: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        """Queue `func(*args)` and return a future for its result."""
+        if key is not None:
+            action: Optional[Action] = self._pending.get(key)
+            if action is not None:
+                action.func, action.args = func, args
+                self.coalesced += 1
+                return action.future
+
+        queue: Optional[Bucket] = self._buckets.get(bucket)
+        if queue is None:
+            queue: Bucket = self._buckets.setdefault(bucket, Bucket(priority))
+        action: Action = Action(func, args, key, asyncio.get_running_loop().create_future())
+        queue.actions.append(action)
+        self._waiting[queue.priority].setdefault(bucket, queue)
+        if key is not None:
+            self._pending[key] = action
+        self.queued += 1
+
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return action.future
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for bucket in self._buckets.values():
+            for action in bucket.actions:
+                action.future.cancel()
+        self._buckets.clear()
+        self._pending.clear()
+        for waiting in self._waiting.values():
+            waiting.clear()
+        self.queued = 0
+
+    def _limit(self, priority: Priority) -> int:
+        if priority == Priority.CLEANUP:
+            return max(1, self.concurrency // 2)
+        return self.concurrency
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Start every action that may start now, and return when the next may."""
+        delay: Optional[float] = None
+        ahead: bool = False
+        for priority in Priority:
+            waiting: Dict[Hashable, Bucket] = self._waiting[priority]
+            if priority == Priority.CLEANUP and ahead:
+                break
+            for key, bucket in list(waiting.items()):
+                if bucket.busy:
+                    continue
+                if bucket.ready_at > now:
+                    wait: float = bucket.ready_at - now
+                    delay: Optional[float] = wait if delay is None else min(delay, wait)
+                    continue
+                if priority != Priority.RESPONSE and self.in_flight >= self._limit(priority):
+                    break
+                self._start(key, bucket)
+            ahead: bool = ahead or bool(waiting)
+        return delay
+
+    def _start(self, key: Hashable, bucket: Bucket) -> None:
+        action: Action = bucket.actions.popleft()
+        waiting: Dict[Hashable, Bucket] = self._waiting[bucket.priority]
+        # Move the bucket to the back so busy buckets don't starve the others.
+        del waiting[key]
+        if bucket.actions:
+            waiting[key] = bucket
+        if action.key is not None:
+            del self._pending[action.key]
+        self.queued -= 1
+        self.in_flight += 1
+        bucket.busy = True
+        asyncio.create_task(self._send(key, bucket, action))
+
+    async def _send(self, key: Hashable, bucket: Bucket, action: Action) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        start: float = loop.time()
+        limited: bool = False
+        try:
+            result: Any = await action.func(*action.args)
+        except Exception as error:
+            limited: bool = isinstance(error, discord.HTTPException) and error.status == 429
+            self.failed += 1
+            if not action.future.done():
+                action.future.set_exception(error)
+        else:
+            limited: bool = loop.time() - start > self.slow
+            self.sent += 1
+            if not action.future.done():
+                action.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            bucket.busy = False
+
+        base: float = PACING[bucket.priority]
+        if limited:
+            self.backoffs += 1
+            bucket.interval = min(self.max_backoff, max(0.5, bucket.interval * 2))
+        else:
+            bucket.interval = max(base, bucket.interval / 2 if bucket.interval > 0.05 else base)
+        bucket.ready_at = loop.time() + bucket.interval
+        # Idle buckets are dropped, only queued work needs its pacing remembered.
+        if not bucket.actions:
+            self._buckets.pop(key, None)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            delay: Optional[float] = self._dispatch(loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,114 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Final, List, Optional, Tuple, TypeAlias
+
+Challenge: TypeAlias = Tuple[str, bytes]
+
+RETRY_AFTER: Final[int] = 5
+BATCH_SIZE: Final[int] = 8
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.pool")
+
+
+class ChallengePool:
+    """
+    Bounded pool of ready (code, encoded image) pairs.
+
+    A background task refills the pool up to `high` whenever it drops below `low`,
+    so `pop` never has to render anything itself. `render(count)` is asked for up
+    to `batch` challenges at a time so setup cost is shared across a batch.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[int], Awaitable[List[Challenge]]],
+        low: int = 8,
+        high: int = 32,
+        batch: int = BATCH_SIZE,
+    ) -> None:
+        self._render: Callable[[int], Awaitable[List[Challenge]]] = render
+        self._challenges: Deque[Challenge] = deque()
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.low: int = low
+        self.high: int = high
+        self.batch: int = batch
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._challenges)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._produce())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._challenges.clear()
+
+    def resize(self, low: int, high: int) -> None:
+        self.low, self.high = low, high
+        while len(self._challenges) > high:
+            self._challenges.pop()
+        self._wakeup.set()
+
+    def pop(self) -> Optional[Challenge]:
+        try:
+            challenge: Optional[Challenge] = self._challenges.popleft()
+        except IndexError:
+            challenge: Optional[Challenge] = None
+            self.misses += 1
+        else:
+            self.hits += 1
+        if len(self._challenges) < self.low:
+            self._wakeup.set()
+        return challenge
+
+    async def _produce(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while len(self._challenges) < self.high:
+                try:
+                    challenges: List[Challenge] = await self._render(
+                        min(self.batch, self.high - len(self._challenges))
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("Failed to pre-generate a captcha challenge.", exc_info=True)
+                    await asyncio.sleep(RETRY_AFTER)
+                    continue
+                self._challenges.extend(challenges)
+                # Give other tasks a turn between batches.
+                await asyncio.sleep(0)
@@ -0,0 +1,210 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Final, Iterator, List, Optional, Tuple, TypeAlias
+
+import discord
+
+# (channel id, message id) of a message to clean up later.
+MessageRef: TypeAlias = Tuple[int, int]
+# Code, encoded image and filename of an issued image challenge.
+IssuedImage: TypeAlias = Tuple[str, bytes, str]
+
+MAX_TRACKED_MESSAGES: Final[int] = 8
+MAX_CACHED_IMAGES: Final[int] = 256
+
+
+class ChallengeRecord:
+    """What this process tracks about one user's captcha, as IDs and a deadline."""
+
+    __slots__ = (
+        "user_id",
+        "guild_id",
+        "deadline",
+        "join_flow",
+        "dm_channel_id",
+        "captcha",
+        "messages",
+    )
+
+    def __init__(self, user_id: int, guild_id: Optional[int], deadline: float) -> None:
+        self.user_id: int = user_id
+        self.guild_id: Optional[int] = guild_id
+        self.deadline: float = deadline
+        self.join_flow: bool = False
+        self.dm_channel_id: Optional[int] = None
+        self.captcha: Optional[MessageRef] = None
+        self.messages: List[MessageRef] = []
+
+    @property
+    def idle(self) -> bool:
+        return (
+            not self.join_flow
+            and self.dm_channel_id is None
+            and self.captcha is None
+            and not self.messages
+        )
+
+    def refs(self) -> List[MessageRef]:
+        return self.messages if self.captcha is None else [*self.messages, self.captcha]
+
+    def footprint(self) -> int:
+        size: int = sys.getsizeof(self) + sys.getsizeof(self.messages)
+        for ref in self.refs():
+            size += sys.getsizeof(ref) + sum(sys.getsizeof(part) for part in ref)
+        return size
+
+
+class ChallengeRegistry:
+    """
+    Per-user records of pending captchas, replacing parallel dicts of message objects.
+
+    A record only lives while something refers to it: a join flow, an answer route
+    or messages waiting to be cleaned up. At most
+    `MAX_TRACKED_MESSAGES` messages are kept per user, older ones are handed back to
+    be deleted right away, so a record's size doesn't depend on how often a user fails.
+    """
+
+    def __init__(self) -> None:
+        self._records: Dict[int, ChallengeRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._records
+
+    def __iter__(self) -> Iterator[ChallengeRecord]:
+        return iter(list(self._records.values()))
+
+    def get(self, user_id: int) -> Optional[ChallengeRecord]:
+        return self._records.get(user_id)
+
+    def open(self, user_id: int, guild_id: Optional[int], deadline: float) -> ChallengeRecord:
+        record: Optional[ChallengeRecord] = self._records.get(user_id)
+        if record is None:
+            record: ChallengeRecord = ChallengeRecord(user_id, guild_id, deadline)
+            self._records[user_id] = record
+        else:
+            record.guild_id = guild_id or record.guild_id
+            record.deadline = max(record.deadline, deadline)
+        return record
+
+    def track(self, user_id: int, message: Any, deadline: float) -> Optional[MessageRef]:
+        """Remember a message to clean up, and return one that no longer fits, if any."""
+        # Interaction responses and ephemeral messages go away on their own.
+        if not isinstance(message, discord.Message) or message.flags.ephemeral:
+            return None
+        record: ChallengeRecord = self.open(user_id, None, deadline)
+        record.messages.append((message.channel.id, message.id))
+        if len(record.messages) > MAX_TRACKED_MESSAGES:
+            return record.messages.pop(0)
+        return None
+
+    def end_join_flow(self, user_id: int) -> bool:
+        """Mark the user's join flow as over, and return whether one was running."""
+        record: Optional[ChallengeRecord] = self._records.get(user_id)
+        if record is None or not record.join_flow:
+            return False
+        record.join_flow = False
+        return True
+
+    def take_messages(self, user_id: int) -> List[MessageRef]:
+        record: Optional[ChallengeRecord] = self._records.get(user_id)
+        if record is None:
+            return []
+        refs: List[MessageRef] = record.refs()
+        record.captcha, record.messages = None, []
+        self.release(user_id)
+        return refs
+
+    def release(self, user_id: int) -> None:
+        """Drop the user's record once nothing refers to it anymore."""
+        record: Optional[ChallengeRecord] = self._records.get(user_id)
+        if record is not None and record.idle:
+            del self._records[user_id]
+
+    def overdue(self, now: float) -> List[ChallengeRecord]:
+        return [record for record in self._records.values() if record.deadline < now]
+
+    def discard(self, user_id: int) -> Optional[ChallengeRecord]:
+        return self._records.pop(user_id, None)
+
+    def footprint(self) -> int:
+        """Approximate bytes held by the registry and its records."""
+        return sys.getsizeof(self._records) + sum(
+            record.footprint() for record in self._records.values()
+        )
+
+
+class ImageCache:
+    """
+    Images of pending challenges by user ID, so repeat clicks resend instead of rendering.
+
+    Entries expire with their challenge and at most `size` are kept, the oldest going
+    first. A miss only costs a render, the pending code can always be drawn again.
+    """
+
+    def __init__(self, size: int = MAX_CACHED_IMAGES) -> None:
+        # user id -> (expiry, issued image), oldest first
+        self._images: "OrderedDict[int, Tuple[float, IssuedImage]]" = OrderedDict()
+        self.size: int = size
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, user_id: int) -> Optional[IssuedImage]:
+        entry: Optional[Tuple[float, IssuedImage]] = self._images.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._images[user_id]
+            return None
+        return entry[1]
+
+    def put(self, user_id: int, issued: IssuedImage, ttl: float) -> None:
+        self._images.pop(user_id, None)
+        self._images[user_id] = (time.monotonic() + ttl, issued)
+        while len(self._images) > self.size:
+            self._images.popitem(last=False)
+
+    def pop(self, user_id: int) -> Optional[IssuedImage]:
+        entry: Optional[Tuple[float, IssuedImage]] = self._images.pop(user_id, None)
+        return entry and entry[1]
+
+    def sweep(self, now: float) -> int:
+        """Drop expired images, and return how many there were."""
+        expired: List[int] = [
+            user_id for user_id, (expiry, _) in self._images.items() if expiry <= now
+        ]
+        for user_id in expired:
+            del self._images[user_id]
+        return len(expired)
+
+    def nbytes(self) -> int:
+        """Encoded bytes held, the part that grows with image size."""
+        return sum(len(issued[1]) for _, issued in self._images.values())
@@ -0,0 +1,161 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Final, Iterable, List, Literal, Optional, Tuple, Type
+
+from PIL.Image import Image
+
+from .atlas import GlyphAtlas
+from .encoding import ENCODINGS, EncodedImage, EncodingProfile
+from .objects import CaptchaObj, Seed, load_font
+from .vectorized import VectorCaptchaObj, np
+
+DEFAULT_FONT: Final[str] = "DroidSansMono.ttf"
+FONT_SUFFIXES: Final[Tuple[str, ...]] = (".ttf", ".otf")
+RENDERERS: Final[Tuple[str, ...]] = ("atlas", "classic", "numpy")
+# numpy is an optional dependency, its renderer is only offered when it's installed.
+AVAILABLE_RENDERERS: Final[Tuple[str, ...]] = tuple(
+    name for name in RENDERERS if name != "numpy" or np is not None
+)
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """How a guild's captchas look, also used as the key of its challenge pool."""
+
+    renderer: Literal["atlas", "classic", "numpy"] = "atlas"
+    width: int = 300
+    height: int = 100
+    font: str = DEFAULT_FONT
+    font_sizes: Tuple[int, ...] = (42, 50, 56)
+    noise_dots: int = 30
+    encoding: str = "png"
+    quality: int = 80
+    smooth: bool = True
+
+    @property
+    def encoder(self) -> EncodingProfile:
+        return ENCODINGS.get(self.encoding) or ENCODINGS["png"]
+
+    @property
+    def filename(self) -> str:
+        return f"captcha.{self.encoder.extension}"
+
+    def __str__(self) -> str:
+        sizes: str = ",".join(map(str, self.font_sizes))
+        return (
+            f"{self.renderer} {self.width}x{self.height} {self.font} "
+            f"[{sizes}] {self.noise_dots} dots {self.encoding}"
+            + (f"@{self.quality}" if self.encoder.lossy else "")
+            + ("" if self.smooth else " unsmoothed")
+        )
+
+
+class CaptchaRenderer:
+    """
+    Long-lived renderer shared by every challenge of the cog.
+
+    Fonts come from `load_font`, so each (font path, size) is read from disk once per
+    process. One glyph atlas is kept per font file and one `CaptchaObj` per profile.
+    A `seed` makes every render reproducible, leave it unset outside benchmarks.
+    """
+
+    def __init__(self, fonts: Iterable[Path], seed: Seed = None) -> None:
+        self.seed: Seed = seed
+        self.fonts: Dict[str, str] = {}
+        for path in fonts:
+            if path.suffix.lower() in FONT_SUFFIXES:
+                self.fonts.setdefault(path.name, str(path))
+
+        self._atlases: Dict[str, GlyphAtlas] = {}
+        self._captchas: Dict[RenderProfile, CaptchaObj] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def font_path(self, name: str) -> str:
+        return self.fonts.get(name) or self.fonts[DEFAULT_FONT]
+
+    def atlas(self, name: str) -> GlyphAtlas:
+        path: str = self.font_path(name)
+        with self._lock:
+            atlas: Optional[GlyphAtlas] = self._atlases.get(path)
+            if atlas is None:
+                atlas: GlyphAtlas = GlyphAtlas(path)
+                self._atlases[path] = atlas
+        return atlas
+
+    def captcha(self, profile: RenderProfile) -> CaptchaObj:
+        captcha: Optional[CaptchaObj] = self._captchas.get(profile)
+        if captcha is None:
+            # Without numpy the numpy stage falls back to the classic one.
+            factory: Type[CaptchaObj] = (
+                VectorCaptchaObj if profile.renderer == "numpy" and np is not None else CaptchaObj
+            )
+            captcha: CaptchaObj = factory(
+                None,
+                profile.width,
+                profile.height,
+                font_sizes=profile.font_sizes,
+                atlas=self.atlas(profile.font) if profile.renderer == "atlas" else None,
+                font=self.font_path(profile.font),
+                noise_dots=profile.noise_dots,
+                seed=self.seed,
+                smooth=profile.smooth,
+            )
+            self._captchas[profile] = captcha
+        return captcha
+
+    def render(self, chars: str, profile: RenderProfile) -> bytes:
+        image: Image = self.captcha(profile).generate_image(chars)
+        return profile.encoder.encode(image, profile.quality).data
+
+    def render_many(self, codes: Iterable[str], profile: RenderProfile) -> List[bytes]:
+        """Render and encode a batch of challenges through one output buffer."""
+        buffer: BytesIO = BytesIO()
+        encoder: EncodingProfile = profile.encoder
+        return [
+            encoder.encode(image, profile.quality, buffer).data
+            for image in self.captcha(profile).generate_many(codes)
+        ]
+
+    def compare(self, chars: str, profile: RenderProfile) -> Dict[str, EncodedImage]:
+        """Encode one render of `profile` with every available encoding profile."""
+        image: Image = self.captcha(profile).generate_image(chars)
+        return {
+            name: encoding.encode(image, profile.quality)
+            for name, encoding in ENCODINGS.items()
+            if encoding.available
+        }
+
+    def warm(self, profiles: Iterable[RenderProfile]) -> None:
+        """Load the fonts, and atlas tiles where used, of every given profile."""
+        for profile in profiles:
+            path: str = self.font_path(profile.font)
+            for size in profile.font_sizes:
+                load_font(path, size)
+            if profile.renderer == "atlas":
+                self.atlas(profile.font).warm(profile.font_sizes)
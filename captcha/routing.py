@@ -0,0 +1,75 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeAlias, Union
+
+import discord
+
+RouteKey: TypeAlias = Tuple[int, int]
+Handler: TypeAlias = Callable[[discord.Message], Awaitable[None]]
+Route: TypeAlias = Union[Handler, "asyncio.Queue[discord.Message]"]
+
+
+class AnswerRouter:
+    """
+    Routes incoming messages to the challenge waiting for them.
+
+    Routes are keyed by (channel id, author id), so dispatching a message is a single
+    dictionary lookup however many challenges are pending. A route is either a
+    handler called for every message, or a queue a flow reads its answers from. A
+    queue stays routed until the flow removes it, so answers sent while the flow is
+    busy with an earlier one are kept in order instead of dropped.
+    """
+
+    def __init__(self) -> None:
+        self._routes: Dict[RouteKey, Route] = {}
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def add(self, channel_id: int, author_id: int, handler: Handler) -> None:
+        self._routes[(channel_id, author_id)] = handler
+
+    def listen(self, channel_id: int, author_id: int) -> "asyncio.Queue[discord.Message]":
+        """Queue every message of the author in the channel until the route is removed."""
+        queue: "asyncio.Queue[discord.Message]" = asyncio.Queue()
+        self._routes[(channel_id, author_id)] = queue
+        return queue
+
+    def remove(self, channel_id: int, author_id: int, route: Optional[Route] = None) -> None:
+        """Drop the route, or only `route` so a finished flow can't drop its successor's."""
+        key: RouteKey = (channel_id, author_id)
+        if route is None or self._routes.get(key) is route:
+            self._routes.pop(key, None)
+
+    async def dispatch(self, message: discord.Message) -> bool:
+        route: Optional[Route] = self._routes.get((message.channel.id, message.author.id))
+        if route is None:
+            return False
+        if isinstance(route, asyncio.Queue):
+            route.put_nowait(message)
+        else:
+            await route(message)
+        return True
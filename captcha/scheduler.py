@@ -0,0 +1,142 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Callable, Coroutine, Dict, Hashable, Iterator, List, Optional, Set
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.scheduler")
+
+
+class Deadline:
+    __slots__ = ("when", "order", "key", "callback", "args", "cancelled")
+
+    def __init__(
+        self,
+        when: float,
+        order: int,
+        key: Hashable,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: tuple,
+    ) -> None:
+        self.when: float = when
+        self.order: int = order
+        self.key: Hashable = key
+        self.callback: Callable[..., Coroutine[Any, Any, Any]] = callback
+        self.args: tuple = args
+        self.cancelled: bool = False
+
+    def __lt__(self, other: "Deadline") -> bool:
+        return (self.when, self.order) < (other.when, other.order)
+
+
+class DeadlineScheduler:
+    """
+    One task running every keyed deadline of the cog off a min-heap.
+
+    Scheduling a key that is already pending replaces its deadline. Cancelling only
+    marks the heap entry, which is skipped when it surfaces, so `cancel` is O(1) and
+    `schedule` O(log n). The heap is rebuilt once cancelled entries outnumber live ones.
+    Due callbacks run as their own tasks so a slow one doesn't hold up the rest.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Deadline] = []
+        self._pending: Dict[Hashable, Deadline] = {}
+        self._order: Iterator[int] = itertools.count()
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self.fired: int = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    def schedule(
+        self,
+        key: Hashable,
+        delay: float,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        *args: Any,
+    ) -> None:
+        self.cancel(key)
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        deadline: Deadline = Deadline(loop.time() + delay, next(self._order), key, callback, args)
+        self._pending[key] = deadline
+        heapq.heappush(self._heap, deadline)
+        if self._heap[0] is deadline:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key: Hashable) -> bool:
+        deadline: Optional[Deadline] = self._pending.pop(key, None)
+        if deadline is None:
+            return False
+        deadline.cancelled = True
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._pending):
+            self._heap = [entry for entry in self._heap if not entry.cancelled]
+            heapq.heapify(self._heap)
+        return True
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running:
+            task.cancel()
+        self._heap.clear()
+        self._pending.clear()
+
+    async def _run(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while True:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+            delay: Optional[float] = self._heap[0].when - loop.time() if self._heap else None
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            deadline: Deadline = heapq.heappop(self._heap)
+            del self._pending[deadline.key]
+            self.fired += 1
+            task: asyncio.Task = asyncio.create_task(deadline.callback(*deadline.args))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Scheduled captcha task failed.", exc_info=task.exception())
@@ -0,0 +1,146 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Iterable, List, Literal, Mapping, Optional, Set
+
+from redbot.core import Config
+from redbot.core.config import Group
+
+from .renderer import DEFAULT_FONT, RenderProfile
+
+
+@dataclass
+class GuildSettings:
+    """A guild's captcha settings, mirroring its `Config` guild group."""
+
+    toggle: bool = False
+    channel: Optional[int] = None
+    timeout: int = 120
+    tries: int = 3
+    role_before_captcha: Optional[int] = None
+    role_after_captcha: Optional[int] = None
+    message_before_captcha: str = "{mention}, please solve the captcha below."
+    message_after_captcha: str = "✅ {mention}, you passed the captcha!"
+    embed_text: str = "Click the green button below to verify."
+    renderer: Literal["atlas", "classic", "numpy"] = "atlas"
+    width: int = 300
+    height: int = 100
+    font: str = DEFAULT_FONT
+    font_sizes: List[int] = field(default_factory=lambda: [42, 50, 56])
+    noise_dots: int = 30
+    encoding: str = "png"
+    encoding_quality: int = 80
+    challenge: Literal["image", "grid"] = "image"
+    join_flow: bool = False
+    mass_verify_rate: Optional[float] = None
+    captcha_message: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def defaults(cls) -> Dict[str, Any]:
+        """Registered `Config` defaults, `captcha_message` is only ever set raw."""
+        settings: GuildSettings = cls()
+        return {
+            item.name: getattr(settings, item.name)
+            for item in fields(cls)
+            if item.name != "captcha_message"
+        }
+
+    @classmethod
+    def from_config(cls, data: Mapping[str, Any]) -> "GuildSettings":
+        return cls(**{item.name: data[item.name] for item in fields(cls) if item.name in data})
+
+    @property
+    def profile(self) -> RenderProfile:
+        return RenderProfile(
+            renderer=self.renderer,
+            width=self.width,
+            height=self.height,
+            font=self.font,
+            font_sizes=tuple(self.font_sizes),
+            noise_dots=self.noise_dots,
+            encoding=self.encoding,
+            quality=self.encoding_quality,
+        )
+
+
+class SettingsCache:
+    """
+    Write-through cache of `GuildSettings`.
+
+    Guilds are read from `Config` the first time they're needed and then served from
+    memory. `set` updates the cached settings before persisting them, so readers see
+    a change as soon as the setter is called. `enabled` holds the guilds with captcha
+    toggled on, so per-event listeners can skip every other guild with one lookup. It is
+    seeded from the toggles alone, the rest of a guild's settings still load lazily.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.config: Config = config
+        self._guilds: Dict[int, GuildSettings] = {}
+        self.enabled: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    async def load_enabled(self, guild_ids: Iterable[int]) -> None:
+        """Fill `enabled` from the stored toggles, without caching the guilds' settings."""
+        for guild_id in guild_ids:
+            if await self.config.guild_from_id(guild_id).toggle():
+                self.enabled.add(guild_id)
+
+    def _cache(self, guild_id: int, settings: GuildSettings) -> GuildSettings:
+        # Another task may have loaded or changed this guild in the meantime.
+        settings: GuildSettings = self._guilds.setdefault(guild_id, settings)
+        if settings.toggle:
+            self.enabled.add(guild_id)
+        return settings
+
+    async def get(self, guild_id: int) -> GuildSettings:
+        settings: Optional[GuildSettings] = self._guilds.get(guild_id)
+        if settings is None:
+            data: Dict[str, Any] = await self.config.guild_from_id(guild_id).all()
+            settings: GuildSettings = self._cache(guild_id, GuildSettings.from_config(data))
+        return settings
+
+    async def set(self, guild_id: int, **values: Any) -> GuildSettings:
+        settings: GuildSettings = await self.get(guild_id)
+        for name, value in values.items():
+            if not hasattr(settings, name):
+                raise AttributeError(f"Unknown captcha setting {name!r}.")
+            setattr(settings, name, value)
+        if settings.toggle:
+            self.enabled.add(guild_id)
+        else:
+            self.enabled.discard(guild_id)
+        # Only the changed keys are stored, so later changes to defaults still apply.
+        group: Group = self.config.guild_from_id(guild_id)
+        for name, value in values.items():
+            await group.set_raw(name, value=value)
+        return settings
+
+    async def clear(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
+        self.enabled.discard(guild_id)
+        await self.config.guild_from_id(guild_id).clear()
@@ -0,0 +1,174 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Deque, Final, Optional, Tuple
+
+from .renderer import RenderProfile
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.shedding")
+
+
+@dataclass(frozen=True)
+class ComplexityTier:
+    """A cheaper variant of every render profile, applied while the cog is overloaded."""
+
+    name: str
+    noise_scale: float = 1.0
+    smooth: bool = True
+    canvas_scale: float = 1.0
+    max_font_sizes: Optional[int] = None
+
+    def apply(self, profile: RenderProfile) -> RenderProfile:
+        if self == TIERS[0]:
+            return profile
+        return replace(
+            profile,
+            noise_dots=int(profile.noise_dots * self.noise_scale),
+            smooth=profile.smooth and self.smooth,
+            width=max(80, int(profile.width * self.canvas_scale)),
+            height=max(30, int(profile.height * self.canvas_scale)),
+            font_sizes=profile.font_sizes[: self.max_font_sizes],
+        )
+
+
+TIERS: Final[Tuple[ComplexityTier, ...]] = (
+    ComplexityTier("full"),
+    ComplexityTier("fewer dots", noise_scale=0.5),
+    ComplexityTier("unsmoothed", noise_scale=0.5, smooth=False),
+    ComplexityTier("small canvas", noise_scale=0.25, smooth=False, canvas_scale=0.75),
+    ComplexityTier("minimal", noise_scale=0.25, smooth=False, canvas_scale=0.75, max_font_sizes=1),
+)
+
+
+class LatencyWindow:
+    """Timestamped latency samples, newest last."""
+
+    def __init__(self, size: int = 1024) -> None:
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, percent: float, since: float = 0.0) -> Tuple[float, int]:
+        """The `percent` percentile of samples recorded after `since`, and how many there were."""
+        values = sorted(seconds for timestamp, seconds in self._samples if timestamp >= since)
+        if not values:
+            return 0.0, 0
+        return values[min(len(values) - 1, int(len(values) * percent / 100))], len(values)
+
+
+class LoadShedder:
+    """
+    Steps captcha complexity down through `TIERS` while latency is high.
+
+    Only samples recorded since the last step (and within `horizon` seconds) are
+    considered. The tier gets cheaper once the p95 render or response latency
+    exceeds its threshold over at least `min_samples` samples, and gets richer
+    again once both are below `recover_ratio` of their thresholds, or nothing
+    was rendered at all. At most one step is taken every `hold` seconds, so the
+    gap between the two thresholds and the hold time keep it from flapping.
+    """
+
+    def __init__(
+        self,
+        render_threshold: float = 0.75,
+        response_threshold: float = 3.0,
+        recover_ratio: float = 0.5,
+        hold: float = 15.0,
+        horizon: float = 60.0,
+        min_samples: int = 20,
+    ) -> None:
+        self.render: LatencyWindow = LatencyWindow()
+        self.response: LatencyWindow = LatencyWindow()
+
+        self.render_threshold: float = render_threshold
+        self.response_threshold: float = response_threshold
+        self.recover_ratio: float = recover_ratio
+        self.hold: float = hold
+        self.horizon: float = horizon
+        self.min_samples: int = min_samples
+
+        self.level: int = 0
+        self.changed: float = time.monotonic()
+        self.steps_down: int = 0
+        self.steps_up: int = 0
+
+    @property
+    def tier(self) -> ComplexityTier:
+        return TIERS[self.level]
+
+    def latencies(self) -> Tuple[float, float]:
+        """p95 render and response latency considered for the next step."""
+        since: float = max(self.changed, time.monotonic() - self.horizon)
+        return self.render.percentile(95, since)[0], self.response.percentile(95, since)[0]
+
+    def evaluate(self) -> ComplexityTier:
+        now: float = time.monotonic()
+        if now - self.changed < self.hold:
+            return self.tier
+
+        since: float = max(self.changed, now - self.horizon)
+        render, rendered = self.render.percentile(95, since)
+        response, responded = self.response.percentile(95, since)
+        overloaded: bool = (rendered >= self.min_samples and render > self.render_threshold) or (
+            responded >= self.min_samples and response > self.response_threshold
+        )
+        recovered: bool = (
+            render < self.render_threshold * self.recover_ratio
+            and response < self.response_threshold * self.recover_ratio
+        )
+
+        if overloaded and self.level < len(TIERS) - 1:
+            self.level += 1
+            self.steps_down += 1
+        elif recovered and self.level > 0:
+            self.level -= 1
+            self.steps_up += 1
+        else:
+            return self.tier
+        self.changed = now
+        log.info(
+            "Captcha complexity is now %r (p95 render %.0fms, response %.0fms).",
+            self.tier.name,
+            render * 1000,
+            response * 1000,
+        )
+        return self.tier
+
+    def apply(self, profile: RenderProfile) -> RenderProfile:
+        return self.evaluate().apply(profile)
+
+    def __str__(self) -> str:
+        render, response = self.latencies()
+        return (
+            f"{self.level} ({self.tier.name}), p95 render {render * 1000:.0f}ms, "
+            f"response {response * 1000:.0f}ms"
+        )
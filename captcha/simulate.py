@@ -0,0 +1,865 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# End-to-end load simulation against stand-in Discord objects, run with
+# `python -m captcha.simulate --help`.
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Counter, Dict, List, Optional, Sequence, Tuple, Union
+
+import discord
+
+from .core import DELETE_AFTER, Captcha
+from .renderer import RenderProfile
+from .views import CaptchaGridView, CaptchaSubmitView, CaptchaVerifyButton
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS: Dict[str, int] = {
+    "solve": 50,
+    "wrong": 15,
+    "idle": 10,
+    "spam": 5,
+    "join": 12,
+    "join-leave": 5,
+    "join-idle": 3,
+}
+PERCENTILES: Tuple[int, ...] = (50, 90, 99)
+LAG_INTERVAL: float = 0.01
+# How long a member waits for the bot before giving up, queues can hold messages back.
+PATIENCE: float = 30.0
+MENTION: re.Pattern = re.compile(r"<@!?(\d+)>")
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.simulate")
+
+
+def _peak_rss_kib() -> Optional[int]:
+    if resource is None:
+        return None
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB everywhere else.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _summary(samples: List[float]) -> Dict[str, Any]:
+    if not samples:
+        return {"count": 0}
+    values: List[float] = sorted(samples)
+    summary: Dict[str, Any] = {"count": len(values)}
+    for percent in PERCENTILES:
+        summary[f"p{percent}_ms"] = (
+            values[min(len(values) - 1, len(values) * percent // 100)] * 1000
+        )
+    summary["max_ms"] = values[-1] * 1000
+    return summary
+
+
+class _Response:
+    """What discord.py's HTTP errors read from an aiohttp response."""
+
+    def __init__(self, status: int, reason: str) -> None:
+        self.status: int = status
+        self.reason: str = reason
+
+
+class FakeAPI:
+    """
+    Stand-in for Discord's HTTP API.
+
+    Every request sleeps for a log-normal sample around `latency` seconds. A
+    `rate_limit` share of them is answered with a 429 first and waits `retry_after`
+    seconds on top, the way discord.py sleeps out a rate limit before retrying.
+    """
+
+    def __init__(
+        self, latency: float, jitter: float, rate_limit: float, retry_after: float, seed: Any
+    ) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.rate_limit: float = rate_limit
+        self.retry_after: float = retry_after
+        self.rng: random.Random = random.Random(seed)
+        self.requests: Counter[str] = collections.Counter()
+        self.limited: int = 0
+        self._ids: Any = itertools.count(discord.utils.time_snowflake(discord.utils.utcnow()))
+
+    def snowflake(self) -> int:
+        return next(self._ids)
+
+    async def request(self, route: str) -> None:
+        self.requests[route] += 1
+        delay: float = self.latency * self.rng.lognormvariate(0, self.jitter)
+        if self.rng.random() < self.rate_limit:
+            self.limited += 1
+            delay += self.retry_after
+        await asyncio.sleep(delay)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str) -> None:
+        self.id: int = role_id
+        self.name: str = name
+
+
+class FakeMessage(discord.Message):
+    """A message that was sent, `solution` is the code its image shows, if any."""
+
+    def __init__(
+        self, api: FakeAPI, channel: Any, author: Any, content: str, solution: Optional[str]
+    ) -> None:
+        self.api: FakeAPI = api
+        self.id: int = api.snowflake()
+        self.channel: Any = channel
+        # None in DMs, which is how the cog tells DM answers apart.
+        self.guild: Any = getattr(channel, "guild", None)
+        self.author: Any = author
+        self.content: str = content
+        self.flags: discord.MessageFlags = discord.MessageFlags()
+        self.solution: Optional[str] = solution
+
+    def __repr__(self) -> str:
+        return f"<FakeMessage id={self.id} channel={self.channel.id}>"
+
+    async def delete(self, *, delay: Optional[float] = None) -> None:
+        await self.api.request("message.delete")
+
+
+class FakePartialMessage:
+    def __init__(self, api: FakeAPI, channel: Any, message_id: int) -> None:
+        self.api: FakeAPI = api
+        self.channel: Any = channel
+        self.id: int = message_id
+
+    async def delete(self) -> None:
+        await self.api.request("message.delete")
+
+
+class FakeMessageable:
+    """Shared `send` of the fake channels, delivering each message to its readers."""
+
+    def __init__(self, sim: "Simulation", channel_id: int) -> None:
+        self.sim: Simulation = sim
+        self.id: int = channel_id
+
+    def readers(self, content: str) -> List["FakeMember"]:
+        raise NotImplementedError
+
+    async def send(
+        self, content: Optional[str] = None, *, file: Optional[discord.File] = None, **_: Any
+    ) -> FakeMessage:
+        await self.sim.api.request("channel.send")
+        solution: Optional[str] = None
+        if file is not None:
+            solution = self.sim.solutions.pop(file.fp.getvalue(), None)
+        message: FakeMessage = FakeMessage(
+            self.sim.api, self, self.sim.bot.user, content or "", solution
+        )
+        for member in self.readers(content or ""):
+            member.inbox.put_nowait(message)
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakePartialMessage:
+        return FakePartialMessage(self.sim.api, self, message_id)
+
+
+class FakeDMChannel(FakeMessageable):
+    def __init__(self, sim: "Simulation", recipient: "FakeMember", closed: bool) -> None:
+        super().__init__(sim, sim.api.snowflake())
+        self.recipient: FakeMember = recipient
+        self.closed: bool = closed
+
+    def readers(self, content: str) -> List["FakeMember"]:
+        return [self.recipient]
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        if self.closed:
+            await self.sim.api.request("channel.send")
+            raise discord.Forbidden(
+                _Response(403, "Forbidden"),
+                {"code": 50007, "message": "Cannot send messages to this user"},
+            )
+        return await super().send(content, **kwargs)
+
+
+class FakeTextChannel(FakeMessageable, discord.TextChannel):
+    """The verification channel, members read the messages that mention them."""
+
+    def __init__(self, sim: "Simulation", guild: "FakeGuild") -> None:
+        FakeMessageable.__init__(self, sim, sim.api.snowflake())
+        self.guild: Any = guild
+        self.name: str = "verify"
+
+    def __repr__(self) -> str:
+        return f"<FakeTextChannel id={self.id}>"
+
+    def readers(self, content: str) -> List["FakeMember"]:
+        members: List[Optional[FakeMember]] = [
+            self.guild.members.get(int(match)) for match in MENTION.findall(content)
+        ]
+        return [member for member in members if member is not None]
+
+    async def delete_messages(self, messages: Sequence[Any], **_: Any) -> None:
+        await self.sim.api.request("channel.bulk_delete")
+
+
+class FakeGuild:
+    def __init__(self, sim: "Simulation", guild_id: int) -> None:
+        self.id: int = guild_id
+        self.name: str = f"Guild {guild_id}"
+        self.me: Any = sim.bot.me
+        self.default_role: FakeRole = FakeRole(guild_id, "@everyone")
+        self.unverified: FakeRole = FakeRole(sim.api.snowflake(), "Unverified")
+        self.verified: FakeRole = FakeRole(sim.api.snowflake(), "Verified")
+        self.roles: Dict[int, FakeRole] = {
+            role.id: role for role in (self.default_role, self.unverified, self.verified)
+        }
+        self.members: Dict[int, FakeMember] = {}
+        self.channel: FakeTextChannel = FakeTextChannel(sim, self)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    def get_member(self, user_id: int) -> Optional["FakeMember"]:
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeTextChannel]:
+        return self.channel if channel_id == self.channel.id else None
+
+    async def fetch_member(self, user_id: int) -> "FakeMember":
+        raise discord.NotFound(_Response(404, "Not Found"), "Unknown Member")
+
+
+class FakeMember:
+    """A member that reads what the bot sends it from `inbox`."""
+
+    def __init__(self, sim: "Simulation", guild: FakeGuild, dm_closed: bool) -> None:
+        self.sim: Simulation = sim
+        self.id: int = sim.api.snowflake()
+        self.name: str = f"user{self.id}"
+        self.display_name: str = self.name
+        self.mention: str = f"<@{self.id}>"
+        self.bot: bool = False
+        self.guild: FakeGuild = guild
+        self.roles: List[FakeRole] = [guild.default_role, guild.unverified]
+        self.dm: FakeDMChannel = FakeDMChannel(sim, self, dm_closed)
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.kicked: asyncio.Event = asyncio.Event()
+
+    async def receive(self, timeout: float) -> Optional[FakeMessage]:
+        try:
+            return await asyncio.wait_for(self.inbox.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def create_dm(self) -> FakeDMChannel:
+        return self.dm
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        return await self.dm.send(content, **kwargs)
+
+    async def edit(self, *, roles: List[FakeRole], reason: Optional[str] = None) -> None:
+        await self.sim.api.request("member.edit")
+        self.roles = [self.guild.default_role, *roles]
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None) -> None:
+        await self.sim.api.request("member.add_roles")
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def kick(self, *, reason: Optional[str] = None) -> None:
+        await self.sim.api.request("member.kick")
+        if self.id not in self.guild.members:
+            raise discord.NotFound(_Response(404, "Not Found"), "Unknown Member")
+        self.kicked.set()
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction: "FakeInteraction") -> None:
+        self.interaction: FakeInteraction = interaction
+        self.content: Optional[str] = None
+        self.view: Optional[discord.ui.View] = None
+        self.modal: Optional[discord.ui.Modal] = None
+        self.deferred: bool = False
+        self._done: bool = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self, content: Optional[str], view: Any) -> None:
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)  # type: ignore
+        self._done = True
+        self.interaction.responded = time.perf_counter() - self.interaction.created
+        await self.interaction.sim.api.request("interaction.respond")
+        self.content, self.view = content, view
+
+    async def send_message(
+        self, content: Optional[str] = None, *, view: Any = None, **_: Any
+    ) -> None:
+        await self._respond(content, view)
+
+    async def edit_message(self, *, content: Optional[str] = None, view: Any = None) -> None:
+        await self._respond(content, view)
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        await self._respond(None, None)
+        self.modal = modal
+
+    async def defer(self, **_: Any) -> None:
+        await self._respond(None, None)
+        self.deferred = True
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction") -> None:
+        self.interaction: FakeInteraction = interaction
+        self.content: Optional[str] = None
+        self.view: Optional[discord.ui.View] = None
+        self.sent: float = 0.0
+
+    async def send(self, content: Optional[str] = None, *, view: Any = None, **_: Any) -> None:
+        await self.interaction.sim.api.request("interaction.followup")
+        self.content, self.view = content, view
+        self.sent = time.perf_counter()
+
+
+class FakeInteraction(discord.Interaction):
+    # Plain attributes in place of the properties discord.py builds from a gateway payload.
+    user: Any = None
+    guild: Any = None
+    response: Any = None
+    followup: Any = None
+
+    def __init__(self, sim: "Simulation", member: FakeMember) -> None:
+        self.sim: Simulation = sim
+        self.user: FakeMember = member
+        self.guild: FakeGuild = member.guild
+        self.response: FakeInteractionResponse = FakeInteractionResponse(self)
+        self.followup: FakeFollowup = FakeFollowup(self)
+        self.created: float = time.perf_counter()
+        self.responded: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return f"<FakeInteraction user={self.user.id}>"
+
+    @property
+    def reply(self) -> Union[FakeInteractionResponse, FakeFollowup]:
+        """Where the cog answered, the followup once the response was deferred."""
+        return self.followup if self.response.deferred else self.response
+
+
+class FakeBot:
+    """The parts of `Red` the cog calls outside of commands."""
+
+    def __init__(self, sim: "Simulation") -> None:
+        self.sim: Simulation = sim
+        self.user: Any = discord.Object(sim.api.snowflake())
+        self.user.bot = True
+        self.me: Any = discord.Object(self.user.id)
+        self.me.guild_permissions = discord.Permissions.all()
+        self.ready: asyncio.Event = asyncio.Event()
+
+    def add_view(self, view: discord.ui.View, **_: Any) -> None:
+        pass
+
+    async def wait_until_red_ready(self) -> None:
+        await self.ready.wait()
+
+    @property
+    def guilds(self) -> List[FakeGuild]:
+        return list(self.sim.guilds.values())
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.sim.guilds.get(guild_id)
+
+    def get_user(self, user_id: int) -> Optional[FakeMember]:
+        return self.sim.members.get(user_id)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeMessageable]:
+        return self.sim.channels.get(channel_id)
+
+    def get_partial_messageable(self, channel_id: int, **_: Any) -> FakeMessageable:
+        return FakeMessageable(self.sim, channel_id)
+
+    def is_ws_ratelimited(self) -> bool:
+        return False
+
+    async def fetch_guild(self, guild_id: int) -> FakeGuild:
+        raise discord.NotFound(_Response(404, "Not Found"), "Unknown Guild")
+
+    async def cog_disabled_in_guild(self, cog: Any, guild: Any) -> bool:
+        return False
+
+    async def cog_disabled_in_guild_raw(self, cog_name: str, guild_id: int) -> bool:
+        return False
+
+    async def get_embed_color(self, location: Any) -> discord.Color:
+        return discord.Color.red()
+
+    async def is_owner(self, user: Any) -> bool:
+        return False
+
+
+class Simulation:
+    """
+    Drives synthetic members through a real `Captcha` cog.
+
+    Members arrive at `rate` per second and each plays one of `SCENARIOS`: Verify
+    clicks answered in DMs, the grid or the modal fallback, wrong answers, clicks
+    left to expire, repeated clicks, and join captchas that are solved, left or
+    kicked. Leaves of members without a challenge are fired in the background to
+    load `on_raw_member_remove`'s early exit.
+    """
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args: argparse.Namespace = args
+        self.rng: random.Random = random.Random(args.seed)
+        self.api: FakeAPI = FakeAPI(
+            args.latency, args.jitter, args.rate_limit, args.retry_after, args.seed
+        )
+        self.bot: FakeBot = FakeBot(self)
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, FakeMessageable] = {}
+        # Rendered images and their codes, standing in for members reading the image.
+        self.solutions: Dict[bytes, str] = {}
+        self.outcomes: Dict[str, Counter[str]] = collections.defaultdict(collections.Counter)
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.lags: List[float] = []
+        self.clicks: int = 0
+        self.leaves: int = 0
+        self._running: bool = False
+
+    async def start(self, data_path: Path) -> None:
+        from redbot.core import data_manager
+
+        data_manager.basic_config = deepcopy(data_manager.basic_config_default)
+        data_manager.basic_config.update(
+            DATA_PATH=str(data_path), STORAGE_TYPE="JSON", STORAGE_DETAILS={}
+        )
+        self.cog: Captcha = Captcha(self.bot)  # type: ignore
+        self._watch_renders()
+        await self.cog.config.render_backend.set(self.args.backend)
+        await self.cog.config.surge_threshold.set(self.args.surge)
+        for _ in range(self.args.guilds):
+            guild: FakeGuild = FakeGuild(self, self.api.snowflake())
+            self.guilds[guild.id] = guild
+            self.channels[guild.channel.id] = guild.channel
+            await self.cog.guild_settings.set(
+                guild.id,
+                toggle=True,
+                join_flow=True,
+                channel=guild.channel.id,
+                role_before_captcha=guild.unverified.id,
+                role_after_captcha=guild.verified.id,
+                timeout=self.args.timeout,
+            )
+        self.bot.ready.set()
+        await self.cog.task
+        self.button: CaptchaVerifyButton = CaptchaVerifyButton(self.cog)
+
+    def _watch_renders(self) -> None:
+        render, render_many = self.cog._render_challenge, self.cog._render_challenges
+
+        async def read(profile: RenderProfile) -> Tuple[str, bytes]:
+            code, image = await render(profile)
+            self.solutions[image] = code
+            return code, image
+
+        async def read_many(profile: RenderProfile, count: int) -> List[Tuple[str, bytes]]:
+            challenges: List[Tuple[str, bytes]] = await render_many(profile, count)
+            self.solutions.update((image, code) for code, image in challenges)
+            return challenges
+
+        self.cog._render_challenge = read  # type: ignore
+        self.cog._render_challenges = read_many  # type: ignore
+
+    async def stop(self) -> None:
+        await self.cog.cog_unload()
+
+    async def run(self) -> float:
+        """Run every member's scenario and return how long they took."""
+        self._running = True
+        monitors: List[asyncio.Task] = [
+            asyncio.create_task(self._measure_lag()),
+            asyncio.create_task(self._leave_noise()),
+        ]
+        scenarios: List[str] = self.rng.choices(
+            list(self.args.mix), weights=list(self.args.mix.values()), k=self.args.users
+        )
+        tasks: List[asyncio.Task] = []
+        start: float = time.perf_counter()
+        for scenario in scenarios:
+            await asyncio.sleep(self.rng.expovariate(self.args.rate))
+            tasks.append(asyncio.create_task(self.member(scenario)))
+        await asyncio.gather(*tasks)
+        elapsed: float = time.perf_counter() - start
+        self._running = False
+        await asyncio.gather(*monitors)
+        return elapsed
+
+    async def drain(self, timeout: float) -> None:
+        """Wait for pending cleanups, so leftover records point at real leaks."""
+        deadline: float = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not (len(self.cog.registry) or len(self.cog.cleanup) or self.cog.outbound.queued):
+                return
+            await asyncio.sleep(0.25)
+
+    async def _measure_lag(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while self._running:
+            start: float = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+    async def _leave_noise(self) -> None:
+        guild_ids: List[int] = list(self.guilds)
+        while self._running:
+            for _ in range(max(1, round(self.args.leaves * LAG_INTERVAL))):
+                # Half come from guilds without captcha, half from members with no challenge.
+                guild_id: int = self.rng.choice(guild_ids) if self.rng.random() < 0.5 else 1
+                user: discord.Object = discord.Object(self.api.snowflake())
+                payload: Any = discord.RawMemberRemoveEvent({"guild_id": guild_id}, user)
+                start: float = time.perf_counter()
+                await self.cog.on_raw_member_remove(payload)
+                self.latencies["leave_untracked"].append(time.perf_counter() - start)
+                self.leaves += 1
+            await asyncio.sleep(LAG_INTERVAL)
+
+    async def member(self, scenario: str) -> None:
+        guild: FakeGuild = self.rng.choice(list(self.guilds.values()))
+        member: FakeMember = FakeMember(self, guild, self.rng.random() < self.args.dm_closed)
+        guild.members[member.id] = member
+        self.members[member.id] = member
+        self.channels[member.dm.id] = member.dm
+        try:
+            outcome: str = await getattr(self, f"_{scenario.replace('-', '_')}")(member)
+        except Exception:
+            log.exception(f"Scenario {scenario} of {member.id} raised.")
+            outcome: str = "error"
+        finally:
+            guild.members.pop(member.id, None)
+            self.members.pop(member.id, None)
+            self.channels.pop(member.dm.id, None)
+        self.outcomes[scenario][outcome] += 1
+
+    async def think(self) -> None:
+        await asyncio.sleep(self.rng.uniform(*self.args.think))
+
+    def verified(self, member: FakeMember) -> str:
+        return "passed" if member.guild.verified in member.roles else "failed"
+
+    async def click(self, member: FakeMember) -> FakeInteraction:
+        interaction: FakeInteraction = FakeInteraction(self, member)
+        self.clicks += 1
+        await self.button.verify.callback(interaction)  # type: ignore
+        if interaction.responded is not None:
+            self.latencies["verify_response"].append(interaction.responded)
+        return interaction
+
+    async def read_captcha(self, member: FakeMember, timeout: float) -> Optional[FakeMessage]:
+        """The next message showing a captcha, resends of an image already read are skipped."""
+        deadline: float = time.monotonic() + timeout
+        while (left := deadline - time.monotonic()) > 0:
+            message: Optional[FakeMessage] = await member.receive(left)
+            if message is not None and message.solution is not None:
+                return message
+        return None
+
+    async def answer(self, member: FakeMember, interaction: FakeInteraction, correct: bool) -> str:
+        """Answer whichever challenge the click brought up, as its member would."""
+        view: Any = interaction.reply.view
+        if isinstance(view, CaptchaGridView):
+            return await self._press_grid(member, view, correct)
+        if isinstance(view, CaptchaSubmitView):
+            return await self._submit_modal(member, view, correct)
+        if interaction.reply.content is None or member.inbox.empty():
+            return "rejected"
+
+        captcha: Optional[FakeMessage] = await self.read_captcha(member, PATIENCE)
+        if captcha is None:
+            return "lost"
+        await self.think()
+        content: str = captcha.solution if correct else "WRONG"  # type: ignore
+        start: float = time.perf_counter()
+        await self.cog.on_message(FakeMessage(self.api, member.dm, member, content, None))
+        self.latencies["dm_answer"].append(time.perf_counter() - start)
+        return self.verified(member)
+
+    async def _press_grid(self, member: FakeMember, view: CaptchaGridView, correct: bool) -> str:
+        await self.think()
+        buttons: Dict[str, Any] = {item.symbol: item for item in view.children}  # type: ignore
+        presses: List[str] = list(view.sequence)
+        if not correct:
+            presses = [next(symbol for symbol in buttons if symbol != presses[0])]
+        start: float = time.perf_counter()
+        for symbol in presses:
+            await view.press(FakeInteraction(self, member), buttons[symbol])  # type: ignore
+        self.latencies["grid_answer"].append(time.perf_counter() - start)
+        return self.verified(member)
+
+    async def _submit_modal(
+        self, member: FakeMember, view: CaptchaSubmitView, correct: bool
+    ) -> str:
+        await self.think()
+        opener: FakeInteraction = FakeInteraction(self, member)
+        await view.submit.callback(opener)  # type: ignore
+        modal: Any = opener.response.modal
+        modal.code_input._value = view.expected_code if correct else "WRONG"
+        start: float = time.perf_counter()
+        await modal.on_submit(FakeInteraction(self, member))
+        self.latencies["modal_answer"].append(time.perf_counter() - start)
+        return self.verified(member)
+
+    async def _solve(self, member: FakeMember) -> str:
+        return await self.answer(member, await self.click(member), True)
+
+    async def _wrong(self, member: FakeMember) -> str:
+        outcome: str = await self.answer(member, await self.click(member), False)
+        if outcome != "failed":
+            return outcome
+        return await self.answer(member, await self.click(member), True)
+
+    async def _idle(self, member: FakeMember) -> str:
+        interaction: FakeInteraction = await self.click(member)
+        if interaction.reply.content is not None and interaction.reply.view is None:
+            if member.inbox.empty():
+                return "rejected"
+        await asyncio.sleep(self.args.timeout + 1)
+        return "pending" if self.cog.challenges.peek(member.id) is not None else "expired"
+
+    async def _spam(self, member: FakeMember) -> str:
+        clicks: List[FakeInteraction] = await asyncio.gather(
+            *(self.click(member) for _ in range(5))
+        )
+        # Members answer the grid that reached them last, images are shared by every click.
+        for interaction in sorted(clicks, key=lambda click: click.followup.sent, reverse=True):
+            if interaction.reply.view is not None or not member.inbox.empty():
+                return await self.answer(member, interaction, True)
+        return "rejected"
+
+    async def _join(self, member: FakeMember, then: str = "solve") -> str:
+        start: float = time.perf_counter()
+        await self.cog.on_member_join(member)  # type: ignore
+        captcha: Optional[FakeMessage] = await self.read_captcha(member, PATIENCE)
+        if captcha is None:
+            return "lost"
+        self.latencies["join_captcha"].append(time.perf_counter() - start)
+
+        if then == "idle":
+            try:
+                await asyncio.wait_for(member.kicked.wait(), self.args.timeout + PATIENCE)
+            except asyncio.TimeoutError:
+                return "not kicked"
+            return "kicked"
+        await self.think()
+        if then == "leave":
+            member.guild.members.pop(member.id, None)
+            payload: Any = discord.RawMemberRemoveEvent({"guild_id": member.guild.id}, member)
+            start: float = time.perf_counter()
+            await self.cog.on_raw_member_remove(payload)
+            self.latencies["leave_tracked"].append(time.perf_counter() - start)
+            return "left" if member.id not in self.cog.registry else "tracked"
+
+        start: float = time.perf_counter()
+        message: FakeMessage = FakeMessage(
+            self.api, member.guild.channel, member, captcha.solution or "", None
+        )
+        await self.cog.on_message(message)
+        # Passing posts a message that mentions the member, after the role edit is queued.
+        if await member.receive(PATIENCE) is None:
+            return "lost"
+        self.latencies["join_answer"].append(time.perf_counter() - start)
+        deadline: float = time.monotonic() + PATIENCE
+        while member.guild.verified not in member.roles and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        return self.verified(member)
+
+    async def _join_leave(self, member: FakeMember) -> str:
+        return await self._join(member, "leave")
+
+    async def _join_idle(self, member: FakeMember) -> str:
+        return await self._join(member, "idle")
+
+    def report(self, elapsed: float, python_peak: Optional[int]) -> Dict[str, Any]:
+        sessions: int = sum(sum(counts.values()) for counts in self.outcomes.values())
+        requests: int = sum(self.api.requests.values())
+        return {
+            "meta": {
+                "timestamp": time.time(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "discord.py": discord.__version__,
+                "options": {
+                    name: value for name, value in vars(self.args).items() if name != "output"
+                },
+            },
+            "elapsed_s": elapsed,
+            "throughput": {
+                "sessions_per_second": sessions / elapsed,
+                "clicks_per_second": self.clicks / elapsed,
+                "leaves_per_second": self.leaves / elapsed,
+                "api_requests_per_second": requests / elapsed,
+            },
+            "outcomes": {name: dict(counts) for name, counts in sorted(self.outcomes.items())},
+            "latency": {name: _summary(values) for name, values in sorted(self.latencies.items())},
+            "event_loop_lag": _summary(self.lags),
+            "memory": {
+                "peak_rss_kib": _peak_rss_kib(),
+                "python_peak_kib": python_peak // 1024 if python_peak is not None else None,
+                "registry_kib": self.cog.registry.footprint() / 1024,
+            },
+            "api": {
+                "requests": dict(self.api.requests.most_common()),
+                "rate_limited": self.api.limited,
+                "outbound": str(self.cog.outbound),
+            },
+            "cog": {
+                "verify_rejected": dict(self.cog.metrics.rejected),
+                "images_resent": self.cog.metrics.resent,
+                "messages_deleted": self.cog.cleanup.deleted,
+                "left_over": {
+                    "records": len(self.cog.registry),
+                    "challenges": len(self.cog.challenges),
+                    "images": len(self.cog.images),
+                    "routes": len(self.cog.router),
+                },
+            },
+        }
+
+
+async def simulate(args: argparse.Namespace) -> Dict[str, Any]:
+    sim: Simulation = Simulation(args)
+    with tempfile.TemporaryDirectory() as data_path:
+        await sim.start(Path(data_path))
+        if args.tracemalloc:
+            tracemalloc.start()
+        try:
+            elapsed: float = await sim.run()
+            python_peak: Optional[int] = None
+            if args.tracemalloc:
+                _, python_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            await sim.drain(args.timeout + DELETE_AFTER + 5)
+            return sim.report(elapsed, python_peak)
+        finally:
+            await sim.stop()
+
+
+def _mix(text: str) -> Dict[str, int]:
+    mix: Dict[str, int] = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="python -m captcha.simulate",
+        description="Drive synthetic members through the captcha cog against a fake Discord.",
+    )
+    parser.add_argument("-u", "--users", type=int, default=2000, help="members to simulate")
+    parser.add_argument("-r", "--rate", type=float, default=100.0, help="arrivals per second")
+    parser.add_argument("-g", "--guilds", type=int, default=20, help="guilds with captcha")
+    parser.add_argument(
+        "--mix",
+        type=_mix,
+        default=dict(SCENARIOS),
+        help=f"scenario weights, default {','.join(f'{k}={v}' for k, v in SCENARIOS.items())}",
+    )
+    parser.add_argument("--timeout", type=int, default=5, help="captcha timeout in seconds")
+    parser.add_argument(
+        "--think", type=float, nargs=2, default=(0.2, 2.0), help="answer delay range"
+    )
+    parser.add_argument("--dm-closed", type=float, default=0.1, help="share of closed DMs")
+    parser.add_argument("--leaves", type=float, default=200.0, help="untracked leaves per second")
+    parser.add_argument("--latency", type=float, default=0.08, help="median API latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="log-normal latency sigma")
+    parser.add_argument("--rate-limit", type=float, default=0.01, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds per 429")
+    parser.add_argument("--backend", choices=("inline", "thread", "process"), default="thread")
+    parser.add_argument(
+        "--surge", type=int, default=50, help="pending challenges that switch to the grid"
+    )
+    parser.add_argument("-s", "--seed", type=int, default=None, help="seed for the scenarios")
+    parser.add_argument(
+        "--tracemalloc", action="store_true", help="trace Python allocations, slows the run"
+    )
+    parser.add_argument("-o", "--output", type=Path, default=None, help="JSON file to write")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the cog's warnings")
+    args: argparse.Namespace = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.ERROR)
+
+    results: Dict[str, Any] = asyncio.run(simulate(args))
+    throughput: Dict[str, float] = results["throughput"]
+    print(
+        f"{args.users} members in {results['elapsed_s']:.1f}s: "
+        f"{throughput['sessions_per_second']:.1f} sessions/s, "
+        f"{throughput['clicks_per_second']:.1f} clicks/s, "
+        f"{throughput['api_requests_per_second']:.1f} API requests/s",
+        file=sys.stderr,
+    )
+    for name, summary in [
+        *results["latency"].items(),
+        ("event_loop_lag", results["event_loop_lag"]),
+    ]:
+        if summary["count"]:
+            print(
+                f"{name:<18}{summary['count']:>8} p50 {summary['p50_ms']:8.2f} ms "
+                f"p99 {summary['p99_ms']:8.2f} ms max {summary['max_ms']:8.2f} ms",
+                file=sys.stderr,
+            )
+    print(f"peak RSS {results['memory']['peak_rss_kib']} KiB", file=sys.stderr)
+
+    report: str = json.dumps(results, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+
+
+if __name__ == "__main__":
+    main()
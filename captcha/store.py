@@ -0,0 +1,430 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, ClassVar, Deque, Dict, Final, List, Literal, Optional, Tuple, TypeAlias
+from urllib.parse import urlsplit
+
+log: logging.Logger = logging.getLogger("red.seina.captcha.store")
+
+StoreBackend: TypeAlias = Literal["memory", "sqlite", "redis"]
+Record: TypeAlias = Dict[str, Any]
+
+STORES: Final[Tuple[str, ...]] = ("memory", "sqlite", "redis")
+
+
+def _live(record: Optional[Record]) -> Optional[Record]:
+    if record is None or record["expires_at"] <= time.time():
+        return None
+    return record
+
+
+class ChallengeStore(ABC):
+    """
+    Active challenges keyed by user id, expiring after a TTL.
+
+    Reads go through a local cache of the challenges this process created or loaded.
+    `claim` always asks the backend, so a code is consumed by exactly one process.
+    The cache doesn't hear about claims made elsewhere, `refresh` asks the backend
+    before anything cached is shown again.
+    """
+
+    name: ClassVar[str]
+
+    def __init__(self) -> None:
+        self._cache: Dict[int, Record] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __str__(self) -> str:
+        return self.name
+
+    def peek(self, user_id: int) -> Optional[Record]:
+        """The locally cached challenge, without a round trip."""
+        record: Optional[Record] = _live(self._cache.get(user_id))
+        if record is None:
+            self._cache.pop(user_id, None)
+        return record
+
+    async def refresh(self, user_id: int) -> Optional[Record]:
+        """The challenge as the backend has it now, dropped from the cache if it's gone."""
+        cached: Optional[Record] = self._cache.get(user_id)
+        record: Optional[Record] = _live(await self._load(user_id))
+        # A challenge put while the backend was asked is newer than what it answered.
+        if self._cache.get(user_id) is not cached:
+            return self.peek(user_id)
+        if record is None:
+            self._cache.pop(user_id, None)
+        else:
+            self._cache[user_id] = record
+        return record
+
+    async def get(self, user_id: int) -> Optional[Record]:
+        record: Optional[Record] = _live(self._cache.get(user_id))
+        if record is None:
+            record: Optional[Record] = _live(await self._load(user_id))
+            if record is not None:
+                self._cache[user_id] = record
+        return record
+
+    async def put(self, user_id: int, record: Record, ttl: float) -> None:
+        record["expires_at"] = time.time() + ttl
+        self._cache[user_id] = record
+        await self._save(user_id, record, ttl)
+
+    async def claim(self, user_id: int) -> Optional[Record]:
+        """Remove and return the challenge, None if it expired or was claimed elsewhere."""
+        self._cache.pop(user_id, None)
+        return _live(await self._take(user_id))
+
+    async def due(self, before: float) -> List[int]:
+        """Users whose stored challenge expires by `before`, whichever process issued it."""
+        return [
+            user_id for user_id, record in self._cache.items() if record["expires_at"] <= before
+        ]
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+    @abstractmethod
+    async def _load(self, user_id: int) -> Optional[Record]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def _save(self, user_id: int, record: Record, ttl: float) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def _take(self, user_id: int) -> Optional[Record]:
+        raise NotImplementedError()
+
+
+class MemoryStore(ChallengeStore):
+    """Challenges live in this process only, the cache is the store."""
+
+    name: ClassVar[str] = "memory"
+
+    async def claim(self, user_id: int) -> Optional[Record]:
+        return _live(self._cache.pop(user_id, None))
+
+    async def refresh(self, user_id: int) -> Optional[Record]:
+        return self.peek(user_id)
+
+    async def _load(self, user_id: int) -> Optional[Record]:
+        return None
+
+    async def _save(self, user_id: int, record: Record, ttl: float) -> None:
+        pass
+
+    async def _take(self, user_id: int) -> Optional[Record]:
+        return None
+
+
+class SQLiteStore(ChallengeStore):
+    """
+    Challenges in a SQLite file, shared by every process on the host that opens it.
+
+    Queries run on one dedicated thread, so the event loop never waits on disk.
+    """
+
+    name: ClassVar[str] = "sqlite"
+    PURGE_EVERY: ClassVar[int] = 64
+
+    def __init__(self, path: Path) -> None:
+        super().__init__()
+        self.path: Path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._thread: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="captcha-store"
+        )
+        self._writes: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.path})"
+
+    async def _call(self, func: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._thread, func, *args)
+
+    def _connect(self) -> None:
+        db: sqlite3.Connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS challenges "
+            "(user_id INTEGER PRIMARY KEY, record TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS challenges_expiry ON challenges (expires_at)")
+        db.execute("DELETE FROM challenges WHERE expires_at <= ?", (time.time(),))
+        self._db = db
+
+    def _select(self, user_id: int) -> Optional[str]:
+        row: Optional[Tuple[str]] = self._db.execute(  # type: ignore
+            "SELECT record FROM challenges WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _upsert(self, user_id: int, record: str, expires_at: float) -> None:
+        self._db.execute(  # type: ignore
+            "INSERT OR REPLACE INTO challenges VALUES (?, ?, ?)", (user_id, record, expires_at)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._db.execute(  # type: ignore
+                "DELETE FROM challenges WHERE expires_at <= ?", (time.time(),)
+            )
+
+    def _delete(self, user_id: int) -> Optional[str]:
+        # BEGIN IMMEDIATE takes the write lock before reading, so two processes can't
+        # both read the row before one of them deletes it.
+        db: sqlite3.Connection = self._db  # type: ignore
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            record: Optional[str] = self._select(user_id)
+            if record is not None:
+                db.execute("DELETE FROM challenges WHERE user_id = ?", (user_id,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return record
+
+    async def open(self) -> None:
+        await self._call(self._connect)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._db is not None:
+            await self._call(self._db.close)
+            self._db = None
+        self._thread.shutdown(wait=False)
+
+    async def _load(self, user_id: int) -> Optional[Record]:
+        record: Optional[str] = await self._call(self._select, user_id)
+        return None if record is None else json.loads(record)
+
+    async def _save(self, user_id: int, record: Record, ttl: float) -> None:
+        await self._call(self._upsert, user_id, json.dumps(record), record["expires_at"])
+
+    def _select_due(self, before: float) -> List[int]:
+        rows: List[Tuple[int]] = self._db.execute(  # type: ignore
+            "SELECT user_id FROM challenges WHERE expires_at <= ?", (before,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    async def due(self, before: float) -> List[int]:
+        return await self._call(self._select_due, before)
+
+    async def _take(self, user_id: int) -> Optional[Record]:
+        record: Optional[str] = await self._call(self._delete, user_id)
+        return None if record is None else json.loads(record)
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+class RespConnection:
+    """A minimal pipelined client for the Redis serialization protocol."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader: asyncio.StreamReader = reader
+        self._writer: asyncio.StreamWriter = writer
+        # Replies arrive in the order commands were sent.
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._task: asyncio.Task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def connect(cls, url: str) -> "RespConnection":
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(
+            parts.hostname or "localhost", parts.port or 6379
+        )
+        connection: RespConnection = cls(reader, writer)
+        try:
+            if parts.password:
+                credentials: Tuple[str, ...] = (parts.username or "default", parts.password)
+                await connection.execute("AUTH", *credentials)
+            if parts.path.strip("/"):
+                await connection.execute("SELECT", parts.path.strip("/"))
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    @property
+    def closed(self) -> bool:
+        return self._task.done()
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts: list = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data: bytes = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def execute(self, *args: Any) -> Any:
+        if self.closed:
+            raise ConnectionError("The connection is closed.")
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await future
+
+    async def _read_reply(self) -> Any:
+        line: bytes = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("The server closed the connection.")
+        kind, value = line[:1], line[1:-2]
+        if kind == b"+":
+            return value.decode()
+        if kind == b"-":
+            return RespError(value.decode())
+        if kind == b":":
+            return int(value)
+        if kind == b"$":
+            if int(value) < 0:
+                return None
+            return (await self._reader.readexactly(int(value) + 2))[:-2]
+        if kind == b"*":
+            if int(value) < 0:
+                return None
+            return [await self._read_reply() for _ in range(int(value))]
+        raise ConnectionError(f"Unexpected reply {line!r}.")
+
+    async def _read_replies(self) -> None:
+        try:
+            while True:
+                reply: Any = await self._read_reply()
+                future: asyncio.Future = self._waiters.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RespError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except (ConnectionError, asyncio.IncompleteReadError) as error:
+            log.warning(f"Challenge store connection lost: {error}")
+        finally:
+            while self._waiters:
+                waiter: asyncio.Future = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(ConnectionError("The connection was closed."))
+
+    def close(self) -> None:
+        self._task.cancel()
+        self._writer.close()
+
+
+class RedisStore(ChallengeStore):
+    """
+    Challenges in Redis, or anything that speaks its protocol, shared by every process.
+
+    Keys expire on the server and claims use GETDEL, which needs Redis 6.2 or newer.
+    Expiry times are also kept in a sorted set, so any process can find the challenges
+    that are due without scanning keys.
+    """
+
+    name: ClassVar[str] = "redis"
+
+    def __init__(self, url: str, prefix: str = "captcha:challenge:") -> None:
+        super().__init__()
+        self.url: str = url
+        self.prefix: str = prefix
+        self.expiry_key: str = f"{prefix}expiry"
+        self._connection: Optional[RespConnection] = None
+        self._connecting: asyncio.Lock = asyncio.Lock()
+
+    def __str__(self) -> str:
+        parts = urlsplit(self.url)
+        return f"{self.name} ({parts.hostname or 'localhost'}:{parts.port or 6379})"
+
+    async def _execute(self, *args: Any) -> Any:
+        # A dropped connection is reopened by the next command.
+        if self._connection is None or self._connection.closed:
+            async with self._connecting:
+                if self._connection is None or self._connection.closed:
+                    self._connection = await RespConnection.connect(self.url)
+        return await self._connection.execute(*args)
+
+    async def open(self) -> None:
+        await self._execute("PING")
+
+    async def close(self) -> None:
+        await super().close()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def _load(self, user_id: int) -> Optional[Record]:
+        record: Optional[bytes] = await self._execute("GET", f"{self.prefix}{user_id}")
+        return None if record is None else json.loads(record)
+
+    async def _save(self, user_id: int, record: Record, ttl: float) -> None:
+        # Both commands go out in one write, replies come back in order.
+        await asyncio.gather(
+            self._execute(
+                "SET",
+                f"{self.prefix}{user_id}",
+                json.dumps(record),
+                "PX",
+                max(1, int(ttl * 1000)),
+            ),
+            self._execute("ZADD", self.expiry_key, record["expires_at"], user_id),
+        )
+
+    async def _take(self, user_id: int) -> Optional[Record]:
+        record, _ = await asyncio.gather(
+            self._execute("GETDEL", f"{self.prefix}{user_id}"),
+            self._execute("ZREM", self.expiry_key, user_id),
+        )
+        return None if record is None else json.loads(record)
+
+    async def due(self, before: float) -> List[int]:
+        members: List[bytes] = await self._execute(
+            "ZRANGEBYSCORE", self.expiry_key, "-inf", before
+        )
+        return [int(member) for member in members]
+
+
+def create_store(backend: StoreBackend, url: Optional[str], data_path: Path) -> ChallengeStore:
+    """Build a store, `url` is a file path for sqlite and a redis:// URL for redis."""
+    if backend == "sqlite":
+        return SQLiteStore(Path(url) if url else data_path / "challenges.sqlite3")
+    if backend == "redis":
+        return RedisStore(url or "redis://localhost:6379/0")
+    return MemoryStore()
@@ -0,0 +1,170 @@
+"""
+MIT License
+
+Copyright (c) 2023-present japandotorg
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import random
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from PIL.Image import Image, fromarray
+from PIL.ImageDraw import Draw
+from PIL.ImageFont import FreeTypeFont
+
+from .objects import CaptchaObj, ColorTuple, random_color
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+# Coarse mesh the text strip is warped with, upsampled to one offset per pixel.
+MESH_SIZE: Tuple[int, int] = (3, 6)
+
+
+def _interpolation(points: int, size: int) -> "NDArray[Any]":
+    """Matrix that linearly upsamples `points` mesh values to `size` pixels."""
+    position: "NDArray[Any]" = np.linspace(0, points - 1, size, dtype=np.float32)
+    lower: "NDArray[Any]" = position.astype(np.intp)
+    upper: "NDArray[Any]" = np.minimum(lower + 1, points - 1)
+    weights: "NDArray[Any]" = np.zeros((size, points), dtype=np.float32)
+    weights[np.arange(size), lower] += 1 - (position - lower)
+    weights[np.arange(size), upper] += position - lower
+    return weights
+
+
+class VectorCaptchaObj(CaptchaObj):
+    """
+    `CaptchaObj` with a NumPy render stage.
+
+    The text is drawn once, unrotated, into a single strip that is distorted by one
+    mesh warp. Noise dots, the noise arc and the SMOOTH kernel are applied to the
+    whole image as array operations, and the result is converted back to PIL once.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        if np is None:
+            raise RuntimeError("The numpy render stage needs numpy to be installed.")
+        super().__init__(*args, **kwargs)
+        # Pixel grid and mesh interpolation weights only depend on the canvas size.
+        rows, columns = MESH_SIZE
+        self._rows: "NDArray[Any]" = _interpolation(rows, self._height)
+        self._columns: "NDArray[Any]" = _interpolation(columns, self._width).T
+        yy, xx = np.mgrid[0 : self._height, 0 : self._width]
+        self._yy: "NDArray[Any]" = yy.astype(np.float32)
+        self._xx: "NDArray[Any]" = xx.astype(np.float32)
+
+    @property
+    def generator(self) -> "np.random.Generator":
+        """This thread's NumPy generator, seeded from its `random` stream."""
+        generator: "Optional[np.random.Generator]" = getattr(self._local, "generator", None)
+        if generator is None:
+            generator = np.random.default_rng(self.random.getrandbits(64))
+            self._local.generator = generator
+        return generator
+
+    def _draw_strip(self, chars: str) -> Image:
+        rng: random.Random = self.random
+        fonts: List[FreeTypeFont] = self.truefonts
+        pieces: List[Tuple[str, FreeTypeFont]] = []
+        for char in chars:
+            if rng.random() > 0.5:
+                pieces.append((" ", rng.choice(fonts)))
+            pieces.append((char, rng.choice(fonts)))
+
+        widths: List[float] = [font.getlength(char) for char, font in pieces]
+        strip: Image = self._canvas("L", (max(int(sum(widths)) + 8, self._width), self._height), 0)
+        draw = Draw(strip)
+        offset: float = 4.0
+        for (char, font), width in zip(pieces, widths):
+            _, top, _, bottom = font.getbbox(char)
+            y: int = int((self._height - (bottom + top)) / 2)
+            y += rng.randint(-int(0.1 * self._height), int(0.1 * self._height))
+            draw.text((offset, y), char, font=font, fill=255)
+            offset += width * rng.uniform(0.75, 0.95)
+        if strip.width > self._width:
+            strip: Image = strip.resize((self._width, self._height))
+        return strip
+
+    def _warp(self, mask: "NDArray[Any]") -> "NDArray[Any]":
+        h, w = mask.shape
+        mesh: "NDArray[Any]" = self.generator.uniform(-1, 1, (2, *MESH_SIZE)).astype(np.float32)
+        dx: "NDArray[Any]" = self._rows @ (mesh[0] * (0.04 * w)) @ self._columns
+        dy: "NDArray[Any]" = self._rows @ (mesh[1] * (0.15 * h)) @ self._columns
+        x: "NDArray[Any]" = np.clip(self._xx + dx + 0.5, 0, w - 1).astype(np.intp)
+        y: "NDArray[Any]" = np.clip(self._yy + dy + 0.5, 0, h - 1).astype(np.intp)
+        return mask.ravel().take(y * w + x)
+
+    def _noise(self, number: int) -> "NDArray[Any]":
+        rng: random.Random = self.random
+        h, w = self._height, self._width
+        noise: "NDArray[Any]" = np.zeros((h + 3, w + 3), dtype=bool)
+
+        x1: int = rng.randint(0, int(w / 5))
+        x2: int = rng.randint(w - int(w / 5), w)
+        y1: int = rng.randint(int(h / 5), h - int(h / 5))
+        y2: int = rng.randint(y1, h - int(h / 5))
+        angles: "NDArray[Any]" = np.linspace(
+            np.radians(rng.randint(0, 20)), np.radians(rng.randint(160, 200)), 2 * (w + h)
+        )
+        arc_x: "NDArray[Any]" = ((x1 + x2) / 2 + (x2 - x1) / 2 * np.cos(angles)).astype(np.intp)
+        arc_y: "NDArray[Any]" = ((y1 + y2) / 2 + (y2 - y1) / 2 * np.sin(angles)).astype(np.intp)
+        noise[np.clip(arc_y, 0, h - 1) + 2, np.clip(arc_x, 0, w - 1) + 2] = True
+
+        # Dots get the footprint of a 3px wide line from (x, y) to (x - 1, y - 1).
+        dots: "NDArray[Any]" = np.zeros_like(noise)
+        generator: "np.random.Generator" = self.generator
+        dots[generator.integers(0, h, number) + 2, generator.integers(0, w, number) + 2] = True
+        dots[:-1] |= dots[1:]
+        dots[:-2] |= dots[2:]
+        dots[:, :-1] |= dots[:, 1:]
+        dots[:, :-2] |= dots[:, 2:]
+        return (noise | dots)[2 : h + 2, 2 : w + 2]
+
+    @staticmethod
+    def _smooth(pixels: "NDArray[Any]") -> "NDArray[Any]":
+        # PIL's SMOOTH kernel: a 3x3 box with a centre weight of 5, divided by 13 and rounded.
+        # Sums are taken in uint16, 13 * 255 doesn't fit the image's uint8.
+        wide: "NDArray[Any]" = pixels.astype(np.uint16)
+        rows: "NDArray[Any]" = wide[:-2] + wide[1:-1] + wide[2:]
+        box: "NDArray[Any]" = rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+        # Like PIL, the outermost pixels are left as they are.
+        smoothed: "NDArray[Any]" = pixels.copy()
+        smoothed[1:-1, 1:-1] = (box + wide[1:-1, 1:-1] * 4 + 6) // 13
+        return smoothed
+
+    def _generate(self, chars: str) -> Image:
+        rng: random.Random = self.random
+        background: ColorTuple = random_color(238, 255, rng=rng)
+        color: ColorTuple = random_color(10, 200, rng.randint(220, 255), rng=rng)
+
+        mask: "NDArray[Any]" = self._warp(np.asarray(self._draw_strip(chars), dtype=np.float32))
+        level: int = self.lookup_table[int(0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2])]
+        alpha: "NDArray[Any]" = np.minimum(mask * 4, 255) * (min(level, 255) / 65025)
+
+        ink: "NDArray[Any]" = np.asarray(color[:3], dtype=np.float32)
+        paper: "NDArray[Any]" = np.asarray(background, dtype=np.float32)
+        pixels: "NDArray[Any]" = (paper + alpha[..., None] * (ink - paper)).astype(np.uint8)
+        pixels[self._noise(self._noise_dots)] = color[:3]
+        return fromarray(self._smooth(pixels) if self._smoothing else pixels, "RGB")
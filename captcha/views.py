@@ -1,8 +1,14 @@
-from typing import Any
+import asyncio
+import time
+from io import BytesIO
+from typing import Any, List
 
 import discord
 
 from .format import format_message
+from .settings import GuildSettings
+
+EXPIRED = "❌ This captcha session has expired. Please start a new verification."
 
 
 class CaptchaModal(discord.ui.Modal, title="Captcha Verification"):
@@ -22,11 +28,19 @@ class CaptchaModal(discord.ui.Modal, title="Captcha Verification"):
 
     async def on_submit(self, interaction: discord.Interaction):
         entered_code = self.code_input.value.strip().upper()
-        self.cog.cleanup_captcha_image(self.user_id)
-        if entered_code == self.expected_code:
-            await self.cog._on_captcha_success(interaction.user, interaction)
-        else:
-            await self.cog._on_captcha_failure(interaction.user, interaction)
+        if entered_code != self.expected_code:
+            return await self.cog._on_captcha_failure(
+                interaction.user, interaction, interaction.guild.id
+            )
+        # Only whoever claims the challenge may pass it, this modal may outlive it.
+        challenge = await self.cog.pop_active_challenge(self.user_id)
+        if challenge is None:
+            return await interaction.response.send_message(EXPIRED, ephemeral=True)
+        if challenge["code"] != entered_code:
+            return await self.cog._on_captcha_failure(
+                interaction.user, interaction, interaction.guild.id
+            )
+        await self.cog._on_captcha_success(interaction.user, interaction, challenge)
 
 
 class CaptchaSubmitView(discord.ui.View):
@@ -50,6 +64,71 @@ class CaptchaSubmitView(discord.ui.View):
         )
 
 
+class CaptchaGridButton(discord.ui.Button["CaptchaGridView"]):
+    def __init__(self, symbol: str, row: int):
+        super().__init__(emoji=symbol, style=discord.ButtonStyle.secondary, row=row)
+        self.symbol = symbol
+
+    async def callback(self, interaction: discord.Interaction):
+        await self.view.press(interaction, self)  # type: ignore
+
+
+class CaptchaGridView(discord.ui.View):
+    """Image-free challenge: press the grid's symbols in the order given by `sequence`."""
+
+    def __init__(
+        self, cog: Any, user_id: int, symbols: List[str], sequence: List[str], timeout: int
+    ):
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.user_id = user_id
+        self.sequence = sequence
+        self.progress = 0
+        for index, symbol in enumerate(symbols):
+            self.add_item(CaptchaGridButton(symbol, row=index // 4))
+
+    def finish(self):
+        for item in self.children:
+            item.disabled = True  # type: ignore
+        self.stop()
+
+    async def press(self, interaction: discord.Interaction, button: CaptchaGridButton):
+        if interaction.user.id != self.user_id:
+            return await interaction.response.send_message(
+                "This captcha isn't for you.", ephemeral=True
+            )
+        if self.cog.challenges.peek(self.user_id) is None:
+            self.finish()
+            return await interaction.response.edit_message(content=EXPIRED, view=self)
+
+        if button.symbol != self.sequence[self.progress]:
+            self.finish()
+            button.style = discord.ButtonStyle.danger
+            await interaction.response.edit_message(view=self)
+            await self.cog.pop_active_challenge(self.user_id)
+            return await self.cog._on_captcha_failure(
+                interaction.user, interaction, interaction.guild.id
+            )
+
+        self.progress += 1
+        button.disabled = True
+        button.style = discord.ButtonStyle.success
+        if self.progress < len(self.sequence):
+            return await interaction.response.edit_message(view=self)
+
+        self.finish()
+        await interaction.response.edit_message(view=self)
+        challenge = await self.cog.pop_active_challenge(self.user_id)
+        if challenge is None:
+            return await interaction.followup.send(EXPIRED, ephemeral=True)
+        if challenge["code"] != " ".join(self.sequence).upper():
+            # A newer challenge replaced this grid's, pressing the old grid doesn't pass it.
+            return await self.cog._on_captcha_failure(
+                interaction.user, interaction, interaction.guild.id
+            )
+        await self.cog._on_captcha_success(interaction.user, interaction, challenge)
+
+
 class CaptchaVerifyButton(discord.ui.View):
     def __init__(self, cog: Any):
         super().__init__(timeout=None)
@@ -63,41 +142,117 @@ class CaptchaVerifyButton(discord.ui.View):
 
         if member.bot:
             return
-
-        guild_config = await self.cog.config.guild(interaction.guild).all()
-        if not guild_config["channel"]:
+        start = time.perf_counter()
+        if not self.cog.allow_verify(member.id, interaction.guild.id):
             return await interaction.response.send_message(
+                "⏳ Too many verification attempts, please wait a moment and try again.",
+                ephemeral=True,
+            )
+        # Acknowledged before any store, render or DM work, which can outlast the 3 second
+        # interaction deadline under load. Everything below answers through the followup.
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        settings = await self.cog.guild_settings.get(interaction.guild.id)
+        if not settings.channel:
+            return await interaction.followup.send(
                 "Verification channel not configured.", ephemeral=True
             )
 
-        code = self.cog.generate_captcha_code()
-        timeout = await self.cog.config.guild(interaction.guild).timeout()
-        self.cog.register_active_challenge(member.id, code, interaction.guild.id, timeout)
-        image_fp = self.cog.save_captcha_image(code, member.id)
+        # Another process may have claimed the cached challenge, nothing stale is resent.
+        pending = await self.cog.challenges.refresh(member.id)
 
+        # One challenge at a time per member, reusing one from another guild would verify
+        # them in the wrong place and replacing it would void what they were sent.
+        pending_guild = self.cog.pending_guild(member.id)
+        if pending_guild is not None and pending_guild != interaction.guild.id:
+            guild = self.cog.bot.get_guild(pending_guild)
+            where = guild.name if guild else "another server"
+            return await interaction.followup.send(
+                f"⏳ Please finish your pending captcha in {where} first.", ephemeral=True
+            )
+
+        # Repeat clicks keep the pending challenge's mode, so a surge switching new ones to
+        # the grid doesn't replace an image that was already sent.
+        mode = pending["mode"] if pending is not None else self.cog.challenge_mode(settings)
+        if mode == "grid":
+            await self.send_grid(interaction, settings)
+            self.record_response(time.perf_counter() - start)
+            return
+
+        # Clicking again while a captcha is pending sends the same image, nothing is rendered.
+        issued = self.cog.issued_image(member.id, interaction.guild.id)
+        if issued is not None:
+            self.cog.metrics.resent += 1
+        else:
+            try:
+                issued = await self.cog.issue_image(member.id, interaction.guild.id, settings)
+            except asyncio.TimeoutError:
+                return await interaction.followup.send(
+                    "⏳ Verification is busy right now, please try again in a moment.",
+                    ephemeral=True,
+                )
+        code, image, filename = issued
+
+        # Both the DM and the ephemeral fallback read from this buffer, nothing touches disk.
+        buffer = BytesIO(image)
         try:
             dm = await member.create_dm()
-            message_before = await self.cog.config.guild(
-                interaction.guild
-            ).message_before_captcha()
-            text = format_message(message_before, member)
-            msg = await dm.send(
-                content=text,
-                file=discord.File(image_fp),
+            text = format_message(settings.message_before_captcha, member)
+            sent = time.perf_counter()
+            msg = await self.cog.send_to(
+                dm, content=text, file=discord.File(buffer, filename=filename)
             )
-            self.cog._captchas[member.id] = msg
-            self.cog._user_tries.setdefault(member.id, []).append(msg)
-            await interaction.response.send_message(
+            self.cog.metrics.dm_send.observe(time.perf_counter() - sent)
+            self.cog.track_message(member.id, msg)
+            self.cog.route_dm_answers(member.id, dm.id)
+            await interaction.followup.send(
                 "📩 I've sent you a DM with your captcha. Please reply there.",
                 ephemeral=True,
             )
         except discord.Forbidden:
-            await interaction.response.send_message(
+            buffer.seek(0)
+            await interaction.followup.send(
                 content=(
                     "⚠️ I couldn't DM you — likely due to disabled DMs.\n"
                     "Solve the captcha below and click the button to submit."
                 ),
-                file=discord.File(image_fp),  # NEW instance
+                file=discord.File(buffer, filename=filename),
                 ephemeral=True,
                 view=CaptchaSubmitView(self.cog, member.id, code),
             )
+        self.record_response(time.perf_counter() - start)
+
+    def record_response(self, seconds: float):
+        self.cog.shedder.response.record(seconds)
+        self.cog.metrics.response.observe(seconds)
+
+    async def send_grid(self, interaction: discord.Interaction, settings: GuildSettings):
+        member = interaction.user
+        timeout = settings.timeout
+        # Clicking again while a grid is pending shows the same grid, like images are resent.
+        # Replacing it would leave the grids that are still on screen unsolvable.
+        pending = self.cog.challenges.peek(member.id)
+        if (
+            pending is not None
+            and pending["mode"] == "grid"
+            and pending["guild_id"] == interaction.guild.id
+            and "symbols" in pending
+        ):
+            self.cog.metrics.resent += 1
+            symbols, sequence = pending["symbols"], pending["code"].split(" ")
+        else:
+            symbols, sequence = self.cog.generate_grid_challenge()
+            await self.cog.register_active_challenge(
+                member.id,
+                " ".join(sequence),
+                interaction.guild.id,
+                timeout,
+                mode="grid",
+                symbols=symbols,
+            )
+        text = format_message(settings.message_before_captcha, member)
+        await interaction.followup.send(
+            content=f"{text}\nPress {' → '.join(sequence)} in that order.",
+            ephemeral=True,
+            view=CaptchaGridView(self.cog, member.id, symbols, sequence, timeout),
+        )
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from captcha.store import ChallengeStore, RedisStore, SQLiteStore, create_store
+
+
+class FakeRedis:
+    """
+    Single-threaded RESP server with the commands `RedisStore` sends.
+
+    Every command runs to completion before the next one is read, like Redis itself,
+    so GETDEL is atomic here while a GET followed by a DEL would not be.
+    """
+
+    def __init__(self) -> None:
+        self.keys: Dict[bytes, Tuple[bytes, float]] = {}
+        self.zsets: Dict[bytes, Dict[bytes, float]] = {}
+        self.commands: List[str] = []
+
+    async def start(self) -> str:
+        self.server: asyncio.AbstractServer = await asyncio.start_server(
+            self.handle, "127.0.0.1", 0
+        )
+        return f"redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while line := await reader.readline():
+            args: List[bytes] = []
+            for _ in range(int(line[1:-2])):
+                size: int = int((await reader.readline())[1:-2])
+                args.append((await reader.readexactly(size + 2))[:-2])
+            writer.write(self.execute(args[0].decode().upper(), args[1:]))
+            await writer.drain()
+
+    def execute(self, command: str, args: List[bytes]) -> bytes:
+        self.commands.append(command)
+        now: float = time.time()
+        for key, (_, expires_at) in list(self.keys.items()):
+            if expires_at <= now:
+                del self.keys[key]
+        if command in ("PING", "SELECT"):
+            return b"+OK\r\n"
+        if command == "SET":
+            self.keys[args[0]] = (args[1], now + int(args[3]) / 1000)
+            return b"+OK\r\n"
+        if command in ("GET", "GETDEL"):
+            entry = self.keys.get(args[0]) if command == "GET" else self.keys.pop(args[0], None)
+            return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+        if command == "ZADD":
+            self.zsets.setdefault(args[0], {})[args[2]] = float(args[1])
+            return b":1\r\n"
+        if command == "ZREM":
+            return b":%d\r\n" % (self.zsets.get(args[0], {}).pop(args[1], None) is not None)
+        if command == "ZRANGEBYSCORE":
+            top: float = float(args[2])
+            members = [m for m, score in self.zsets.get(args[0], {}).items() if score <= top]
+            return b"*%d\r\n" % len(members) + b"".join(
+                b"$%d\r\n%s\r\n" % (len(member), member) for member in members
+            )
+        return b"-ERR unknown command\r\n"
+
+
+def record(code: str = "ABCDEF") -> Dict[str, Any]:
+    return {"code": code, "guild_id": 1, "mode": "image"}
+
+
+async def claim_once(stores: List[ChallengeStore]) -> None:
+    await stores[0].put(42, record(), 5)
+    claims = await asyncio.gather(*(stores[i % len(stores)].claim(42) for i in range(20)))
+    assert sum(claim is not None for claim in claims) == 1
+
+
+def test_redis_claims_are_atomic_across_processes():
+    async def run() -> None:
+        server: FakeRedis = FakeRedis()
+        url: str = await server.start()
+        stores: List[ChallengeStore] = [RedisStore(url), RedisStore(url)]
+        for store in stores:
+            await store.open()
+        try:
+            await claim_once(stores)
+            assert "GETDEL" in server.commands and "GET" not in server.commands
+        finally:
+            for store in stores:
+                await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_shares_and_expires_challenges():
+    async def run() -> None:
+        server: FakeRedis = FakeRedis()
+        url: str = await server.start()
+        issuer, other = RedisStore(url), RedisStore(url)
+        await issuer.open()
+        await other.open()
+        try:
+            await issuer.put(7, record("QWERTY"), 0.2)
+            assert other.peek(7) is None
+            assert (await other.get(7))["code"] == "QWERTY"
+            assert await other.due(time.time()) == []
+            assert await other.due(time.time() + 1) == [7]
+            await asyncio.sleep(0.3)
+            assert await other.claim(7) is None
+            assert await issuer.due(time.time() + 1) == []
+        finally:
+            await issuer.close()
+            await other.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_claims_are_atomic_across_processes(tmp_path: Path):
+    async def run() -> None:
+        stores: List[ChallengeStore] = [
+            SQLiteStore(tmp_path / "challenges.sqlite3") for _ in range(2)
+        ]
+        for store in stores:
+            await store.open()
+        try:
+            await claim_once(stores)
+            await stores[0].put(9, record(), 5)
+            assert await stores[1].due(time.time() + 10) == [9]
+        finally:
+            for store in stores:
+                await store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_refresh_drops_challenges_claimed_elsewhere(tmp_path: Path):
+    async def run() -> None:
+        issuer, other = (SQLiteStore(tmp_path / "challenges.sqlite3") for _ in range(2))
+        await issuer.open()
+        await other.open()
+        try:
+            await issuer.put(1, record(), 5)
+            assert await other.claim(1) is not None
+            # The issuer's cache can't know, until it asks.
+            assert issuer.peek(1) is not None
+            assert await issuer.refresh(1) is None
+            assert issuer.peek(1) is None
+            await issuer.put(2, record("QWERTY"), 5)
+            assert (await other.refresh(2))["code"] == "QWERTY"
+        finally:
+            await issuer.close()
+            await other.close()
+
+    asyncio.run(run())
+
+
+def test_peek_skips_expired_challenges(tmp_path: Path):
+    async def run() -> None:
+        store: ChallengeStore = create_store("memory", None, tmp_path)
+        await store.put(1, record(), 0.05)
+        assert store.peek(1) is not None
+        await asyncio.sleep(0.1)
+        assert store.peek(1) is None and await store.refresh(1) is None
+
+    asyncio.run(run())
+
+
+def test_memory_store_claims_once(tmp_path: Path):
+    async def run() -> None:
+        store: ChallengeStore = create_store("memory", None, tmp_path)
+        await claim_once([store])
+
+    asyncio.run(run())
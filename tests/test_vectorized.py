@@ -0,0 +1,17 @@
+import pytest
+from PIL import Image, ImageFilter
+
+from captcha.vectorized import VectorCaptchaObj
+
+np = pytest.importorskip("numpy")
+
+
+def test_smooth_keeps_uniform_images():
+    pixels = np.full((20, 30, 3), 250, dtype=np.uint8)
+    assert (VectorCaptchaObj._smooth(pixels) == pixels).all()
+
+
+def test_smooth_matches_pil():
+    pixels = np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    expected = np.asarray(Image.fromarray(pixels, "RGB").filter(ImageFilter.SMOOTH))
+    assert (VectorCaptchaObj._smooth(pixels) == expected).all()